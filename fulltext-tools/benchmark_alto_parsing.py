@@ -0,0 +1,121 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# compares the former ElementTree-based text extraction of fulltext_analysis.parseALTO() with the current streaming one
+# on the largest ALTO files found below altoBasePath (run time and peak memory usage per file)
+# usage: python benchmark_alto_parsing.py [path to ALTO files]
+
+import sys
+import os
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import fulltext_analysis
+
+# path under which ALTO files are searched recursively, defaults to the sbbget download directory
+altoBasePath = fulltext_analysis.sbbGetBasePath
+# number of files to benchmark (the largest ones are taken)
+numberOfFiles = 10
+# each measurement is repeated and the fastest run is reported
+repetitions = 5
+
+
+def parseALTOLegacy(docPath):
+    """
+    The former implementation of parseALTO() building the complete tree of the ALTO file.
+    """
+    rawText = ""
+    try:
+        tree = ET.parse(docPath)
+        root = tree.getroot()
+        xmlns = root.tag.split('}')[0].strip('{')
+    except ET.ParseError:
+        return (None, fulltext_analysis.PARSING_ERROR)
+    if root.tag.endswith("alto"):
+        for lines in tree.iterfind('.//{%s}TextLine' % xmlns):
+            rawText += "\n"
+            for line in lines.findall('{%s}String' % xmlns):
+                text = line.attrib.get('CONTENT', '') + ' '
+                rawText += text
+        if rawText:
+            return (rawText, fulltext_analysis.NO_ERROR)
+        else:
+            return (None, fulltext_analysis.EMPTY_TEXT)
+    else:
+        return (None, fulltext_analysis.NO_ALTO)
+
+
+def findLargestALTOFiles(basePath, n):
+    """
+    :param basePath: the directory to search in
+    :param n: the number of files to return
+    :return: a list of the paths to the n largest XML files below basePath
+    """
+    candidates = []
+    for root, dirs, files in os.walk(basePath):
+        for f in files:
+            if f.lower().endswith(".xml"):
+                path = os.path.join(root, f)
+                candidates.append((os.path.getsize(path), path))
+    candidates.sort(reverse=True)
+    return [path for size, path in candidates[:n]]
+
+
+def measure(parseFunction, docPath):
+    """
+    :param parseFunction: the function to benchmark
+    :param docPath: the ALTO file
+    :return: a (result, fastest run time in seconds, peak memory usage in bytes) tuple
+    """
+    fastest = None
+    for i in range(repetitions):
+        start = time.perf_counter()
+        result = parseFunction(docPath)
+        duration = time.perf_counter() - start
+        if fastest is None or duration < fastest:
+            fastest = duration
+    # memory is measured in a separate run as tracing slows down the parser
+    tracemalloc.start()
+    parseFunction(docPath)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (result, fastest, peak)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        altoBasePath = sys.argv[1]
+
+    fulltext_analysis.printLog("Searching the %i largest ALTO files in %s" % (numberOfFiles, altoBasePath))
+    paths = findLargestALTOFiles(altoBasePath, numberOfFiles)
+    if not paths:
+        fulltext_analysis.printLog("No ALTO files found.")
+        sys.exit(1)
+
+    print("file\tsize (KB)\tlegacy (ms)\tstreaming (ms)\tspeedup\tlegacy peak (KB)\tstreaming peak (KB)\tidentical")
+    totalLegacy = 0.0
+    totalStreaming = 0.0
+    for path in paths:
+        legacyResult, legacyTime, legacyPeak = measure(parseALTOLegacy, path)
+        streamingResult, streamingTime, streamingPeak = measure(fulltext_analysis.parseALTO, path)
+        totalLegacy += legacyTime
+        totalStreaming += streamingTime
+        print("%s\t%i\t%.1f\t%.1f\t%.2f\t%i\t%i\t%s" % (path, os.path.getsize(path) / 1024, legacyTime * 1000,
+                                                      streamingTime * 1000, legacyTime / streamingTime,
+                                                      legacyPeak / 1024, streamingPeak / 1024,
+                                                      legacyResult == streamingResult))
+
+    fulltext_analysis.printLog("Total: legacy %.1f ms, streaming %.1f ms (speedup %.2f)" % (
+        totalLegacy * 1000, totalStreaming * 1000, totalLegacy / totalStreaming))
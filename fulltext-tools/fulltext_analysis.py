@@ -16,10 +16,10 @@ import sys
 import os
 from datetime import datetime
 import xml.etree.ElementTree as ET
-import pandas as pd
-import urllib.request
 from urllib.parse import urlparse
 import zipfile
+import hashlib
+import sqlite3
 from time import sleep
 import jsonpickle
 
@@ -29,6 +29,12 @@ from flair.data import Sentence
 from flair.models import SequenceTagger
 import torch
 
+# the shared HTTP layer (stabiFetch) and the analysis tables (analysisTable) are located in sbbget
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sbbget"))
+import stabiFetch
+import analysisTable
+import lexicon
+
 # enables verbose output during processing
 verbose = True
 # path to the sbbget temporary result files, e.g. "../sbbget/sbbget_downloads/download_temp" (the base path under which ALTO files are stored)
@@ -36,12 +42,18 @@ sbbGetBasePath="../sbbget/sbbget_downloads/download_temp/"
 #sbbGetBasePath="../sbbget/sbbget_downloads.div_spielebuecher/download_temp/"
 # Berlin State Library internal setting
 runningFromWithinStabi = False
+# failed downloads are retried up to maxRetries times with an exponential backoff of retryBackoffFactor * 2^(retry-1) seconds
+maxRetries = 5
+retryBackoffFactor = 0.5
+# maximum number of requests per second (0 disables the limit)
+maxRequestsPerSecond = 0
 # analysis path prefix
 #analysisPrefix = "analysis/"
-# if set to onlineMode, the tool will not try to use local files, instead it will check for an Excel file stored at
-# oaiAnalyzerResultFile (created by oai-analyzer.py) and download ALTO files
+# if set to onlineMode, the tool will not try to use local files, instead it will check for the METS/MODS analysis table
+# stored at oaiAnalyzerResultFile (created by oai-analyzer.py) and download ALTO files
+# the format is derived from the file extension (.parquet, .feather, .db, .csv, or .xlsx)
 onlineMode=False
-oaiAnalyzerResultFile="../_datasets/analyticaldf.xlsx"
+oaiAnalyzerResultFile="../_datasets/analyticaldf.parquet"
 # True if downloaded ALTO documents have to be kept after processing
 keepALTO=False
 # temporary downloads prefix
@@ -56,6 +68,25 @@ useFlairNLP=True
 # ner-multi English, German, Dutch and Spanish
 # de-ner German
 flairModel="de-ner"
+# pages are split into sentences with NLTK's punkt model for this language before NER
+punktLanguage="german"
+# number of sentences passed to the flair model at once
+nerMiniBatchSize=32
+# sentences are collected over pages (and PPNs) until this number is reached and tagged together
+nerFlushThreshold=2048
+# longer sentences (in characters), e.g., OCR'ed tables without punctuation, are split at blanks
+nerMaxSentenceLength=1000
+
+# if True, stopwords and unclean words (see lexicon.CLEAN_WORD_PATTERN) are not counted in the statistics files
+filterStatisticTokens=False
+# languages of the stopword lists used if filterStatisticTokens is True (see lexicon.stopwordFiles)
+stopwordLanguages=["german"]
+
+# if True, the offline mode only processes new or changed ALTO files (and the PPNs they belong to), all processed files
+# are registered with their size, modification time, SHA-1 hash, and the used NER model in a manifest
+incrementalProcessing=True
+# file name of the manifest (stored under sbbGetBasePath)
+manifestFileName="fulltext_manifest.db"
 
 # error log file name
 errorLogFileName = "fulltext_statistics_error.log"
@@ -65,7 +96,14 @@ PARSING_ERROR=1
 EMPTY_TEXT=2
 NO_ALTO=3
 NO_ERROR=-1
+# ALTO files are fed to the parser in chunks of this size (in bytes)
+ALTO_CHUNK_SIZE=64*1024
+# suffixes of the files created next to an ALTO file (replacing ".xml")
+DERIVED_FILE_SUFFIXES=["_raw.txt","_stats.txt","_ner.txt","_ner_details.txt","_ner_details.json"]
 
+# HTTP session reused for all downloads
+httpSession = stabiFetch.createSession(maxRetries=maxRetries, backoffFactor=retryBackoffFactor, runningFromWithinStabi=runningFromWithinStabi)
+rateLimiter = stabiFetch.RateLimiter(maxRequestsPerSecond)
 
 def errorCodeAsText(errorCode):
     if errorCode==PARSING_ERROR:
@@ -106,49 +144,85 @@ def downloadALTO(ppn,url):
     # 2) download
 
     altoPath = tempDownloadPrefix + fileName
-    if runningFromWithinStabi:
-        proxy = urllib.request.ProxyHandler({})
-        opener = urllib.request.build_opener(proxy)
-        urllib.request.install_opener(opener)
+    return stabiFetch.downloadFile(httpSession, url, altoPath, rateLimiter)
 
-    urllib.request.urlretrieve(url, altoPath)
-    return altoPath
+class ALTOTextTarget(object):
+    """
+    Parser target collecting the text of an ALTO file while it is parsed, i.e., every TextLine starts with a line break
+    followed by the CONTENT of its String elements separated by blanks. No element tree is built, hence, memory usage
+    does not depend on the size of the page.
+    """
+    def __init__(self):
+        self.tokens = []
+        self.rootTag = None
+        self.textLineTag = None
+        self.stringTag = None
+
+    def start(self, tag, attrib):
+        if self.rootTag is None:
+            # the namespace (alto-1/2/3) is taken from the root element
+            self.rootTag = tag
+            xmlns = tag.split('}')[0].strip('{')
+            self.textLineTag = '{%s}TextLine' % xmlns
+            self.stringTag = '{%s}String' % xmlns
+        elif tag == self.stringTag:
+            self.tokens.append(attrib.get('CONTENT', ''))
+            self.tokens.append(' ')
+        elif tag == self.textLineTag:
+            self.tokens.append("\n")
+
+    def close(self):
+        return "".join(self.tokens)
 
 def parseALTO(docPath):
+    """
+    Extracts the raw text of an ALTO file. The file is streamed through the parser in chunks and the text is collected
+    as a list of tokens which is joined once at the end (see ALTOTextTarget).
+    :param docPath: path to the ALTO file
+    :return: a (text, error code) tuple, the text is None in case of an error
+    """
     # parse the ALTO candidate file
     # text conversion is based on https://github.com/cneud/alto-ocr-text/blob/master/alto_ocr_text.py
+    # supported namespaces
     namespace = {'alto-1': 'http://schema.ccs-gmbh.com/ALTO',
                  'alto-2': 'http://www.loc.gov/standards/alto/ns-v2#',
                  'alto-3': 'http://www.loc.gov/standards/alto/ns-v3#'}
-    rawText=""
+    target = ALTOTextTarget()
+    parser = ET.XMLParser(target=target)
     try:
-        tree = ET.parse(docPath)
-        root = tree.getroot()
-        xmlns = root.tag.split('}')[0].strip('{')
+        with open(docPath, "rb") as f:
+            while True:
+                chunk = f.read(ALTO_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                if target.rootTag is not None and not target.rootTag.endswith("alto"):
+                    return (None,NO_ALTO)
+        rawText = parser.close()
     except ET.ParseError:
         #printLog("\t\tParse error @ "+docPath)
         return (None,PARSING_ERROR)
-    if root.tag.endswith("alto"):
-        for lines in tree.iterfind('.//{%s}TextLine' % xmlns):
-            rawText+="\n"
-            for line in lines.findall('{%s}String' % xmlns):
-                text = line.attrib.get('CONTENT') + ' '
-                rawText +=text
-        #printLog("\t\t>%s< (%s)"%(rawText,docPath))
-        if rawText:
-            return (rawText,NO_ERROR)
-        else:
-            return (None,EMPTY_TEXT)
+    #printLog("\t\t>%s< (%s)"%(rawText,docPath))
+    if rawText:
+        return (rawText,NO_ERROR)
     else:
-        return (None,NO_ALTO)
+        return (None,EMPTY_TEXT)
 
-def creatStatisticFiles(statFilePath, resultTxt):
+def creatStatisticFiles(statFilePath, resultTxt, tokenFilter=None):
+    """
+    Writes the 100 most frequent tokens of a text and their frequencies to a tab-separated file.
+    :param statFilePath: path to the statistics file
+    :param resultTxt: the text
+    :param tokenFilter: an optional lexicon.TokenFilter, only accepted tokens are counted
+    """
     if verbose:
         print("\tCreating statistics file at: "+statFilePath)
     statFile = open(statFilePath, "w")
     # standard NLP workflow
     # 1) tokenize the text
     tokens = nltk.word_tokenize(resultTxt)
+    if tokenFilter:
+        tokens = tokenFilter.filter(tokens)
     nltkText=nltk.Text(tokens)
     # 2) normalize tokens
     words = [w.lower() for w in tokens]
@@ -163,23 +237,216 @@ def creatStatisticFiles(statFilePath, resultTxt):
     statFile.write(fTxt)
     statFile.close()
 
-def createNERFiles(statFilePath, resultTxt, tagger):
+def splitLongSpan(text, start, end, maxLength):
+    """
+    Splits the span [start, end) of text into spans of at most maxLength characters, cutting at blanks if possible.
+    """
+    while end - start > maxLength:
+        cut = text.rfind(" ", start + 1, start + maxLength)
+        if cut <= start:
+            cut = start + maxLength
+        yield (start, cut)
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        yield (start, end)
+
+class BatchedNERTagger(object):
+    """
+    Tags the named entities of many pages at once. The text of every page is split into sentences which are collected
+    over pages (and PPNs) and passed to the flair model in mini batches as soon as flushThreshold sentences are pending.
+    Once all sentences of a page have been tagged, onPageTagged(pageKey, taggedStr, details) is called. details is
+    merged from flair's Sentence.to_dict(tag_type='ner') of the sentences, i.e., it has the same form as if the page had
+    been tagged as a single sentence (entity offsets are relative to the text of the page).
+    """
+    def __init__(self, tagger, onPageTagged, miniBatchSize=32, flushThreshold=2048, maxSentenceLength=1000, language="german"):
+        """
+        :param tagger: a flair SequenceTagger
+        :param onPageTagged: called with (pageKey, taggedStr, details) for every completely tagged page
+        :param miniBatchSize: number of sentences passed to the model at once
+        :param flushThreshold: number of pending sentences triggering the tagging
+        :param maxSentenceLength: longer sentences (in characters) are split at blanks
+        :param language: language of the punkt sentence tokenizer
+        """
+        self.tagger = tagger
+        self.onPageTagged = onPageTagged
+        self.miniBatchSize = miniBatchSize
+        self.flushThreshold = flushThreshold
+        self.maxSentenceLength = maxSentenceLength
+        self.sentenceTokenizer = nltk.data.load("tokenizers/punkt/%s.pickle" % language)
+        # (page key, offset of the sentence within the page, flair sentence) of all untagged sentences
+        self.pendingSentences = []
+        # page key->(text, number of untagged sentences, list of (offset, flair sentence))
+        self.pendingPages = dict()
+
+    def addPage(self, pageKey, text):
+        """
+        Adds the text of a page, tagging is done as soon as enough sentences are pending or flush() is called.
+        :param pageKey: a unique key of the page which is passed to onPageTagged
+        :param text: the text of the page
+        """
+        sentences = []
+        for sentenceStart, sentenceEnd in self.sentenceTokenizer.span_tokenize(text):
+            for start, end in splitLongSpan(text, sentenceStart, sentenceEnd, self.maxSentenceLength):
+                sentence = Sentence(text[start:end])
+                if len(sentence) > 0:
+                    sentences.append((start, sentence))
+        self.pendingPages[pageKey] = [text, len(sentences), sentences]
+        if not sentences:
+            self._finishPage(pageKey)
+            return
+        for start, sentence in sentences:
+            self.pendingSentences.append((pageKey, start, sentence))
+        if len(self.pendingSentences) >= self.flushThreshold:
+            self.flush()
+
+    def flush(self):
+        """
+        Tags all pending sentences.
+        """
+        if not self.pendingSentences:
+            return
+        sentences = [sentence for pageKey, start, sentence in self.pendingSentences]
+        try:
+            self.tagger.predict(sentences, mini_batch_size=self.miniBatchSize)
+        except RuntimeError as err:
+            # retry sentence by sentence in order to lose only the sentences causing the error
+            print("Runtime error: {0}".format(err))
+            for pageKey, start, sentence in self.pendingSentences:
+                try:
+                    self.tagger.predict(sentence)
+                except RuntimeError as err:
+                    print("Runtime error: {0}".format(err))
+                    print("Failed at: %s (offset %i)" % (str(pageKey), start))
+        for pageKey, start, sentence in self.pendingSentences:
+            page = self.pendingPages[pageKey]
+            page[1] -= 1
+            if page[1] == 0:
+                self._finishPage(pageKey)
+        self.pendingSentences = []
+
+    def _finishPage(self, pageKey):
+        text, untagged, sentences = self.pendingPages.pop(pageKey)
+        taggedStrs = []
+        details = None
+        for start, sentence in sentences:
+            taggedStrs.append(sentence.to_tagged_string())
+            sentenceDetails = sentence.to_dict(tag_type="ner")
+            # the offsets of the entities are made relative to the text of the page
+            for entity in sentenceDetails.get("entities", []):
+                for key in ("start_pos", "end_pos"):
+                    if key in entity:
+                        entity[key] += start
+            if details is None:
+                details = sentenceDetails
+            else:
+                # the lists of all sentences (e.g., the entities) are concatenated
+                for key, value in sentenceDetails.items():
+                    if isinstance(value, list):
+                        details[key] = details.get(key, []) + value
+        if details is None:
+            details = Sentence(text).to_dict(tag_type="ner")
+        details["text"] = text
+        self.onPageTagged(pageKey, "\n".join(taggedStrs), details)
+
+def fileHash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(ALTO_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+class ProcessingManifest(object):
+    """
+    Registers the ALTO files processed in offline mode by their fingerprint (size, modification time, SHA-1 hash) and the
+    NER model used. A file is considered unchanged if its size and modification time are unchanged or, otherwise, if its
+    hash is unchanged. Files processed with another model are considered changed.
+    """
+    def __init__(self, manifestPath, model):
+        """
+        :param manifestPath: path to the SQLite manifest
+        :param model: the name of the NER model ("" if no NER is done)
+        """
+        self.model = model
+        self.conn = sqlite3.connect(manifestPath)
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, ppn TEXT NOT NULL, size INTEGER, mtime REAL, sha1 TEXT, model TEXT);''')
+            self.conn.execute('''CREATE INDEX IF NOT EXISTS idx_files_ppn ON files(ppn);''')
+
+    def filesOfPPN(self, ppn):
+        """
+        :return: a dict path->(size, modification time, SHA-1 hash, model) of all registered files of a PPN
+        """
+        return dict((row[0], row[1:]) for row in self.conn.execute("SELECT path, size, mtime, sha1, model FROM files WHERE ppn=?;", (ppn,)))
+
+    def isUnchanged(self, ppn, path, registered):
+        """
+        :param registered: the registered (size, modification time, SHA-1 hash, model) of the file or None
+        :return: True if the file has been processed before with the current model and has not changed since
+        """
+        if registered is None or registered[3] != self.model:
+            return False
+        stat = os.stat(path)
+        if registered[0] == stat.st_size and registered[1] == stat.st_mtime:
+            return True
+        if registered[0] == stat.st_size and registered[2] == fileHash(path):
+            # touched but not changed, remember the new modification time
+            self.register(ppn, [path])
+            return True
+        return False
+
+    def register(self, ppn, paths):
+        """
+        Registers (or updates) processed files of a PPN.
+        """
+        rows = []
+        for path in paths:
+            stat = os.stat(path)
+            rows.append((path, ppn, stat.st_size, stat.st_mtime, fileHash(path), self.model))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?);", rows)
+
+    def unregister(self, paths):
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path=?;", [(path,) for path in paths])
+
+    def close(self):
+        self.conn.close()
+
+def removeDerivedFiles(altoPath):
+    """
+    Removes the files created from a former version of an ALTO file (see DERIVED_FILE_SUFFIXES).
+    :param altoPath: path to the ALTO file
+    """
+    for suffix in DERIVED_FILE_SUFFIXES:
+        derivedFilePath=altoPath.replace(".xml", suffix)
+        if os.path.exists(derivedFilePath):
+            os.remove(derivedFilePath)
+
+def writeNERFiles(altoPath, taggedStr, details):
+    """
+    Writes the NER results of a page next to its ALTO file.
+    :param altoPath: path to the ALTO file of the page
+    :param taggedStr: the tagged text of the page
+    :param details: the entities of the page
+    """
+    nerFilePath=altoPath.replace(".xml", "_ner.txt")
+    nerDetailFilePath=altoPath.replace(".xml", "_ner_details.txt")
+    nerDetailJSONFilePath=altoPath.replace(".xml", "_ner_details.json")
     if verbose:
-        print("\tCreating named entity recognized file at: "+statFilePath)
-    statFile = open(statFilePath, "w")
-    try:
-        sentence = Sentence(resultTxt)
-        # predict NER tags
-        tagger.predict(sentence)
-    except RuntimeError as err:
-        print("Runtime error: {0}".format(err))
-        print("Failed at: "+statFilePath) 
-    
-    taggedStr=sentence.to_tagged_string()
-    details=sentence.to_dict(tag_type='ner')
-    statFile.write(taggedStr)
-    statFile.close()
-    return (taggedStr,details)
+        print("\tCreating named entity recognized file at: "+nerFilePath)
+    nerFile=open(nerFilePath,"w")
+    nerFile.write(taggedStr)
+    nerFile.close()
+
+    nerDetailFile=open(nerDetailFilePath,"w")
+    nerDetailFile.write(str(details))
+    nerDetailFile.close()
+
+    nerDetailJSONFile=open(nerDetailJSONFilePath,"w")
+    nerDetailJSONFile.write(jsonpickle.encode(details, unpicklable=False))
+    nerDetailJSONFile.close()
 
 
 if __name__ == "__main__":
@@ -234,74 +501,164 @@ if __name__ == "__main__":
 
         totalFiles=len(fulltextFilePaths)
         printLog("Found %i ALTO candidate files for further processing."%totalFiles)
+
+        statisticTokenFilter=None
+        if filterStatisticTokens:
+            statisticTokenFilter=lexicon.TokenFilter(lexicon.loadStopwordsForLanguages(stopwordLanguages))
         
+        # NER results of the pages of all PPNs whose NER files have not been written yet (PPN->ALTO path->(tagged text, details))
+        nerResultsPerPPN=dict()
+        # PPNs whose pages have all been parsed, their NER files are written as soon as all pages have been tagged
+        ppnsAwaitingNER=[]
+
+        # processed files per PPN, registered in the manifest once the aggregated files of the PPN have been written
+        processedFilesPerPPN=dict()
+        manifest=None
+        if incrementalProcessing:
+            manifest=ProcessingManifest(sbbGetBasePath+manifestFileName, flairModel if useFlairNLP else "")
+
+        def registerProcessedFiles(ppn):
+            if manifest:
+                manifest.register(ppn, processedFilesPerPPN.pop(ppn, []))
+
+        def onPageTagged(pageKey, taggedStr, details):
+            ppn, file = pageKey
+            writeNERFiles(file, taggedStr, details)
+            nerResultsPerPPN[ppn][file]=(taggedStr, details)
+
+        def writeFinishedNERFiles():
+            # all pages which have been added to the tagger but not tagged yet
+            pendingPPNs=set(ppn for ppn, file in nerTagger.pendingPages)
+            for ppn in list(ppnsAwaitingNER):
+                if ppn in pendingPPNs:
+                    continue
+                ppnsAwaitingNER.remove(ppn)
+                nerResults=nerResultsPerPPN.pop(ppn)
+                # keep the order of the pages
+                taggedPages=[nerResults[file] for file in dirsPerPPN[ppn] if file in nerResults]
+                nerTextPerPPN="".join(taggedStr+"\n" for taggedStr, details in taggedPages)
+                nerDicts=[details for taggedStr, details in taggedPages]
+
+                txtFile=open(sbbGetBasePath+ppn+"/fulltext_ner.txt","w")
+                txtFile.write(nerTextPerPPN)
+                txtFile.close()
+
+                txtFile=open(sbbGetBasePath+ppn+"/fulltext_ner_details.txt","w")
+                txtFile.write("Used model: "+flairModel+"\n"+str(nerDicts))
+                txtFile.close()
+                registerProcessedFiles(ppn)
+
         if useFlairNLP:
             nerModel=SequenceTagger.load(flairModel)
             print("Flair model loaded.")
+            nerTagger=BatchedNERTagger(nerModel, onPageTagged, miniBatchSize=nerMiniBatchSize, flushThreshold=nerFlushThreshold,
+                                       maxSentenceLength=nerMaxSentenceLength, language=punktLanguage)
 
         processCounter=0
+        skippedPPNs=0
         for ppn in dirsPerPPN:
+            # files which have been processed before and have not changed since, their results are reused
+            unchangedFiles=set()
+            if manifest:
+                registeredFiles=manifest.filesOfPPN(ppn)
+                for file in dirsPerPPN[ppn]:
+                    if manifest.isUnchanged(ppn,file,registeredFiles.pop(file,None)):
+                        unchangedFiles.add(file)
+                # the remaining files do not exist anymore
+                manifest.unregister(registeredFiles.keys())
+                aggregatedFiles=[sbbGetBasePath+ppn+"/fulltext.txt"]
+                if useFlairNLP:
+                    aggregatedFiles.append(sbbGetBasePath+ppn+"/fulltext_ner.txt")
+                if len(unchangedFiles)==len(dirsPerPPN[ppn]) and not registeredFiles and all(os.path.exists(f) for f in aggregatedFiles):
+                    processCounter+=len(dirsPerPPN[ppn])
+                    skippedPPNs+=1
+                    if verbose:
+                        print("Skipping unchanged PPN: "+ppn)
+                    continue
+
             textPerPPN=""
-            nerTextPerPPN=""
-            nerDicts=[]
+            processedFilesPerPPN[ppn]=[]
+            if useFlairNLP:
+                nerResultsPerPPN[ppn]=dict()
             print("Processing PPN: "+ppn)
             for file in dirsPerPPN[ppn]:
                 processCounter+=1
+                if file in unchangedFiles:
+                    # reuse the results of the previous run
+                    txtFilePath=file.replace(".xml", "_raw.txt")
+                    nerFilePath=file.replace(".xml", "_ner.txt")
+                    nerDetailJSONFilePath=file.replace(".xml", "_ner_details.json")
+                    if not os.path.exists(txtFilePath):
+                        # the page is empty or could not be parsed
+                        continue
+                    if not useFlairNLP or (os.path.exists(nerFilePath) and os.path.exists(nerDetailJSONFilePath)):
+                        txtFile=open(txtFilePath,"r")
+                        textPerPPN+=txtFile.read()+"\n"
+                        txtFile.close()
+                        if useFlairNLP:
+                            nerFile=open(nerFilePath,"r")
+                            taggedStr=nerFile.read()
+                            nerFile.close()
+                            nerDetailJSONFile=open(nerDetailJSONFilePath,"r")
+                            details=jsonpickle.decode(nerDetailJSONFile.read())
+                            nerDetailJSONFile.close()
+                            nerResultsPerPPN[ppn][file]=(taggedStr, details)
+                        continue
+                processedFilesPerPPN[ppn].append(file)
                 print("Processing file %i of %i (total files over all PPNs)"%(processCounter,totalFiles))
 
                 r=parseALTO(file)
                 error=r[1]
-                if(error<0):
-                    resultTxt=r[0]
-                    if resultTxt:
-                        txtFilePath=file.replace(".xml", "_raw.txt")
-                        statFilePath=file.replace(".xml", "_stats.txt")
-                        nerFilePath=file.replace(".xml", "_ner.txt")
-                        nerDetailFilePath=file.replace(".xml", "_ner_details.txt")
-                        nerDetailJSONFilePath=file.replace(".xml", "_ner_details.json")
-                        txtFile = open(txtFilePath, "w")
-
-                        txtFile.write(resultTxt)
-                        txtFile.close()
-
-                        creatStatisticFiles(statFilePath,resultTxt)
-                        if useFlairNLP:
-                            r=createNERFiles(nerFilePath,resultTxt,nerModel)
-                            nerTextPerPPN+=r[0]+"\n"
-                            nerDicts.append(r[1])
-
-                            nerDetailFile=open(nerDetailFilePath,"w")
-                            nerDetailFile.write(str(r[1]))
-                            nerDetailFile.close()
-
-                            nerDetailJSONFile=open(nerDetailJSONFilePath,"w")
-                            nerDetailJSONFile.write(jsonpickle.encode(r[1], unpicklable=False))
-                            nerDetailJSONFile.close()
-                        textPerPPN+=resultTxt+"\n"
+                resultTxt=r[0]
+                if error<0 and resultTxt:
+                    txtFilePath=file.replace(".xml", "_raw.txt")
+                    statFilePath=file.replace(".xml", "_stats.txt")
+                    txtFile = open(txtFilePath, "w")
+
+                    txtFile.write(resultTxt)
+                    txtFile.close()
+
+                    creatStatisticFiles(statFilePath,resultTxt,statisticTokenFilter)
+                    if useFlairNLP:
+                        # the NER files are written once the sentences of the page have been tagged (see onPageTagged)
+                        nerTagger.addPage((ppn,file),resultTxt)
+                    textPerPPN+=resultTxt+"\n"
                 else:
-                    if verbose:
-                        printLog("\tParsing problem (%s): %s" % (errorCodeAsText(error),file))
-                    errorFile.write("Discarded %s.\tNo ALTO root element found OR parsing error: %s\n" % (file,errorCodeAsText(error)))
+                    # the results of a former version of the file must not be reused, the file is not registered in the
+                    # manifest, hence, it is processed again by the next run
+                    removeDerivedFiles(file)
+                    processedFilesPerPPN[ppn].remove(file)
+                    if manifest:
+                        manifest.unregister([file])
+                    if error>=0:
+                        if verbose:
+                            printLog("\tParsing problem (%s): %s" % (errorCodeAsText(error),file))
+                        errorFile.write("Discarded %s.\tNo ALTO root element found OR parsing error: %s\n" % (file,errorCodeAsText(error)))
             txtFile=open(sbbGetBasePath+ppn+"/fulltext.txt","w")
             txtFile.write(textPerPPN)
             txtFile.close()
-            if useFlairNLP:
-                txtFile=open(sbbGetBasePath+ppn+"/fulltext_ner.txt","w")
-                txtFile.write(nerTextPerPPN)
-                txtFile.close()
+            creatStatisticFiles(sbbGetBasePath+ppn+"/fulltext_stats.txt",textPerPPN,statisticTokenFilter)
 
-                txtFile=open(sbbGetBasePath+ppn+"/fulltext_ner_details.txt","w")
-                txtFile.write("Used model: "+flairModel+"\n"+str(nerDicts))
-                txtFile.close()
+            if useFlairNLP:
+                ppnsAwaitingNER.append(ppn)
+                writeFinishedNERFiles()
+            else:
+                registerProcessedFiles(ppn)
 
-            creatStatisticFiles(sbbGetBasePath+ppn+"/fulltext_stats.txt",textPerPPN)
+        if useFlairNLP:
+            # tag the remaining sentences
+            nerTagger.flush()
+            writeFinishedNERFiles()
+        if manifest:
+            manifest.close()
+            printLog("Skipped %i unchanged PPNs."%skippedPPNs)
     else:
-        # online mode relying on an Excel file placed at oaiAnalyzerResultFile
+        # online mode relying on the METS/MODS analysis table placed at oaiAnalyzerResultFile
         printLog("Using online mode.")
         printLog("\tRead METS/MODS analysis table from: " +oaiAnalyzerResultFile)
-        rawDF = pd.read_excel(oaiAnalyzerResultFile)
+        rawDF = analysisTable.readAnalysisTable(oaiAnalyzerResultFile, columns=["ppn","altoPaths"])
         # select only the records with available altoPaths
-        df=rawDF[rawDF.altoPaths.notnull()]
+        df=rawDF[rawDF.altoPaths.notnull() & (rawDF.altoPaths!="")]
         # 1) iterate over the dataframe to find out how many URLs will have to be processed
         countURLs=0
         downloadedAltoFiles=0
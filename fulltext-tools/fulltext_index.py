@@ -0,0 +1,255 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# full-text index of all ALTO files downloaded by sbbget based on SQLite's FTS5 extension
+# the text of every TextBlock is indexed together with its PPN, page number, and coordinates on the page
+# usage:
+#   python fulltext_index.py                      adds new or changed ALTO files to the index
+#   python fulltext_index.py --search "<query>"   searches the index, e.g., 'Berlin', '"Berliner Zeitung"', or 'Zeit*'
+
+import sys
+import os
+import re
+import time
+import sqlite3
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+# enables verbose output during processing
+verbose = True
+# path to the sbbget temporary result files, e.g. "../sbbget/sbbget_downloads/download_temp" (the base path under which ALTO files are stored)
+sbbGetBasePath="../sbbget/sbbget_downloads/download_temp/"
+# path of the analysis results
+analysisPath="./analysis/"
+# file name of the index database (stored under analysisPath)
+indexFileName="fulltext_index.db"
+# maximum number of search results
+maxSearchResults=20
+# ALTO files are fed to the parser in chunks of this size (in bytes)
+ALTO_CHUNK_SIZE=64*1024
+
+# regular expression for page number detection
+pagePattern=re.compile("FILE_(\\d+)_FULLTEXT")
+
+
+def printLog(text):
+    now = str(datetime.now())
+    print("[" + now + "]\t" + text)
+    # forces to output the result of the print command immediately, see: http://stackoverflow.com/questions/230751/how-to-flush-output-of-python-print
+    sys.stdout.flush()
+
+def createSupplementaryDirectories():
+    if not os.path.exists(analysisPath):
+        if verbose:
+            print("Creating " + analysisPath)
+        os.mkdir(analysisPath)
+
+def setupDatabase(conn):
+    """
+    Creates the tables of the index if they do not exist yet:
+    - indexed_files: all indexed ALTO files with their size and modification time at indexing time
+    - blocks: the text of every TextBlock with its PPN, page, ALTO ID, and coordinates
+    - blocks_fts: the FTS5 index of blocks (kept in sync by triggers), prefix queries of 2 and 3 characters are indexed
+    """
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS indexed_files (file_id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, ppn TEXT NOT NULL, size INTEGER, mtime REAL);''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS blocks (block_id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, ppn TEXT NOT NULL, page INTEGER NOT NULL, alto_id TEXT,
+                        hpos REAL, vpos REAL, width REAL, height REAL, text TEXT NOT NULL, FOREIGN KEY (file_id) REFERENCES indexed_files(file_id));''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS idx_blocks_file ON blocks(file_id);''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS idx_blocks_ppn_page ON blocks(ppn, page);''')
+        conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS blocks_fts USING fts5(text, ppn UNINDEXED, page UNINDEXED,
+                        content='blocks', content_rowid='block_id', prefix='2 3');''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS blocks_ai AFTER INSERT ON blocks BEGIN
+                        INSERT INTO blocks_fts(rowid, text, ppn, page) VALUES (new.block_id, new.text, new.ppn, new.page);
+                        END;''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS blocks_ad AFTER DELETE ON blocks BEGIN
+                        INSERT INTO blocks_fts(blocks_fts, rowid, text, ppn, page) VALUES ('delete', old.block_id, old.text, old.ppn, old.page);
+                        END;''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS blocks_au AFTER UPDATE ON blocks BEGIN
+                        INSERT INTO blocks_fts(blocks_fts, rowid, text, ppn, page) VALUES ('delete', old.block_id, old.text, old.ppn, old.page);
+                        INSERT INTO blocks_fts(rowid, text, ppn, page) VALUES (new.block_id, new.text, new.ppn, new.page);
+                        END;''')
+
+class ALTOBlockTarget(object):
+    """
+    Parser target collecting the TextBlocks of an ALTO file as (ALTO ID, HPOS, VPOS, WIDTH, HEIGHT, text) tuples. Every
+    TextLine starts with a line break followed by the CONTENT of its String elements separated by blanks.
+    """
+    def __init__(self):
+        self.blocks = []
+        self.rootTag = None
+        self.currentBlock = None
+        self.tokens = []
+
+    def start(self, tag, attrib):
+        if self.rootTag is None:
+            # the namespace (alto-1/2/3) is taken from the root element
+            self.rootTag = tag
+            xmlns = tag.split('}')[0].strip('{')
+            self.textBlockTag = '{%s}TextBlock' % xmlns
+            self.textLineTag = '{%s}TextLine' % xmlns
+            self.stringTag = '{%s}String' % xmlns
+        elif tag == self.stringTag:
+            self.tokens.append(attrib.get('CONTENT', ''))
+            self.tokens.append(' ')
+        elif tag == self.textLineTag:
+            self.tokens.append("\n")
+        elif tag == self.textBlockTag:
+            self.currentBlock = [attrib.get('ID')] + [toNumber(attrib.get(a)) for a in ['HPOS', 'VPOS', 'WIDTH', 'HEIGHT']]
+            self.tokens = []
+
+    def end(self, tag):
+        if tag == self.textBlockTag and self.currentBlock is not None:
+            text = "".join(self.tokens).strip()
+            if text:
+                self.blocks.append(tuple(self.currentBlock + [text]))
+            self.currentBlock = None
+            self.tokens = []
+
+    def close(self):
+        return self.blocks
+
+def toNumber(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parseALTOBlocks(docPath):
+    """
+    :param docPath: path to the ALTO file
+    :return: a list of (ALTO ID, HPOS, VPOS, WIDTH, HEIGHT, text) tuples or None if the file is no (valid) ALTO file
+    """
+    target = ALTOBlockTarget()
+    parser = ET.XMLParser(target=target)
+    try:
+        with open(docPath, "rb") as f:
+            while True:
+                chunk = f.read(ALTO_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                if target.rootTag is not None and not target.rootTag.endswith("alto"):
+                    return None
+        return parser.close()
+    except ET.ParseError:
+        return None
+
+def findALTOFiles(basePath):
+    """
+    :param basePath: the sbbget download directory
+    :return: a dict PPN->list of (page number, path) tuples of all ALTO candidate files
+    """
+    altoFilesPerPPN=dict()
+    for ppn in sorted(os.listdir(basePath)):
+        if not ppn.startswith("PPN"):
+            continue
+        altoFilesPerPPN[ppn]=[]
+        for dirpath, dirnames, files in os.walk(os.path.join(basePath, ppn)):
+            if not dirpath.endswith("_FULLTEXT"):
+                continue
+            pageMatch=pagePattern.search(dirpath)
+            page=int(pageMatch.group(1)) if pageMatch else -1
+            for name in files:
+                if name.endswith(".xml") or name.endswith(".XML"):
+                    altoFilesPerPPN[ppn].append((page, os.path.join(dirpath, name)))
+    return altoFilesPerPPN
+
+def updateIndex(conn, basePath):
+    """
+    Adds all new or changed ALTO files below basePath to the index and removes files which do not exist anymore. Each PPN
+    is updated in a single transaction, hence, an interrupted update can simply be restarted.
+    :return: a (number of indexed files, number of indexed blocks) tuple
+    """
+    indexedFiles=dict()
+    for fileID, path, size, mtime in conn.execute("SELECT file_id, path, size, mtime FROM indexed_files;"):
+        indexedFiles[path]=(fileID, size, mtime)
+
+    altoFilesPerPPN=findALTOFiles(basePath)
+    totalFiles=0
+    totalBlocks=0
+    for ppn in altoFilesPerPPN:
+        filesBefore=totalFiles
+        with conn:
+            for page, path in altoFilesPerPPN[ppn]:
+                stat=os.stat(path)
+                known=indexedFiles.pop(path, None)
+                if known:
+                    if known[1]==stat.st_size and known[2]==stat.st_mtime:
+                        continue
+                    conn.execute("DELETE FROM blocks WHERE file_id=?;", (known[0],))
+                    conn.execute("DELETE FROM indexed_files WHERE file_id=?;", (known[0],))
+                blocks=parseALTOBlocks(path)
+                if blocks is None:
+                    if verbose:
+                        printLog("\tNo ALTO root element found OR parsing error: "+path)
+                    blocks=[]
+                # unparsable files are registered as well in order to skip them during the next update
+                fileID=conn.execute("INSERT INTO indexed_files(path, ppn, size, mtime) VALUES (?,?,?,?);",
+                                    (path, ppn, stat.st_size, stat.st_mtime)).lastrowid
+                conn.executemany("INSERT INTO blocks(file_id, ppn, page, alto_id, hpos, vpos, width, height, text) VALUES (?,?,?,?,?,?,?,?,?);",
+                                 [(fileID, ppn, page) + block for block in blocks])
+                totalFiles+=1
+                totalBlocks+=len(blocks)
+        if verbose and totalFiles>filesBefore:
+            printLog("Indexed %s (%i files and %i blocks so far)."%(ppn,totalFiles,totalBlocks))
+
+    # files which have been indexed before but do not exist anymore
+    if indexedFiles:
+        with conn:
+            for fileID, size, mtime in indexedFiles.values():
+                conn.execute("DELETE FROM blocks WHERE file_id=?;", (fileID,))
+                conn.execute("DELETE FROM indexed_files WHERE file_id=?;", (fileID,))
+        printLog("Removed %i files from the index."%len(indexedFiles))
+    return (totalFiles,totalBlocks)
+
+def search(conn, query, limit=20):
+    """
+    Searches the index using the FTS5 query syntax, e.g., Berlin (keyword), "Berliner Zeitung" (phrase), Zeit* (prefix),
+    or Berlin AND Zeitung.
+    :param query: the query
+    :param limit: the maximum number of results
+    :return: a list of (PPN, page, ALTO ID, HPOS, VPOS, WIDTH, HEIGHT, snippet) tuples ordered by relevance
+    """
+    return conn.execute('''SELECT b.ppn, b.page, b.alto_id, b.hpos, b.vpos, b.width, b.height,
+                           snippet(blocks_fts, 0, '[', ']', '...', 12)
+                           FROM blocks_fts INNER JOIN blocks b ON b.block_id=blocks_fts.rowid
+                           WHERE blocks_fts MATCH ? ORDER BY rank LIMIT ?;''', (query, limit)).fetchall()
+
+
+if __name__ == "__main__":
+    createSupplementaryDirectories()
+    db_connection = sqlite3.connect(analysisPath+indexFileName)
+    setupDatabase(db_connection)
+
+    if len(sys.argv)>2 and sys.argv[1]=="--search":
+        startTime=time.perf_counter()
+        try:
+            results=search(db_connection, sys.argv[2], maxSearchResults)
+        except sqlite3.OperationalError as ex:
+            # e.g., unbalanced quotes or special characters such as "-" outside of a phrase
+            printLog("Invalid query (%s), put terms containing special characters in double quotes, e.g., '\"Berlin-Mitte\"'."%ex)
+            db_connection.close()
+            sys.exit(1)
+        for ppn, page, altoID, hpos, vpos, width, height, snippet in results:
+            print("%s\tpage %i\t%s (%s, %s, %s, %s)\t%s"%(ppn, page, altoID, hpos, vpos, width, height, snippet.replace("\n", " ")))
+        printLog("Found %i results in %.3f s."%(len(results), time.perf_counter()-startTime))
+    else:
+        printLog("Updating the full-text index at: "+analysisPath+indexFileName)
+        startTime=time.perf_counter()
+        files, blocks=updateIndex(db_connection, sbbGetBasePath)
+        printLog("Indexed %i new or changed files (%i blocks) in %.1f s."%(files, blocks, time.perf_counter()-startTime))
+    db_connection.close()
@@ -0,0 +1,86 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# stopword lists and token filtering shared by fulltext_analysis.py and ner_analysis.py
+
+import os
+import re
+
+# stopword lists per language, relative paths are resolved against the directory of this module
+stopwordFiles = {"german": "stopwords_ger.txt"}
+
+# a word is considered "clean" if it
+# - does not start with punctuation,
+# - starts with a non-digit followed by a Unicode word character,
+# - and has at least 3 characters
+CLEAN_WORD_PATTERN = re.compile("^(?![\\!\\(\\)\\-\\[\\]\\{\\};:\\'\\,\\.\\/\\=—•■✓€])\\D\\w.", re.DOTALL)
+
+
+def loadStopwords(path):
+    """
+    Loads a stopword list (one word per line, lines starting with # are ignored).
+    :param path: path to the stopword list
+    :return: a frozenset of the lowercased stopwords
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return frozenset(line.strip().lower() for line in f if line.strip() and not line.startswith("#"))
+
+
+def loadStopwordsForLanguages(languages):
+    """
+    Loads and merges the stopword lists of several languages (see stopwordFiles).
+    :param languages: a list of languages, e.g., ["german"]
+    :return: a frozenset of the lowercased stopwords
+    """
+    stopwords = set()
+    for language in languages:
+        path = stopwordFiles[language]
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        stopwords.update(loadStopwords(path))
+    return frozenset(stopwords)
+
+
+class TokenFilter(object):
+    """
+    Filters tokens by a stopword list and the CLEAN_WORD_PATTERN.
+    """
+    def __init__(self, stopwords=frozenset(), cleanWordPattern=CLEAN_WORD_PATTERN):
+        """
+        :param stopwords: a set of lowercased stopwords
+        :param cleanWordPattern: a compiled regular expression matching clean words
+        """
+        self.stopwords = frozenset(stopwords)
+        self.cleanWordMatch = cleanWordPattern.match
+
+    def isStopword(self, word):
+        return word.lower() in self.stopwords
+
+    def isClean(self, word):
+        return self.cleanWordMatch(word) is not None
+
+    def accepts(self, word):
+        """
+        :return: True if the word is no stopword and clean
+        """
+        return not self.isStopword(word) and self.isClean(word)
+
+    def filter(self, tokens):
+        """
+        :param tokens: an iterable of tokens
+        :return: a list of the accepted tokens
+        """
+        stopwords = self.stopwords
+        cleanWordMatch = self.cleanWordMatch
+        return [t for t in tokens if t.lower() not in stopwords and cleanWordMatch(t)]
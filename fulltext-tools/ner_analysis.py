@@ -14,6 +14,7 @@
 
 import sys
 import os
+import time
 from datetime import datetime
 import jsonpickle
 import sqlite3
@@ -26,6 +27,7 @@ from bokeh.models.graphs import NodesAndLinkedEdges, EdgesAndLinkedNodes
 from bokeh.models.tools import HoverTool
 from bokeh.palettes import Spectral4
 import networkx as nx
+import lexicon
 
 # enables verbose output during processing
 verbose = True
@@ -35,6 +37,11 @@ sbbGetBasePath="../sbbget/sbbget_downloads/download_temp/"
 analysisPath="./analysis/"
 # path to the stopword list
 stopwordFile="./stopwords_ger.txt"
+# SQLite settings for the ingestion, the rows of each PPN are inserted in a single transaction
+# journal mode, e.g., "WAL" or "DELETE" (SQLite's default)
+sqliteJournalMode="WAL"
+# synchronous setting, "OFF" is fastest but the database may be corrupted by a power loss, "FULL" is SQLite's default
+sqliteSynchronous="NORMAL"
 
 def printLog(text):
     now = str(datetime.now())
@@ -49,18 +56,98 @@ def createSupplementaryDirectories():
         os.mkdir(analysisPath)
 
 def setupDatabase(conn,cursor):
+    """
+    Creates the (empty) tables of the database:
+    - media: one row per PPN
+    - words: one row per distinct word, identified by an integer ID
+    - pages: one row per page of a PPN, identified by an integer ID
+    - word_pages: the frequency of a word on a page
+    The unique constraints and indexes are created by createIndexes() after the ingestion.
+    """
     cursor.execute('''DROP TABLE IF EXISTS media;''')
     cursor.execute('''CREATE TABLE media (ppn TEXT PRIMARY KEY, path TEXT NOT NULL, title_img TEXT);''')
+    createWordTables(cursor)
+    conn.commit()
 
+def createWordTables(cursor):
     cursor.execute('''DROP TABLE IF EXISTS words;''')
-    cursor.execute('''CREATE TABLE words (word_str TEXT);''')
+    cursor.execute('''CREATE TABLE words (word_id INTEGER PRIMARY KEY, word_str TEXT NOT NULL);''')
 
     cursor.execute('''DROP TABLE IF EXISTS pages;''')
-    cursor.execute('''CREATE TABLE pages (number INTEGER, path TEXT NOT NULL, rel_ppn TEXT NOT NULL, FOREIGN KEY (rel_ppn) REFERENCES media(ppn));''')
+    cursor.execute('''CREATE TABLE pages (page_id INTEGER PRIMARY KEY, rel_ppn TEXT NOT NULL, number INTEGER NOT NULL, path TEXT NOT NULL, FOREIGN KEY (rel_ppn) REFERENCES media(ppn));''')
 
     cursor.execute('''DROP TABLE IF EXISTS word_pages;''')
-    cursor.execute('''CREATE TABLE word_pages (rel_word TEXT, rel_number INTEGER, rel_ppn TEXT NOT NULL, FOREIGN KEY (rel_ppn) REFERENCES media(ppn), FOREIGN KEY (rel_word) REFERENCES words(word_str),FOREIGN KEY (rel_number) REFERENCES pages(number));''')
+    cursor.execute('''CREATE TABLE word_pages (word_id INTEGER NOT NULL, page_id INTEGER NOT NULL, freq INTEGER, FOREIGN KEY (word_id) REFERENCES words(word_id), FOREIGN KEY (page_id) REFERENCES pages(page_id));''')
+
+def configureDatabase(conn):
+    """
+    Applies the journal mode and synchronous setting used during the ingestion (see sqliteJournalMode and sqliteSynchronous).
+    """
+    conn.execute("PRAGMA journal_mode=%s;" % sqliteJournalMode)
+    conn.execute("PRAGMA synchronous=%s;" % sqliteSynchronous)
+
+def createIndexes(conn,cursor):
+    """
+    Creates the unique constraints and indexes of the database. Should be called after all rows have been inserted as
+    updating the indexes during the ingestion slows it down.
+    """
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_words_word_str ON words(word_str);''')
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_pages_ppn_number ON pages(rel_ppn, number);''')
+    # every (word, page) pair occurs only once, the index also answers "on which pages does a word occur?", the pages are
+    # joined by their primary key
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_word_pages_word_page ON word_pages(word_id, page_id);''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_word_pages_page ON word_pages(page_id, word_id);''')
+    cursor.execute('''ANALYZE;''')
+    conn.commit()
+
+def insertRows(conn,cursor,mediaRows,wordRows,pageRows,wordPageRows):
+    """
+    Inserts the collected rows of all tables in a single transaction.
+    :return: the number of inserted rows
+    """
+    with conn:
+        cursor.executemany("INSERT INTO media VALUES(?,?,?);",mediaRows)
+        cursor.executemany("INSERT INTO words VALUES(?,?);",wordRows)
+        cursor.executemany("INSERT INTO pages VALUES(?,?,?,?);",pageRows)
+        cursor.executemany("INSERT INTO word_pages VALUES(?,?,?);",wordPageRows)
+    return len(mediaRows)+len(wordRows)+len(pageRows)+len(wordPageRows)
+
+def isLegacyDatabase(cursor):
+    """
+    :return: True if the database uses the former schema without word and page IDs
+    """
+    columns=[row[1] for row in cursor.execute("PRAGMA table_info(words);")]
+    return len(columns)>0 and "word_id" not in columns
+
+def migrateLegacyDatabase(conn,cursor):
+    """
+    Converts a database created with the former schema (one pages row per word occurrence, words referenced by their
+    string) to the current schema. The word frequencies per page are not available in the former schema and are left NULL.
+    """
+    with conn:
+        for table in ["words","pages","word_pages"]:
+            cursor.execute("ALTER TABLE %s RENAME TO legacy_%s;"%(table,table))
+        # indexes keep their names when their table is renamed
+        for index in ["idx_words_word_str","idx_pages_ppn_number","idx_word_pages_word_page","idx_word_pages_page"]:
+            cursor.execute("DROP INDEX IF EXISTS %s;"%index)
+
+    # the unique indexes are needed to resolve the IDs while converting word_pages
+    createWordTables(cursor)
+    createIndexes(conn,cursor)
+    with conn:
+        cursor.execute('''INSERT INTO words(word_str) SELECT word_str FROM legacy_words WHERE word_str IS NOT NULL
+                          UNION SELECT rel_word FROM legacy_word_pages WHERE rel_word IS NOT NULL;''')
+        cursor.execute('''INSERT INTO pages(rel_ppn,number,path) SELECT rel_ppn,number,MIN(path) FROM legacy_pages
+                          WHERE number IS NOT NULL GROUP BY rel_ppn,number;''')
+        cursor.execute('''INSERT INTO word_pages(word_id,page_id,freq)
+                          SELECT DISTINCT w.word_id,p.page_id,NULL FROM legacy_word_pages lwp
+                          INNER JOIN words w ON w.word_str=lwp.rel_word
+                          INNER JOIN pages p ON p.rel_ppn=lwp.rel_ppn AND p.number=lwp.rel_number;''')
+        for table in ["words","pages","word_pages"]:
+            cursor.execute("DROP TABLE legacy_%s;"%table)
+    cursor.execute("ANALYZE;")
     conn.commit()
+    cursor.execute("VACUUM;")
 
 
 if __name__ == "__main__":
@@ -73,6 +160,18 @@ if __name__ == "__main__":
     db_connection = sqlite3.connect(analysisPath+'ner_analysis.db')
     db_cur = db_connection.cursor()
 
+    # "python ner_analysis.py --migrate" converts an existing database to the current schema and exits
+    if len(sys.argv)>1 and sys.argv[1]=="--migrate":
+        if isLegacyDatabase(db_cur):
+            printLog("Migrating database to the current schema...")
+            migrateLegacyDatabase(db_connection,db_cur)
+            printLog("Done.")
+        else:
+            printLog("Database already uses the current schema.")
+        db_connection.close()
+        sys.exit(0)
+
+    configureDatabase(db_connection)
     setupDatabase(db_connection,db_cur)
 
     nerFilePaths = dict()
@@ -112,7 +211,8 @@ if __name__ == "__main__":
     printLog("Found %i JSON and %i stats files for further processing."%(totalFiles,totalStatsFiles))
     
 
-    stopwords=open(stopwordFile, 'r').read()
+    # stopwords are ignored completely, only clean words (see lexicon.CLEAN_WORD_PATTERN) are added to the database
+    tokenFilter=lexicon.TokenFilter(lexicon.loadStopwords(stopwordFile))
     wordFrequencies=dict()
     cleanWordFrequencies=dict()
     wordsInPPN=dict()
@@ -121,23 +221,35 @@ if __name__ == "__main__":
     page_pattern=re.compile("FILE_\d\d\d\d")
     # only consider words with the following characteristics for the cleaned CSV and the DB:
     # min. 3 characters
-    # a minimum frequency of 2
+    # a minimum frequency of 2 (cleaned CSV only)
     # not starting with numbers
     # starting with Unicode word characters
     # does not start with punctuations
-    punctuations = '''!()-[]{};:'"\,<>./?@#$%^&*_~'''
-    pattern = re.compile("^(\D\w)")
-    pattern2=re.compile("^[\!\(\)\-\[\]\{\};:\'\,\.\/\=—•■✓€]")
 
     wordsInDatabase=0
+    # word->word ID of all words in the database
+    wordIDs=dict()
+    # number of pages in the database, used to assign page IDs
+    pagesInDatabase=0
+    # ingestion statistics
+    insertedRows=0
+    insertSeconds=0.0
+    ingestionStart=time.perf_counter()
 
     for ppn in statsFilePaths:
+        # the rows of the current PPN, inserted at once after all of its files have been read
+        mediaRows=[]
+        wordRows=[]
+        pageRows=[]
+        # page number->page ID of the current PPN
+        pageIDs=dict()
+        # (word ID, page ID)->frequency
+        wordPageFrequencies=dict()
         # add the PPN to the database, only add title page if it is available, otherwise it will be set to NULL
         title_img=sbbGetBasePath+ppn+"/"+"_TITLE_PAGE.jpg"
         if not os.path.exists(title_img):
             title_img=None
-        db_cur.execute("INSERT INTO media VALUES(:ppn,:path,:title_img);",{"ppn":ppn,"path":sbbGetBasePath+ppn,"title_img":title_img})
-        db_connection.commit()
+        mediaRows.append((ppn,sbbGetBasePath+ppn,title_img))
 
         for currentFile in statsFilePaths[ppn]:
             page_match=page_pattern.search(currentFile)
@@ -146,45 +258,57 @@ if __name__ == "__main__":
                 # we are only interested in the number part, thus the +5 (skip FILE_)
                 currentPage=int(currentFile[page_match.start()+5:page_match.end()])
 
+            head_tail = os.path.split(currentFile)
+            thumbnailPath=head_tail[0].replace("FULLTEXT","TIFF")+"/"+ppn+".jpg"
+
             with open(currentFile) as csvfile:
                 csv_reader = csv.reader(csvfile, delimiter='\t')
                 for row in csv_reader:
                     # only add words that are no stopwords
                     word=row[0]
                     freq=int(row[1])
-                    if not word.lower() in stopwords:
+                    if not tokenFilter.isStopword(word):
                         if not word in wordFrequencies:
                             wordFrequencies[word]=freq
-                            # update database accordingly
-                            if not pattern2.match(word) and len(word)>2:
-                                if pattern.match(word):
-                                    cleanWordFrequencies[word]=freq
-                                    db_cur.execute("INSERT INTO words VALUES(:new_word);",{"new_word":word})
-                                    wordsInDatabase+=1
-                                    head_tail = os.path.split(currentFile)
-                                    thumbnailPath=head_tail[0].replace("FULLTEXT","TIFF")+"/"+ppn+".jpg"
-
-                                    db_cur.execute("INSERT INTO pages VALUES(:pg_number,:path,:rel_ppn);",{"pg_number":currentPage,"rel_ppn":ppn,"path":thumbnailPath})
-                                    db_cur.execute("INSERT INTO word_pages VALUES(:rel_word,:rel_number,:rel_ppn);",{"rel_word":word,"rel_number":currentPage,"rel_ppn":ppn})
                         else:
                             wordFrequencies[word]+=freq
-                            
-                            # update the DB
-                            if not pattern2.match(word) and len(word)>2:
-                                if pattern.match(word):
-                                    cleanWordFrequencies[word]+=freq
-                                    head_tail = os.path.split(currentFile)
-                                    thumbnailPath=head_tail[0].replace("FULLTEXT","TIFF")+"/"+ppn+".jpg"
-                                    
-                                    db_cur.execute("INSERT INTO pages VALUES(:pg_number,:path,:rel_ppn);",{"pg_number":currentPage,"rel_ppn":ppn,"path":thumbnailPath})
-                                    db_cur.execute("INSERT INTO word_pages VALUES(:rel_word,:rel_number,:rel_ppn);",{"rel_word":word,"rel_number":currentPage,"rel_ppn":ppn})  
+
+                        # update database accordingly
+                        if tokenFilter.isClean(word):
+                            cleanWordFrequencies[word]=cleanWordFrequencies.get(word,0)+freq
+                            wordID=wordIDs.get(word)
+                            if wordID is None:
+                                wordID=len(wordIDs)+1
+                                wordIDs[word]=wordID
+                                wordRows.append((wordID,word))
+                                wordsInDatabase+=1
+                            # pages are only added if they contain at least one word
+                            pageID=pageIDs.get(currentPage)
+                            if pageID is None:
+                                pagesInDatabase+=1
+                                pageID=pagesInDatabase
+                                pageIDs[currentPage]=pageID
+                                pageRows.append((pageID,ppn,currentPage,thumbnailPath))
+                            wordPageFrequencies[(wordID,pageID)]=wordPageFrequencies.get((wordID,pageID),0)+freq
 
                         if not word in wordsInPPN:
                             wordsInPPN[word]=[]
                         if not ppn in wordsInPPN[word]:
-                            wordsInPPN[word].append(ppn)   
-                        db_connection.commit()
-    
+                            wordsInPPN[word].append(ppn)
+
+        wordPageRows=[(wordID,pageID,freq) for (wordID,pageID),freq in wordPageFrequencies.items()]
+        insertStart=time.perf_counter()
+        insertedRows+=insertRows(db_connection,db_cur,mediaRows,wordRows,pageRows,wordPageRows)
+        insertSeconds+=time.perf_counter()-insertStart
+
+    ingestionSeconds=time.perf_counter()-ingestionStart
+    printLog("Inserted %i rows in %.1f s (%.0f rows/s overall, %.0f rows/s in SQLite)."%(insertedRows,ingestionSeconds,
+             insertedRows/max(ingestionSeconds,1e-9),insertedRows/max(insertSeconds,1e-9)))
+    printLog("Creating indexes...")
+    indexStart=time.perf_counter()
+    createIndexes(db_connection,db_cur)
+    printLog("Created indexes in %.1f s."%(time.perf_counter()-indexStart))
+
     printLog("Found %i distinct raw words (of which %i are cleaned in database)."%(len(wordFrequencies.keys()),wordsInDatabase))
 
     with open(analysisPath+'wordFrequencies.csv', 'w') as csvfile:
@@ -198,9 +322,8 @@ if __name__ == "__main__":
         csv_writer = csv.writer(csvfile, quoting=csv.QUOTE_MINIMAL)
         csv_writer.writerow(["WORD","FREQUENCY","PPNs"])
         for word, freq in sorted(cleanWordFrequencies.items()):
-            if not pattern2.match(word) and len(word)>2 and freq>1:
-                if pattern.match(word):
-                    csv_writer.writerow([word,freq,";".join(wordsInPPN[word])])
+            if freq>1 and tokenFilter.isClean(word):
+                csv_writer.writerow([word,freq,";".join(wordsInPPN[word])])
     #print(wordsInPPN)
 
 
@@ -229,7 +352,7 @@ if __name__ == "__main__":
     printLog("Creating word-page graph...")
     word_ppn_pages=dict()
 
-    query1='''SELECT * from words ORDER BY word_str;'''
+    query1='''SELECT word_str from words ORDER BY word_str;'''
     
     availableWords=[]
     # get all available words
@@ -245,12 +368,12 @@ if __name__ == "__main__":
         word_ppn_pages[word]=dict()
         if verbose:
             print("\t%s (%i of %i)"%(word,i,cnt_words))
-        for row in db_cur.execute("SELECT DISTINCT wp.rel_word,wp.rel_number,wp.rel_ppn,p.path FROM word_pages wp INNER JOIN pages p ON rel_number=p.\"number\" AND wp.rel_ppn=p.rel_ppn WHERE rel_word LIKE :new_word;",{"new_word":word}):
-            # word - page - ppn - thumbnail path
-            # ('Alma', 22, 'PPN745158323', '../sbbget/sbbget_downloads.div_spielebuecher/download_temp/PPN745158323/FILE_0022_TIFF/PPN745158323.jpg')
-            page=row[1]
-            ppn=row[2]
-            path=row[3]
+        for row in db_cur.execute("SELECT p.number,p.rel_ppn,p.path FROM word_pages wp INNER JOIN pages p ON wp.page_id=p.page_id WHERE wp.word_id=:word_id;",{"word_id":wordIDs[word]}):
+            # page - ppn - thumbnail path
+            # (22, 'PPN745158323', '../sbbget/sbbget_downloads.div_spielebuecher/download_temp/PPN745158323/FILE_0022_TIFF/PPN745158323.jpg')
+            page=row[0]
+            ppn=row[1]
+            path=row[2]
             if ppn not in word_ppn_pages[word]:
                 word_ppn_pages[word][ppn]=[]
             word_ppn_pages[word][ppn].append((page,path))
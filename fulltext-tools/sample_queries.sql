@@ -1,2 +1,5 @@
 -- get all pages, ppns and thumbnail paths for a given word
-SELECT DISTINCT wp.rel_number,wp.rel_ppn,p.path FROM word_pages wp INNER JOIN pages p ON rel_number=p."number" AND wp.rel_ppn=p.rel_ppn WHERE rel_word LIKE 'Gast';
+SELECT p."number",p.rel_ppn,p.path FROM words w INNER JOIN word_pages wp ON wp.word_id=w.word_id INNER JOIN pages p ON wp.page_id=p.page_id WHERE w.word_str='Gast';
+
+-- get the most frequent words of a given PPN
+SELECT w.word_str,SUM(wp.freq) AS freq FROM pages p INNER JOIN word_pages wp ON wp.page_id=p.page_id INNER JOIN words w ON w.word_id=wp.word_id WHERE p.rel_ppn='PPN745158323' GROUP BY w.word_id ORDER BY freq DESC LIMIT 100;
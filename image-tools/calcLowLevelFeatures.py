@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import os
-import tarfile as TAR
+import io
 import sys
 from datetime import datetime
 from PIL import Image
@@ -27,6 +27,9 @@ from skimage.feature import hog
 import numpy as np
 import webcolors
 
+# the illustration archive format (illustrationArchive) is located in sbbget
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sbbget"))
+import illustrationArchive
 
 
 def printLog(text):
@@ -121,42 +124,32 @@ if __name__ == '__main__':
         if verbose:
             printLog("Processing %s" % tarFile)
         ppn=os.path.basename(tarFile).replace(".tar","")
-        tarBall = TAR.open(tarFile, "r")
-
-        members=tarBall.getmembers()
-        numberOfExtractedIllustrations+=len(members)
-        if len(members)<minExtract:
-            minExtract=len(members)
-        if len(members)>maxExtract:
-            maxExtract=len(members)
+        # use the index of the .tar file if available, otherwise, the .tar file is scanned once
+        entries=illustrationArchive.readOrBuildIndex(tarFile)
+        numberOfExtractedIllustrations+=len(entries)
+        if len(entries)<minExtract:
+            minExtract=len(entries)
+        if len(entries)>maxExtract:
+            maxExtract=len(entries)
 
         if i%1000==0:
             printLog("\n\nFound %i extracted illustrations in %i files of %i. Continuing..."%(numberOfExtractedIllustrations,i,noTarFiles))
             printLog("Min: %i; Max: %i\n"%(minExtract,maxExtract))
 
-        # extraction
-        if verbose:
-            printLog("\t Extracting tar file...")
-        jpgFiles=[]
-        for member in members:
-            #tarBall.extract(member,tempTarDir)
-            if member.isreg():  # skip if the TarInfo is not files
-                member.name = os.path.basename(member.name)  # remove the path by reset it
-                jpgFiles.append(member.name)
-                tarBall.extract(member, tempTarDir)
-
-        # process the JPEG files
+        # process the JPEG files, they are read directly from the .tar file
         if verbose:
             printLog("\t Processing JPEG files...")
         zipFile = zipfile.ZipFile(tempTarDir+ppn+"_lowlevelfeats.zip", "w",compression=zipfile.ZIP_DEFLATED)
+        tarBall = open(tarFile, "rb")
 
-        for jpeg in jpgFiles:
+        for entry in entries:
+            jpeg = os.path.basename(entry["name"])  # remove the path
             histogramDict=dict()
             histogramDict['ppn']=ppn
             histogramDict['extractName']=jpeg
 
             # open an image an convert it to RGB because we don't want to cope with RGB/RGBA conversions later on
-            image = Image.open(tempTarDir + jpeg).convert('RGB')
+            image = Image.open(io.BytesIO(illustrationArchive.readIllustration(tarBall, entry))).convert('RGB')
             histogram = image.histogram()
             histogramDict['redHistogram'] = histogram[0:256]
             histogramDict['blueHistogram'] = histogram[256:512]
@@ -205,12 +198,7 @@ if __name__ == '__main__':
             os.remove(jsonFile)
 
         zipFile.close()
-
-        # finally, remove the files again
-        if verbose:
-            printLog("\t Removing files...")
-        for jpeg in jpgFiles:
-            os.remove(tempTarDir+jpeg)
+        tarBall.close()
 
         #debug
         #if i>=debugLimit:
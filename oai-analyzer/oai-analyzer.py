@@ -17,20 +17,31 @@ import sys
 from datetime import datetime
 import re
 import os
-import pickle
-import urllib.request
-import xml.etree.ElementTree as ET
-# OAI-PMH client library
-from sickle import Sickle
+import queue
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 
 # data science imports, the usual suspects
-import numpy as np
 import scipy as sp
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import matplotlib as mpl
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 
+# the shared modules (HTTP layer, METS index, OAI-PMH record store and record table, analysis tables) are located in
+# sbbget, recordSink is located next to this script
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sbbget"))
+import stabiFetch
+import metsIndex
+import recordSink
+import oaiHarvest
+import analysisTable
+import oaiRecordTable
+
 # general configuration
 
 # enables verbose output during processing
@@ -41,6 +52,19 @@ forceOverride = True
 metaDataDownloadURLPrefix = "https://content.staatsbibliothek-berlin.de/dc/"
 # Berlin State Library internal setting
 runningFromWithinStabi = False
+# failed downloads are retried up to maxRetries times with an exponential backoff of retryBackoffFactor * 2^(retry-1) seconds
+maxRetries = 5
+retryBackoffFactor = 0.5
+# maximum number of requests per second (0 disables the limit)
+maxRequestsPerSecond = 0
+# if True, METS/MODS files are downloaded concurrently and parsed by a pool of worker processes while further files are downloaded
+pipelinedProcessing = True
+# maximum number of concurrent METS/MODS downloads in pipelined mode
+maxConcurrentDownloads = 8
+# number of worker processes parsing METS/MODS files in pipelined mode
+numberOfParserWorkers = 4
+# maximum number of PPNs being downloaded, waiting for parsing, or being parsed at the same time in pipelined mode, limits the memory usage
+maxDocumentsInFlight = 64
 # error log file name
 errorLogFileName = "oai-analyzer_error.log"
 # analysis path prefix
@@ -53,14 +77,39 @@ ppnFileName = analysisPrefix + "ppn_list.log"
 ambiguousPPNFileName = analysisPrefix + "ppn_ambiguous_list.csv"
 # True if downloaded METS/MODS documents have to be kept after processing
 keepMETSMODS=False
-# file path for metadata record pickle
+# OAI-PMH endpoint and parameters of the record harvest
+oaiEndpoint = "https://oai.sbb.berlin/oai"
+oaiHarvestParams = {'metadataPrefix': 'oai_dc', 'set': 'all'}
+# file path of the harvested records (compressed JSON lines, see oaiHarvest.py), an interrupted harvest is continued on the next run
+oaiRecordStorePath = "oai_records_dc_all.jsonl.gz"
+# if True, a completely harvested record store is updated with the records added, changed, or deleted since its newest datestamp
+# instead of being harvested again, only the METS/MODS files of new or changed PPNs are processed again (requires resumeProcessing)
+incrementalHarvest = True
+# file path for metadata record pickle saved by former versions, it is imported if no record store is available
 metadataRecordPicklePath = "save_120k_dc_all.pickle"
 # path to the DB file
 sqlDBPath=analysisPrefix+"oai-analyzer.db"
+# the records of all processed METS/MODS files are appended to a sink as processing proceeds, possible formats are "sqlite", "csv", and "parquet" (requires pyarrow)
+recordSinkFormat="sqlite"
+recordSinkPaths={"sqlite":sqlDBPath,"csv":analysisPrefix+"analyticaldf_records.csv","parquet":analysisPrefix+"analyticaldf_records/"}
+# number of records written at once, every written batch is a checkpoint an interrupted run can be resumed from
+recordSinkBatchSize=1000
+# if True, PPNs already stored in the record sink (e.g., by an interrupted run) are not processed again unless their OAI record has changed
+resumeProcessing=True
+# the columns of the records created by processMETSMODS() and the datestamp of the OAI record the METS/MODS file has been processed for
+# further keys found by processMETSMODS(), e.g., other roles than aut, rcp, and fnd or other titleInfo elements, are added as columns
+analysisColumns=['publisher','place','date','title','subTitle','language','aut','rcp','fnd','access','altoPaths','ppn','datestamp']
+# formats of the analysis tables analyticaldf and joinedDF, possible formats are "parquet", "feather" (both require pyarrow),
+# "sqlite", "csv", and "excel" (an export only, values longer than Excel's cell limit are truncated)
+# the first format is the primary one which is read on runs without forceOverride
+analysisTableFormats=["parquet","csv"]
 
 # do not change the following values
 # XML namespace of MODS
 modsNamespace = "{http://www.loc.gov/mods/v3}"
+# HTTP session reused for all downloads
+httpSession = stabiFetch.createSession(poolSize=maxConcurrentDownloads, maxRetries=maxRetries, backoffFactor=retryBackoffFactor, runningFromWithinStabi=runningFromWithinStabi)
+rateLimiter = stabiFetch.RateLimiter(maxRequestsPerSecond)
 
 def printLog(text):
     now = str(datetime.now())
@@ -69,6 +118,11 @@ def printLog(text):
     sys.stdout.flush()
 
 
+def formatException(ex):
+    template = "An exception of type {0} occurred. Arguments: {1!r}"
+    return template.format(type(ex).__name__, ex.args)
+
+
 def isValidPPN(ppn):
     rePattern = "^PPN\d+[0-9X]?"
     p = re.compile(rePattern, re.IGNORECASE)
@@ -88,13 +142,7 @@ def downloadMETSMODS(currentPPN):
     # download the METS/MODS file first in order to find the associated documents
     currentDownloadURL = metaDataDownloadURLPrefix + currentPPN + ".mets.xml"
     metsModsPath = tempDownloadPrefix + currentPPN + ".xml"
-    if runningFromWithinStabi:
-        proxy = urllib.request.ProxyHandler({})
-        opener = urllib.request.build_opener(proxy)
-        urllib.request.install_opener(opener)
-
-    urllib.request.urlretrieve(currentDownloadURL, metsModsPath)
-    return metsModsPath
+    return stabiFetch.downloadFile(httpSession, currentDownloadURL, metsModsPath, rateLimiter)
 
 
 def parseOriginInfo(child):
@@ -188,20 +236,21 @@ def processMETSMODS(currentPPN, metsModsPath):
     :param currentPPN: the current PPN
     :param metsModsPath: path to the METS/MODS file
 
-    :return: A dataframe with the parsing results.
+    :return: A dict with the parsing results (see analysisColumns).
     """
     # parse the METS/MODS file
-    tree = ET.parse(metsModsPath)
-    root = tree.getroot()
+    # the mods:mods node and the file groups are collected in a single pass
+    mets = metsIndex.METSIndex(metsModsPath)
     # only process possibly interesting nodes, i.e.,
     nodesOfInterest = ["originInfo", "titleInfo", "language", "name", "accessCondition"]
 
     # stores result dicts created by various parsing function (see below)
     resultDicts=[]
-    # master dictionary, later used for the creation of a dataframe
+    # master dictionary, i.e., the resulting record
     masterDict={'publisher':"",'place':"",'date':"",'title':"",'subTitle':"",'language':"",'aut':"",'rcp':"",'fnd':"",'access':"",'altoPaths':""}
-    # find all mods:mods nodes
-    for modsNode in root.iter(modsNamespace + 'mods'):
+    # we are only interested in the first occuring mods:mods node
+    modsNode = mets.mods
+    if modsNode is not None:
         for child in modsNode:
             # strip the namespace
             cleanedTag = child.tag.replace(modsNamespace, "")
@@ -228,104 +277,124 @@ def processMETSMODS(currentPPN, metsModsPath):
                     r = parseAccessCondition(child)
                     if r:
                         resultDicts.append(r)
-        # we are only interested in the first occuring mods:mods node
-        break
 
     # get all ALTO file references
     altoHrefs=[]
-    for fileSec in root.iter('{http://www.loc.gov/METS/}fileSec'):
-        for child in fileSec.iter('{http://www.loc.gov/METS/}fileGrp'):
-            currentUse=child.attrib['USE']
-            for fileNode in child.iter('{http://www.loc.gov/METS/}file'):
-                if currentUse == 'FULLTEXT':
-                    for fLocat in fileNode.iter('{http://www.loc.gov/METS/}FLocat'):
-                        if (fLocat.attrib['LOCTYPE'] == 'URL'):
-                            href = fLocat.attrib['{http://www.w3.org/1999/xlink}href']
-                            altoHrefs.append(href)
-    r["altoPaths"]=";".join(altoHrefs)
-    resultDicts.append(r)
+    for fileID, hrefs in mets.files('FULLTEXT'):
+        altoHrefs.extend(hrefs)
+    resultDicts.append({"altoPaths":";".join(altoHrefs)})
 
     # copy results to the master dictionary
     for result in resultDicts:
         for key in result:
-            masterDict[key]=[result[key]]
-    masterDict["ppn"]=[currentPPN]
-    return pd.DataFrame(data=masterDict)
+            masterDict[key]=result[key]
+    masterDict["ppn"]=currentPPN
+    return masterDict
+
+def processMETSMODSFile(job):
+    """
+    Processes a downloaded METS/MODS file and removes it afterwards (unless keepMETSMODS is set). Used by the worker
+    processes in pipelined mode.
+    :param job: a (PPN, path to the METS/MODS file) tuple
+    :return: a (PPN, record with the parsing results or None, error message or None) tuple
+    """
+    currentPPN, metsModsPath = job
+    try:
+        return (currentPPN, processMETSMODS(currentPPN, metsModsPath), None)
+    except Exception as ex:
+        return (currentPPN, None, formatException(ex))
+    finally:
+        if not keepMETSMODS and os.path.exists(metsModsPath):
+            os.remove(metsModsPath)
+
+def fetchAndProcessSequentially(ppns):
+    """
+    Downloads and processes the METS/MODS files of the given PPNs one after another.
+    :param ppns: a list of PPNs
+    :return: an iterator of (PPN, record with the parsing results or None, error message or None) tuples
+    """
+    for ppn in ppns:
+        try:
+            currentMETSMODS = downloadMETSMODS(ppn)
+        except Exception as ex:
+            yield (ppn, None, formatException(ex))
+            continue
+        # parsing errors are reported and the file is cleaned up the same way as in pipelined mode
+        yield processMETSMODSFile((ppn, currentMETSMODS))
+
+def fetchAndProcessPipelined(ppns):
+    """
+    Downloads the METS/MODS files of the given PPNs with maxConcurrentDownloads threads and hands every downloaded file
+    over to a pool of numberOfParserWorkers processes. At most maxDocumentsInFlight PPNs are in progress at the same time,
+    i.e., downloading stalls if the results are not consumed fast enough.
+    :param ppns: a list of PPNs
+    :return: an iterator of (PPN, record with the parsing results or None, error message or None) tuples in the order
+    of completion
+    """
+    results = queue.Queue()
+    inFlight = threading.BoundedSemaphore(maxDocumentsInFlight)
+    # the pool has to be created before any download thread is started
+    pool = multiprocessing.Pool(numberOfParserWorkers)
+    downloader = ThreadPoolExecutor(max_workers=maxConcurrentDownloads)
+
+    def download(ppn):
+        try:
+            metsModsPath = downloadMETSMODS(ppn)
+        except Exception as ex:
+            results.put((ppn, None, formatException(ex)))
+            return
+        pool.apply_async(processMETSMODSFile, ((ppn, metsModsPath),), callback=results.put,
+                         error_callback=lambda ex: results.put((ppn, None, formatException(ex))))
+
+    def feed():
+        for ppn in ppns:
+            inFlight.acquire()
+            downloader.submit(download, ppn)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        for i in range(len(ppns)):
+            result = results.get()
+            inFlight.release()
+            yield result
+    finally:
+        downloader.shutdown(wait=False)
+        pool.terminate()
+        pool.join()
 
 def convertSickleRecordsToDataFrame(sickleRecords):
-    availableKeys = dict()
-    # check for all keys present in the previously downloaded dataset
-    for i, r in enumerate(sickleRecords):
-        for k in r.keys():
-            if not k in availableKeys:
-                availableKeys[k] = 1
-            else:
-                availableKeys[k] = availableKeys[k] + 1
-
-    # print(availableKeys)
-
-    # create a dictionary for the records
-    values = dict()
-    # take the keys as they have found within the downloaded OAI records
-    keys = availableKeys.keys()
-    # for every metadata field, create an empty array as the content of the dictionary filed under the key 'k'
-    for k in keys:
-        values[k] = []
-    # in addition, store the PPN (the SBB's unique identifier for digitized content)
-    values["PPN"] = []
-
-    # under circumstances the identifier field of the DC records might be ambiguous, these records are listed here
-    ambiguousPPNRecords = []
-
-    # iterate over all saved records
-    for record in sickleRecords:
-        # we cannot iterate over the keys of record.metadata directly because not all records cotain the same fields,...
-        for k in keys:
-            # thus we check if the metadata field 'k' has been created above
-            if k in values:
-                # append the metadata fields to the dictionary created above
-                # if the metadata field 'k' is not available input "None" instead
-                if k in record:
-                    value = record.get(k)[0]
-                    if value:
-                        if value.isdigit():
-                            value = int(value)
-                        else:
-                            # p27 value=value.encode('ISO-8859-1')
-                            # value = value.encode('ISO-8859-1').decode("utf-8", "backslashreplace")
-                            pass
-                    values[k].append(value)
-                    # get the PPN and fix issues with it
-                    if k == "identifier":
-                        if len(record["identifier"]) > 1:
-                            # sometimes there is more than one identifier provided
-                            # check if it is a valid PPN
-                            candidates = [str(record.get(k)[0]), str(record.get(k)[1])]
-                            candidateIndex = 0
-                            candidateCount = 0
-                            i = 0
-                            for c in candidates:
-                                if c.startswith("PPN"):
-                                    candidateIndex = i
-                                    candidateCount += 1
-                                else:
-                                    i += 1
-                            ppn = str(record.get(k)[1])
-
-                            if candidateCount >= 1:
-                                # print("\tCANDIDATE CONFLICT SOLVED AS: " + candidates[candidateIndex])
-                                # print("\t\t" + str(record.get(k)[0]))
-                                # print("\t\t" + str(record.get(k)[1]))
-                                ambiguousPPNRecords.append(candidates)
-                                ppn = candidates[0]
-                        else:
-                            ppn = str(record.get(k)[0])
-                        values["PPN"].append(ppn)
-                else:
-                    values[k].append(np.nan)
-    # create a data frame
-    df = pd.DataFrame(values)
-    df['date'] = pd.to_numeric(df['date'], errors='ignore', downcast='integer')
+    """
+    Converts the metadata of OAI records into a dataframe with one row per record and one column per metadata field
+    holding the first value of the field (missing fields are NaN). In addition, the PPN of each record is determined from
+    its identifiers.
+    :param sickleRecords: a list of metadata dicts (field -> list of values)
+    :return: a (dataframe, list of ambiguous [identifier 1, identifier 2] pairs) tuple
+    """
+    # the records are converted into typed Arrow columns, see oaiRecordTable.py
+    df, identifiers = oaiRecordTable.recordsToDataFrame(sickleRecords)
+
+    # under circumstances the identifier field of the DC records might be ambiguous, i.e., if more than one identifier
+    # is provided and one of the first two is a PPN, the first one is taken and the record is listed as ambiguous,
+    # otherwise, the second identifier is taken
+    if identifiers is None:
+        identifiers = pa.nulls(len(df.index), pa.list_(pa.string()))
+    firstIdentifiers = oaiRecordTable.valuesAt(identifiers, 0)
+    secondIdentifiers = oaiRecordTable.valuesAt(identifiers, 1)
+    hasSeveralIdentifiers = pc.is_valid(secondIdentifiers)
+    hasPPNCandidate = pc.or_(pc.fill_null(pc.starts_with(firstIdentifiers, "PPN"), False),
+                             pc.fill_null(pc.starts_with(secondIdentifiers, "PPN"), False))
+    isAmbiguous = pc.and_(hasSeveralIdentifiers, hasPPNCandidate)
+    ppns = pc.if_else(pc.or_(pc.invert(hasSeveralIdentifiers), hasPPNCandidate), firstIdentifiers, secondIdentifiers)
+    df["PPN"] = ppns.to_pandas()
+    ambiguousPPNRecords = [list(pair) for pair in zip(pc.filter(firstIdentifiers, isAmbiguous).to_pylist(),
+                                                      pc.filter(secondIdentifiers, isAmbiguous).to_pylist())]
+
+    # dates are downcast to the smallest integer type if they are all numbers
+    try:
+        df['date'] = pd.to_numeric(df['date'], downcast='integer')
+    except (ValueError, TypeError):
+        pass
 
     return (df, ambiguousPPNRecords)
 
@@ -342,55 +411,50 @@ def createSupplementaryDirectories():
 
 
 if __name__ == "__main__":
-    # connect to a metadata repository
-    sickle = Sickle('https://oai.sbb.berlin/oai')
-    records = sickle.ListRecords(metadataPrefix='oai_dc', set='all')
-
     createSupplementaryDirectories()
 
     errorFile = open(errorLogFileName, "w")
     savedRecords = []
+    # the datestamps of the OAI records (in the order of savedRecords)
+    savedDatestamps = []
 
-    # maximum number of downloaded records
+    # maximum number of records downloaded per run and processed, an unfinished harvest is continued by the next run, i.e.,
+    # the record store is completed (and can be updated incrementally) after several runs
     # 2:15 h for 100k
     maxDocs = 1000  # 100 is just for testing, for more interesting results increase this value to 1000. ATTENTION! this will also take more time for reading data.
 
     if forceOverride:
         printLog("Starting OAI record download...")
-        # initialize some variables for counting and saving the metadata records
-        savedDocs = 0
-        
-        # save the records locally as we don't want to have to rely on a connection to the OAI-PMH server all the time
-        # iterate over all records until maxDocs is reached
-        # ATTENTION! if you re-run this cell, the contents of the savedRecords array will be altered!
+        # the records are saved locally page by page as we don't want to have to rely on a connection to the OAI-PMH server all the time
+        harvester = oaiHarvest.OAIHarvester(oaiEndpoint, oaiRecordStorePath, maxRetries, retryBackoffFactor, printLog)
         try:
-            for record in records:
-                # check if we reach the maximum document value
-                if savedDocs < maxDocs:
-                    savedDocs = savedDocs + 1
-                    # save the current record to the "savedRecords" array
-                    savedRecords.append(record.metadata)
-                    if savedDocs % 1000 == 0:
-                        printLog("Downloaded %d of %d records." % (savedDocs, maxDocs))
-                # if so, end the processing of the for-loop
-                else:
-                    break  # break ends the processing of the loop
+            numberOfRecords = harvester.harvest(oaiHarvestParams, maxDocs, incrementalHarvest)
+            printLog("Finished OAI download of " + str(numberOfRecords) + " new, changed, or deleted records.")
         except Exception as ex:
-            template = "An exception of type {0} occurred. Arguments: {1!r}"
-            message = template.format(type(ex).__name__, ex.args)
+            message = formatException(ex)
             errorFile.write(message + "\n")
-
-        printLog("Finished OAI download of " + str(len(savedRecords)) + " records.")
-        pickle.dump(savedRecords, open(metadataRecordPicklePath, "wb"))
-
-    # if savedRecords is empty, we have to load the data from the file system
-    if not savedRecords:
-        if os.path.exists(metadataRecordPicklePath):
-            printLog("Restoring metadata records from " + metadataRecordPicklePath)
-            savedRecords = pickle.load(open(metadataRecordPicklePath, "rb"))
-            printLog("Done.")
-        else:
-            printLog("Could not depickle metadata records. Re-run with forceOverride option.")
+            # the harvest is incomplete, it will be continued on the next run
+            if oaiHarvest.readState(oaiRecordStorePath) is None or not os.path.exists(oaiRecordStorePath):
+                errorFile.close()
+                printLog("OAI download failed, re-run to continue the download: " + message)
+                sys.exit(1)
+            # the records harvested so far are analysed
+            printLog("OAI download failed, continuing with the stored records (re-run to continue the download): " + message)
+
+    # if there is no record store, we have to import the data from a pickle
+    if not os.path.exists(oaiRecordStorePath) and os.path.exists(metadataRecordPicklePath):
+        printLog("Importing metadata records from " + metadataRecordPicklePath)
+        oaiHarvest.importPickle(metadataRecordPicklePath, oaiRecordStorePath)
+
+    if os.path.exists(oaiRecordStorePath):
+        printLog("Reading metadata records from " + oaiRecordStorePath)
+        # only the latest version of changed records is read, deleted records are skipped
+        for record in itertools.islice(oaiHarvest.readRecords(oaiRecordStorePath), maxDocs):
+            savedRecords.append(record["metadata"])
+            savedDatestamps.append(record["datestamp"])
+        printLog("Done.")
+    else:
+        printLog("Could not find metadata records. Re-run with forceOverride option.")
 
     results = convertSickleRecordsToDataFrame(savedRecords)
     df = results[0]
@@ -418,53 +482,58 @@ if __name__ == "__main__":
 
     # process all retrieved PPNs
     ppns = df["PPN"].values.tolist()
+    datestampOfPPN = dict(zip(ppns, savedDatestamps))
     #debug
     #ppns = df["PPN"].values.tolist()[0:1000]
 
 
+    analyticalDFPath=analysisTable.findAnalysisTable(analysisPrefix + "analyticaldf", analysisTableFormats)
     forceOverridePossible=False
-    if os.path.exists(analysisPrefix + "analyticaldf.xlsx"):
+    if analyticalDFPath:
         forceOverridePossible=True
 
     if forceOverride:#and forceOverridePossible:
     #if True:
         printLog("Processing METS/MODS documents.")
-        resultDFs=[]
+        sink=recordSink.RecordSink(recordSinkPaths[recordSinkFormat], recordSinkFormat, analysisColumns, recordSinkBatchSize, resumeProcessing)
+        if resumeProcessing:
+            # PPNs whose OAI record has changed since they have been stored are processed again
+            storedDatestamps=sink.storedValues("datestamp")
+            upToDatePPNs=set(ppn for ppn in ppns if ppn in storedDatestamps and storedDatestamps[ppn]==(datestampOfPPN.get(ppn) or ""))
+            if upToDatePPNs:
+                printLog("\tSkipping %i already processed and unchanged PPNs." % len(upToDatePPNs))
+                ppns=[ppn for ppn in ppns if ppn not in upToDatePPNs]
         processedDocs=0
         maxDocs=len(ppns)
-        for ppn in ppns:
-            currentMETSMODS = None
+        if pipelinedProcessing:
+            printLog("\tDownloading with %i threads, parsing with %i processes." % (maxConcurrentDownloads, numberOfParserWorkers))
+            processedPPNs = fetchAndProcessPipelined(ppns)
+        else:
+            processedPPNs = fetchAndProcessSequentially(ppns)
+        for ppn, currentRecord, error in processedPPNs:
             processedDocs+=1
             if processedDocs % 1000 == 0:
                 printLog("\tProcessed %d of %d METS/MODS documents." % (processedDocs, maxDocs))
-                # debug
-                #tempDF=pd.concat(resultDFs, sort=False)
-                #tempDF.to_excel(analysisPrefix + "analyticaldf_TEMP.xlsx", index=False)
-            try:
-                # debug
-                #ppn="PPN74616453X"
-                currentMETSMODS = downloadMETSMODS(ppn)
-            except Exception as ex:
-                template = "An exception of type {0} occurred. Arguments: {1!r}"
-                message = template.format(type(ex).__name__, ex.args)
-                errorFile.write(ppn + "\t" + message + "\n")
-            if currentMETSMODS:
-                currentDF=processMETSMODS(ppn, currentMETSMODS)
-                #debug
-                #currentDF.to_csv(analysisPrefix + "debug.csv",sep=';',index=False)
-                resultDFs.append(currentDF)
-                #raise (SystemExit)
-                if not keepMETSMODS:
-                    os.remove(currentMETSMODS)
-
-        analyticalDF=pd.concat(resultDFs,sort=False)
+            if error:
+                errorFile.write(ppn + "\t" + error + "\n")
+            else:
+                currentRecord["datestamp"]=datestampOfPPN.get(ppn)
+                sink.write(currentRecord)
+
+        # PPNs whose OAI records have been deleted are removed
+        analyticalDF=sink.read()
+        analyticalDF=analyticalDF[analyticalDF["ppn"].isin(set(df["PPN"].values.tolist()))]
+        sink.close()
         # store the results permanently
-        analyticalDF.to_csv(analysisPrefix + "analyticaldf.csv",sep=';',index=False)
-        analyticalDF.to_excel(analysisPrefix + "analyticaldf.xlsx", index=False)
+        for path in analysisTable.writeAnalysisTable(analyticalDF, analysisPrefix + "analyticaldf", analysisTableFormats):
+            printLog("Saved METS/MODS analysis table to: " + path)
 
     else:
-        printLog("Read METS/MODS analysis table from: "+analysisPrefix + "analyticaldf.xlsx")
-        analyticalDF=pd.read_excel(analysisPrefix + "analyticaldf.xlsx")
+        if not analyticalDFPath:
+            printLog("Could not find a METS/MODS analysis table. Re-run with forceOverride option.")
+            sys.exit(1)
+        printLog("Read METS/MODS analysis table from: " + analyticalDFPath)
+        analyticalDF=analysisTable.readAnalysisTable(analyticalDFPath)
 
     print(analyticalDF.columns)
 
@@ -488,7 +557,7 @@ if __name__ == "__main__":
     printLog("Rows in ocrDF: %i" % len(ocrDF.index))
     printLog("Rows in joinedDF: %i" % len(joinedDF.index))
 
-    joinedDF.to_excel(analysisPrefix + "joinedDF.xlsx", index=False)
+    analysisTable.writeAnalysisTable(joinedDF, analysisPrefix + "joinedDF", analysisTableFormats)
 
     # finally, clean up
     errorFile.close()
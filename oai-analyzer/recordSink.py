@@ -0,0 +1,234 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# streaming storage of the per-PPN records created by oai-analyzer.py
+# records are buffered and appended in batches to a SQLite table, a CSV file, or a directory of Parquet files. every batch
+# is a checkpoint, i.e., after an interrupted run, processedPPNs() tells which PPNs do not have to be processed again.
+
+import os
+import csv
+import sqlite3
+
+# supported formats
+SQLITE = "sqlite"
+CSV = "csv"
+PARQUET = "parquet"
+# name of the table in SQLite databases
+TABLE_NAME = "analyticaldf"
+# delimiter of CSV files (the same as used by oai-analyzer.py for all other CSV files)
+CSV_DELIMITER = ";"
+
+
+class RecordSink(object):
+    """
+    Appends records (dicts) to a SQLite table, a CSV file, or a directory of Parquet files (one file per batch). Keys of
+    a record which are not among the columns yet are added as new columns, all values are stored as text.
+    """
+    def __init__(self, path, format=SQLITE, columns=None, batchSize=1000, resume=True):
+        """
+        :param path: the path to the SQLite database, the CSV file, or the directory of the Parquet files
+        :param format: SQLITE, CSV, or PARQUET
+        :param columns: the list of initial columns, has to contain "ppn", columns of former runs and new keys of the
+        written records are appended
+        :param batchSize: the number of records buffered before they are written
+        :param resume: if True, records of former runs are kept, otherwise, the sink is emptied
+        """
+        if format not in (SQLITE, CSV, PARQUET):
+            raise ValueError("Unknown record sink format: %s" % format)
+        self.path = path
+        self.format = format
+        self.columns = list(columns)
+        self.batchSize = batchSize
+        self.buffer = []
+        self.numberOfParts = 0
+        if not resume:
+            self._remove()
+        if format == SQLITE:
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            columnDefinitions = ", ".join('"%s" TEXT' % c for c in self.columns if c != "ppn")
+            with self.conn:
+                self.conn.execute('CREATE TABLE IF NOT EXISTS %s (ppn TEXT PRIMARY KEY, %s);' % (TABLE_NAME, columnDefinitions))
+                # tables created with fewer columns are extended
+                existingColumns = [row[1] for row in self.conn.execute("PRAGMA table_info(%s);" % TABLE_NAME)]
+                for c in self.columns:
+                    if c not in existingColumns:
+                        self.conn.execute('ALTER TABLE %s ADD COLUMN "%s" TEXT;' % (TABLE_NAME, c))
+            self.columns += [c for c in existingColumns if c not in self.columns]
+        elif format == CSV:
+            self._repairCSV()
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    header = next(csv.reader(f, delimiter=CSV_DELIMITER))
+                # columns added by former runs are kept, files written without some of the current columns (e.g., by
+                # former versions) are rewritten with the missing values set to ""
+                self.columns += [c for c in header if c not in self.columns]
+                if header != self.columns:
+                    self._rewriteCSV(self.columns)
+        elif format == PARQUET:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            import pyarrow.parquet as pq
+            parts = self._parquetParts()
+            self.numberOfParts = len(parts)
+            # the parts may differ in their columns
+            for part in parts:
+                self.columns += [c for c in pq.read_schema(part).names if c not in self.columns]
+
+    def _remove(self):
+        if self.format == PARQUET:
+            for part in self._parquetParts():
+                os.remove(part)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _parquetParts(self):
+        if not os.path.exists(self.path):
+            return []
+        return sorted(os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith(".parquet"))
+
+    def _repairCSV(self):
+        # an interrupted write may have left an incomplete last line which is removed
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            content = f.read()
+            if content and not content.endswith(b"\n"):
+                f.truncate(content.rfind(b"\n") + 1)
+
+    def _rewriteCSV(self, columns):
+        # the CSV file is rewritten with the given header, missing values of former rows are ""
+        tempPath = self.path + ".tmp"
+        with open(self.path, "r", encoding="utf-8", newline="") as f, open(tempPath, "w", encoding="utf-8", newline="") as out:
+            writer = csv.DictWriter(out, columns, restval="", delimiter=CSV_DELIMITER)
+            writer.writeheader()
+            writer.writerows(csv.DictReader(f, delimiter=CSV_DELIMITER))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tempPath, self.path)
+
+    def _addColumns(self, newColumns):
+        # buffered records have been created with the former columns, hence, they are written first
+        self.flush()
+        if self.format == SQLITE:
+            with self.conn:
+                for c in newColumns:
+                    self.conn.execute('ALTER TABLE %s ADD COLUMN "%s" TEXT;' % (TABLE_NAME, c))
+        elif self.format == CSV and os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._rewriteCSV(self.columns + newColumns)
+        self.columns += newColumns
+
+    def processedPPNs(self):
+        """
+        :return: a set of the PPNs already stored in the sink
+        """
+        return set(self.storedValues("ppn"))
+
+    def storedValues(self, column):
+        """
+        :param column: a column of the sink
+        :return: a dict mapping every PPN stored in the sink to its (latest) value of the column, missing values are ""
+        """
+        values = dict()
+        if self.format == SQLITE:
+            for ppn, value in self.conn.execute('SELECT ppn, "%s" FROM %s;' % (column, TABLE_NAME)):
+                values[ppn] = value if value is not None else ""
+        elif self.format == CSV:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8", newline="") as f:
+                    for row in csv.DictReader(f, delimiter=CSV_DELIMITER):
+                        values[row["ppn"]] = row.get(column) or ""
+        else:
+            import pyarrow.parquet as pq
+            for part in self._parquetParts():
+                # parts written before the column has been added do not contain it
+                if column in pq.read_schema(part).names:
+                    table = pq.read_table(part, columns=["ppn", column]).to_pydict()
+                    ppns, partValues = table["ppn"], table[column]
+                else:
+                    ppns = pq.read_table(part, columns=["ppn"]).column("ppn").to_pylist()
+                    partValues = [None] * len(ppns)
+                for ppn, value in zip(ppns, partValues):
+                    values[ppn] = value if value is not None else ""
+        return values
+
+    def write(self, record):
+        """
+        Buffers a record, the buffer is written once it holds batchSize records.
+        :param record: a dict, keys which are not part of the columns are added as new columns
+        """
+        newColumns = [k for k in record if k not in self.columns]
+        if newColumns:
+            self._addColumns(newColumns)
+        self.buffer.append([record.get(c) for c in self.columns])
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered records.
+        """
+        if not self.buffer:
+            return
+        if self.format == SQLITE:
+            placeholders = ",".join("?" * len(self.columns))
+            quotedColumns = ",".join('"%s"' % c for c in self.columns)
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO %s (%s) VALUES (%s);' % (TABLE_NAME, quotedColumns, placeholders), self.buffer)
+        elif self.format == CSV:
+            writeHeader = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f, delimiter=CSV_DELIMITER)
+                if writeHeader:
+                    writer.writerow(self.columns)
+                writer.writerows(self.buffer)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_arrays([pa.array([row[i] for row in self.buffer], type=pa.string()) for i in range(len(self.columns))],
+                                         names=self.columns)
+            partPath = os.path.join(self.path, "part-%05i.parquet" % self.numberOfParts)
+            # the part is written under a temporary name first, hence, incomplete parts are never read
+            pq.write_table(table, partPath + ".tmp")
+            os.replace(partPath + ".tmp", partPath)
+            self.numberOfParts += 1
+        self.buffer = []
+
+    def read(self):
+        """
+        :return: all stored records as a pandas dataframe, if a PPN has been stored more than once, its latest record is
+        returned
+        """
+        import pandas as pd
+        self.flush()
+        if self.format == SQLITE:
+            return pd.read_sql_query("SELECT %s FROM %s;" % (",".join('"%s"' % c for c in self.columns), TABLE_NAME), self.conn)
+        elif self.format == CSV:
+            if not os.path.exists(self.path):
+                return pd.DataFrame(columns=self.columns)
+            df = pd.read_csv(self.path, sep=CSV_DELIMITER, dtype=str, keep_default_na=False)
+            return df.drop_duplicates("ppn", keep="last").reset_index(drop=True)
+        else:
+            parts = self._parquetParts()
+            if not parts:
+                return pd.DataFrame(columns=self.columns)
+            df = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+            return df.drop_duplicates("ppn", keep="last").reset_index(drop=True)
+
+    def close(self):
+        self.flush()
+        if self.format == SQLITE:
+            self.conn.close()
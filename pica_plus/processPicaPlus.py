@@ -12,8 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys
 import os
+import re
+import shutil
+import multiprocessing
 from datetime import datetime
 
 # add fields of interest to the following list, only this field will be extracted
@@ -43,12 +45,323 @@ outputTextFilePathSuffix="out.txt"
 outputTextFilePaths={"eng":[analysisPrefix+"/eng_"+outputTextFilePathSuffix,None],"ger":[analysisPrefix+"/ger_"+outputTextFilePathSuffix,None],"lat":[analysisPrefix+"/lat_"+outputTextFilePathSuffix,None],"fre":[analysisPrefix+"/fre_"+outputTextFilePathSuffix,None],"ita":[analysisPrefix+"/ita_"+outputTextFilePathSuffix,None],"spa":[analysisPrefix+"/spa_"+outputTextFilePathSuffix,None],"por":[analysisPrefix+"/por_"+outputTextFilePathSuffix,None],"dut":[analysisPrefix+"/dut_"+outputTextFilePathSuffix,None],"swe":[analysisPrefix+"/swe_"+outputTextFilePathSuffix,None],"dan":[analysisPrefix+"/dan_"+outputTextFilePathSuffix,None],"nor":[analysisPrefix+"/nor_"+outputTextFilePathSuffix,None],"ice":[analysisPrefix+"/ice_"+outputTextFilePathSuffix,None],"fry":[analysisPrefix+"/fry_"+outputTextFilePathSuffix,None],"None":[analysisPrefix+"/"+outputTextFilePathSuffix,None]}
 # path to the statistics file
 statisticsFilePath=analysisPrefix+"/statistics.txt"
+# if True, one row per record is written to Parquet files partitioned by language (requires pyarrow)
+createParquetOutput=False
+# base directory of the Parquet files, each language is stored in a sub-directory named "language=<language code>"
+parquetOutputPath=analysisPrefix+"/parquet/"
+# number of records per row group of the Parquet files
+parquetRowGroupSize=100000
 
 # the fields of interest indicate the fields that have to be extracted, please note that 003@ and 010@ must not be removed because these fields contain
 # the unique ID of the records and its language
 fieldsOfInterest=['003@','028A','028B','021A','021B','033A','010@','019@','011@']
 # enables verbose output during processing
 verbose = True
+# the Pica+ files are read in blocks of this size (in bytes)
+readBufferSize = 16 * 1024 * 1024
+# number of worker processes, each worker processes one chunk of a Pica+ file at a time (1 processes all chunks sequentially)
+numberOfWorkers = 1
+# the Pica+ files are split into chunks of approximately this size (in bytes), chunks always start at a record separator
+chunkSize = 256 * 1024 * 1024
+# temporary directory for the outputs of the chunks, they are merged into the output files at the end
+shardDir = analysisPrefix+"/shards/"
+
+# separators of the Pica+ format
+RECORD_SEPARATOR = b'\x1d'
+FIELD_SEPARATOR = b'\x1e'
+SUBFIELD_SEPARATOR = '\x1f'
+# fields end with a line break and/or a field separator
+fieldSplitPattern = re.compile(b'[\r\n\x1e]+')
+# the first year in the year of publication
+yearPattern = re.compile('\\d{4}')
+
+def readRecords(picaPlusFile, tags=None, bufferSize=readBufferSize, start=0, end=None):
+    """
+    Reads a Pica+ file (or a chunk of it) block by block and splits it into records and fields.
+    :param picaPlusFile: path to the Pica+ file
+    :param tags: an optional collection of field tags (e.g., ['003@','021A']), other fields are skipped without decoding,
+    occurrences of repeatable fields (e.g., '028B/01') are included
+    :param bufferSize: the size of the blocks read at once (in bytes)
+    :param start: the offset of the first byte to read, should be the offset of a record separator (see findChunks())
+    :param end: the offset after the last byte to read (None reads until the end of the file)
+    :return: an iterator of records, each record is a list of (tag, list of subfields) tuples, e.g.,
+    ('028A', ['dPaul', 'aCelan', '0gnd/118519859'])
+    """
+    with open(picaPlusFile, "rb") as f:
+        f.seek(start)
+        position = start
+        remainder = b""
+        while end is None or position < end:
+            size = bufferSize if end is None else min(bufferSize, end - position)
+            block = f.read(size)
+            if not block:
+                break
+            position += len(block)
+            records = (remainder + block).split(RECORD_SEPARATOR)
+            # the last record may be incomplete, it is completed by the next block
+            remainder = records.pop()
+            for record in records:
+                fields = parseRecord(record, tags)
+                if fields is not None:
+                    yield fields
+        fields = parseRecord(remainder, tags)
+        if fields is not None:
+            yield fields
+
+def parseRecord(record, tags=None):
+    """
+    Splits a record into its fields. Every field starts with its tag followed by a blank and the subfields separated by
+    \x1f, e.g., b'028A \x1fdPaul\x1faCelan'.
+    :param record: the record as bytes (without record separator)
+    :param tags: an optional collection of field tags, other fields are skipped without decoding, the tags are compared
+    without occurrence, i.e., '028B' includes '028B/01'
+    :return: a list of (tag, list of subfields) tuples or None if the record is empty, the tags include the occurrence
+    """
+    fields = []
+    empty = True
+    for field in fieldSplitPattern.split(record):
+        if not field.strip():
+            continue
+        empty = False
+        # the tag without occurrence
+        tag = field[:4].decode('utf-8', "replace")
+        if tags is not None and tag not in tags:
+            continue
+        # the tag is separated from the subfields by a blank and the first subfield separator
+        content = field.decode('utf-8', "replace").split(" " + SUBFIELD_SEPARATOR, 1)
+        if len(content) < 2:
+            fields.append((content[0].strip(), []))
+        else:
+            fields.append((content[0].strip(), content[1].strip().split(SUBFIELD_SEPARATOR)))
+    if empty:
+        return None
+    return fields
+
+def findChunks(picaPlusFile, chunkSize=chunkSize):
+    """
+    Splits a Pica+ file into chunks of approximately chunkSize bytes. Every chunk but the first starts at a record separator,
+    hence, no record is split.
+    :param picaPlusFile: path to the Pica+ file
+    :param chunkSize: the approximate size of a chunk (in bytes)
+    :return: a list of (start, end) offsets
+    """
+    fileSize = os.path.getsize(picaPlusFile)
+    boundaries = [0]
+    with open(picaPlusFile, "rb") as f:
+        offset = chunkSize
+        while offset < fileSize:
+            f.seek(offset)
+            # search the next record separator
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    offset = fileSize
+                    break
+                i = block.find(RECORD_SEPARATOR)
+                if i >= 0:
+                    offset += i
+                    break
+                offset += len(block)
+            if offset < fileSize:
+                boundaries.append(offset)
+            offset += chunkSize
+    boundaries.append(fileSize)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)]
+
+class ParquetPartitionWriter(object):
+    """
+    Writes records as rows to Parquet files partitioned by language, i.e., <basePath>/language=<language code>/<partName>.parquet.
+    The rows are buffered per language and written in row groups of rowGroupSize rows. The partitions can be read as one
+    table, e.g., with pandas.read_parquet(parquetOutputPath) which restores the language column from the directory names.
+    """
+    def __init__(self, basePath, partName, rowGroupSize=parquetRowGroupSize):
+        """
+        :param basePath: the base directory of the partitions
+        :param partName: the file name (without extension) used in every partition, e.g., the number of the chunk
+        :param rowGroupSize: the number of rows per row group
+        """
+        # pyarrow is only needed if Parquet output has been enabled
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schema = pyarrow.schema([("ppn", pyarrow.string()),
+                                      ("title", pyarrow.string()),
+                                      ("authors", pyarrow.list_(pyarrow.string())),
+                                      ("author_gnds", pyarrow.list_(pyarrow.string())),
+                                      ("publisher", pyarrow.string()),
+                                      ("place", pyarrow.string()),
+                                      ("year", pyarrow.int32()),
+                                      ("country", pyarrow.string())])
+        self.basePath = basePath
+        self.partName = partName
+        self.rowGroupSize = rowGroupSize
+        self.buffers = dict()
+        self.writers = dict()
+
+    def write(self, language, row):
+        """
+        :param language: the language of the record ("None" if unknown)
+        :param row: a dict with the columns of the schema as returned by recordToRow()
+        """
+        buffer = self.buffers.get(language)
+        if buffer is None:
+            buffer = self.buffers[language] = []
+        buffer.append(row)
+        if len(buffer) >= self.rowGroupSize:
+            self._flush(language)
+
+    def _flush(self, language):
+        buffer = self.buffers[language]
+        if not buffer:
+            return
+        writer = self.writers.get(language)
+        if writer is None:
+            partitionPath = os.path.join(self.basePath, "language=" + language)
+            if not os.path.exists(partitionPath):
+                os.makedirs(partitionPath, exist_ok=True)
+            writer = self.writers[language] = self.pq.ParquetWriter(os.path.join(partitionPath, self.partName + ".parquet"), self.schema)
+        columns = [self.pa.array([row[name] for row in buffer], type=self.schema.field(name).type) for name in self.schema.names]
+        writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+        self.buffers[language] = []
+
+    def close(self):
+        for language in self.buffers:
+            self._flush(language)
+        for writer in self.writers.values():
+            writer.close()
+
+def parseYear(dateOfPublication):
+    """
+    :param dateOfPublication: the year of publication as given in 011@, e.g., "1871" or "[ca. 1850]"
+    :return: the first four-digit year found or None
+    """
+    m = yearPattern.search(dateOfPublication or "")
+    return int(m.group(0)) if m else None
+
+def recordToRow(record):
+    """
+    Converts a record as returned by readRecords() into one row with typed columns.
+    :param record: a list of (tag, list of subfields) tuples
+    :return: a (language, row) tuple, the row is a dict with the keys ppn, title, authors, author_gnds (None for authors
+    without GND ID), publisher, place, year, and country
+    """
+    language = "None"
+    row = {"ppn": None, "title": None, "authors": [], "author_gnds": [], "publisher": None, "place": None, "year": None, "country": None}
+    for tag, subtokens in record:
+        if tag == "003@":
+            row["ppn"] = str(subtokens[0])
+        elif tag == "010@":
+            language = str(subtokens[0][1:])
+        elif tag == "021A":
+            row["title"] = handle021a(subtokens)
+        # 028B is repeatable, its occurrences are tagged 028B/01, 028B/02, etc.
+        elif tag[:4] == "028A" or tag[:4] == "028B":
+            name, gnd = handle028a(subtokens)
+            row["authors"].append(name)
+            row["author_gnds"].append(gnd if gnd else None)
+        elif tag == "033A":
+            row["publisher"], row["place"] = handle033a(subtokens)
+        elif tag == "019@":
+            row["country"] = handle019a(subtokens)
+        elif tag == "011@":
+            row["year"] = parseYear(handle011AT(subtokens))
+    return (language, row)
+
+def shardPathOf(language, chunkNumber):
+    return shardDir + language + "_" + str(chunkNumber) + "_" + outputTextFilePathSuffix
+
+def processChunk(job):
+    """
+    Processes a chunk of a Pica+ file, the extracted fields are written to per-language shard files (see shardPathOf()).
+    :param job: a (chunk number, path to the Pica+ file, start, end) tuple
+    :return: a (chunk number, histogram of found languages, number of records) tuple
+    """
+    chunkNumber, picaPlusFile, start, end = job
+    shardFiles = dict()
+    if createTextOutput:
+        for language in outputTextFilePaths:
+            shardFiles[language] = open(shardPathOf(language, chunkNumber), "w", encoding="utf-8")
+    parquetWriter = None
+    if createParquetOutput:
+        parquetWriter = ParquetPartitionWriter(parquetOutputPath, "part-%05i" % chunkNumber)
+
+    # histogram of found languages
+    languageHist=dict()
+    numberOfRecords=0
+    # encoding is indicated in 001U as "0utf8"
+    ppn = ""
+    for record in readRecords(picaPlusFile, fieldsOfInterest, start=start, end=end):
+        numberOfRecords+=1
+        language="None"
+        if parquetWriter:
+            parquetWriter.write(*recordToRow(record))
+        for tag, subtokens in record:
+            # occurrences of repeatable fields (e.g., 028B/01) are only part of the Parquet output
+            if tag not in fieldsOfInterest:
+                continue
+            #TODO remove @ in certain sub-fields because it is used as a sorting indicator in PICA+
+            #('028A', ['dPaul', 'aCelan', '9131811533', 'dPaul', 'aCelan', 'E1920', 'F1970', '0gnd/118519859'])
+            outputLine=""
+            if tag=="010@":
+                # 010@  Sprache (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/1500.pdf)
+                language=str(subtokens[0][1:])
+                if not language in languageHist:
+                    languageHist[language]=1
+                else:
+                    languageHist[language]=languageHist[language]+1
+            elif tag=="003@":
+                # 003@ the ID of the record (the PPN number)
+                # override the last seen PPN in case we have to deal with a new record
+                ppn=str(subtokens[0])
+            elif tag=="021A":
+                # 021A  Hauptsachtitel (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/4000.pdf)
+                r=handle021a(subtokens)
+                outputLine=ppn + '\t' +tag + '\t' + r
+            elif tag=="028A":
+                # 028A  1. Verfasser (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/3000.pdf)
+                r=handle028a(subtokens)
+                # if a GND is has been found add it to the name following after @
+                if r[1]:
+                    outputLine=ppn + '\t' +tag + '\t' + r[0] + '@' +r[1]
+                else:
+                    outputLine = ppn + '\t' + tag + '\t' + r[0]
+            elif tag=="033A":
+                # 033A  Ort und Verlag (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/4030.pdf)
+                r=handle033a(subtokens)
+                # if a GND is has been found add it to the name following after @
+                if r[1]:
+                    outputLine=ppn + '\t' +tag + '\t' + r[0] + '@' +r[1]
+                else:
+                    outputLine = ppn + '\t' + tag + '\t' + r[0]
+            elif tag=="019@":
+                # 019@  Erscheinungsland (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/1700.pdf)
+                r=handle019a(subtokens)
+                outputLine = ppn + '\t' + tag + '\t' + r
+            elif tag=="011@":
+                # 011@ (Erscheinungsjahr) (https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/1100.pdf)
+                r=handle011AT(subtokens)
+                if not r:
+                    r="s.a."
+                outputLine = ppn + '\t' + tag + '\t' + r
+            else:
+                outputLine=ppn + "\t" +tag+"\t"+str(subtokens)
+
+            if verbose:
+                #print(outputLine)
+                pass
+
+            if createTextOutput:
+                if language in shardFiles:
+                    shardFiles[language].write(outputLine+"\n")
+                else:
+                    shardFiles["None"].write(outputLine + "\n")
+
+    for language in shardFiles:
+        shardFiles[language].close()
+    if parquetWriter:
+        parquetWriter.close()
+    return (chunkNumber, languageHist, numberOfRecords)
 
 def createSupplementaryDirectories():
     if not os.path.exists(analysisPrefix):
@@ -145,155 +458,53 @@ def handle011AT(tokens):
 if __name__ == "__main__":
     startTime = str(datetime.now())
 
-    txtFile=None
-    if createTextOutput:
+    if createTextOutput or createParquetOutput:
         createSupplementaryDirectories()
-        for language in outputTextFilePaths:
-            f=open(outputTextFilePaths[language][0],"w",encoding="utf-8")
-            outputTextFilePaths[language][1]=f
-
-    # histogram of found languages
+    if createTextOutput:
+        if not os.path.exists(shardDir):
+            os.mkdir(shardDir)
+    if createParquetOutput:
+        # the parts of a former run would be read as part of the dataset
+        if os.path.exists(parquetOutputPath):
+            shutil.rmtree(parquetOutputPath)
+        os.mkdir(parquetOutputPath)
+
+    # split all Pica+ files into chunks which can be processed independently
+    jobs=[]
+    for picaPlusFile in picaPlusFilePaths:
+        for start, end in findChunks(picaPlusFile):
+            jobs.append((len(jobs), picaPlusFile, start, end))
+    print("Processing %i chunks of %i files with %i worker(s)."%(len(jobs),len(picaPlusFilePaths),numberOfWorkers))
+
+    if numberOfWorkers > 1:
+        pool = multiprocessing.Pool(numberOfWorkers)
+        results = pool.imap(processChunk, jobs)
+    else:
+        pool = None
+        results = map(processChunk, jobs)
+
+    # merge the histograms of found languages and the number of records of all chunks (in the order of the chunks)
     languageHist=dict()
     numberOfRecords=0
-
-    # process all Pica+ files sequentially
-    for picaPlusFile in picaPlusFilePaths:
-        with open(picaPlusFile, "rb") as f:
-            byte = f.read(1)
-            i = 0
-            unicodeHot = False
-            lastUnicodeMarker = None
-            last = None
-            fieldSeparator = False
-
-            currentLine = ""
-            # encoding is indicated in 001U as "0utf8"
-
-            ppn = ""
-            language="None"
-            while byte != b"":
-                # Do stuff with byte.
-
-                byte = f.read(1)
-                # debug (print all seen bytes for a given PPN)
-                if ppn=="084216779X":
-                    print(str(byte)+"\t"+str(int.from_bytes(byte,sys.byteorder)))
-                i += 1
-
-                # if in unicode processing mode, compose 2 byte unicode character
-                if unicodeHot:
-                    bytestream = last + lastUnicodeMarker + byte
-                    currentLine = currentLine[:-1] + bytestream.decode('utf-8', "replace")
-
-                # if we find a \r\n, we have a new line
-                if (byte == b'\n' and last == b'\r') or (byte == b'\x1e' and last == b'\n'):
-                    #print(currentLine)
-                    # split must be based on b'\x1f'
-                    currentLine = currentLine.replace("\x1e", "")
-                    #tokens = currentLine.replace('\x1f', "\t").split("\t")
-                    tokens = currentLine.split("\t")
-                    # remove whitespaces etc.
-                    tokens=list(map(str.strip, tokens))
-                    #TODO remove @ in certain sub-fields because it is used as a sorting indicator in PICA+
-                    #['028A', 'dPaul\x1faCelan\x1f9131811533\x1fdPaul\x1faCelan\x1fE1920\x1fF1970\x1f0gnd/118519859']
-
-
-                    if tokens[0] in fieldsOfInterest:
-                        outputLine=""
-                        subtokens=tokens[1].split('\x1f')
-                        if tokens[0]=="010@":
-                            # 010@  Sprache (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/1500.pdf)
-                            language=str(subtokens[0][1:])
-                            if not language in languageHist:
-                                languageHist[language]=1
-                            else:
-                                languageHist[language]=languageHist[language]+1
-                        elif tokens[0]=="003@":
-                            # 003@ the ID of the record (the PPN number)
-                            # override the last seen PPN in case we have to deal with a new record
-                            ppn=str(subtokens[0])
-                        elif tokens[0]=="021A":
-                            # 021A  Hauptsachtitel (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/4000.pdf)
-                            r=handle021a(subtokens)
-                            outputLine=ppn + '\t' +tokens[0] + '\t' + r
-                        elif tokens[0]=="028A":
-                            # 028A  1. Verfasser (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/3000.pdf)
-                            r=handle028a(subtokens)
-                            # if a GND is has been found add it to the name following after @
-                            if r[1]:
-                                outputLine=ppn + '\t' +tokens[0] + '\t' + r[0] + '@' +r[1]
-                            else:
-                                outputLine = ppn + '\t' + tokens[0] + '\t' + r[0]
-                        elif tokens[0]=="033A":
-                            # 033A  Ort und Verlag (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/4030.pdf)
-                            r=handle033a(subtokens)
-                            # if a GND is has been found add it to the name following after @
-                            if r[1]:
-                                outputLine=ppn + '\t' +tokens[0] + '\t' + r[0] + '@' +r[1]
-                            else:
-                                outputLine = ppn + '\t' + tokens[0] + '\t' + r[0]
-                        elif tokens[0]=="019@":
-                            # 019@  Erscheinungsland (see https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/1700.pdf)
-                            r=handle019a(subtokens)
-                            outputLine = ppn + '\t' + tokens[0] + '\t' + r
-                        elif tokens[0]=="011@":
-                            # 011@ (Erscheinungsjahr) (https://www.gbv.de/bibliotheken/verbundbibliotheken/02Verbund/01Erschliessung/02Richtlinien/01KatRicht/1100.pdf)
-                            r=handle011AT(subtokens)
-                            if not r:
-                                r="s.a."
-                            outputLine = ppn + '\t' + tokens[0] + '\t' + r
-                        else:
-                            outputLine=ppn + "\t" +tokens[0]+"\t"+str(subtokens)
-
-                        if verbose:
-                            #print(outputLine)
-                            pass
-
-                        if createTextOutput:
-                            if language in outputTextFilePaths:
-                                outputTextFilePaths[language][1].write(outputLine+"\n")
-                            else:
-                                outputTextFilePaths["None"][1].write(outputLine + "\n")
-                    currentLine = ""
-
-                # if we find a space followed by \xlf, we have found a field separator
-                if byte == b'\x1f' and last == b' ':
-                    # currentLine = currentLine +"\t"
-                    byte = b'\t'
-
-                # if we find a \n followed by \x1d, we have found a record separator
-                if byte == b'\x1d' and last == b'\n':
-                    if verbose:
-                        #print("*NEW_RECORD*")
-                        pass
-                    numberOfRecords+=1
-                    language="None"
-
-                # take care of 2 byte unicode characters, toggle unicode processing mode, see above
-                #b'\xe2'	226
-                #b'\x80'	128
-                #b'\x99'	153
-                if byte == b'\xcc' or byte == b'\xc3' or byte == b'\xe2':
-                    unicodeHot = True
-                    lastUnicodeMarker = byte
-                else:
-                    if byte:
-                        last = byte
-                    else:
-                        last = b' '
-                    # ignore output for \r
-                    if not byte == b'\r':
-                        if not byte == b'\n':
-                            if byte:
-                                if not unicodeHot:
-                                    currentLine = currentLine + byte.decode('utf-8',
-                                                                            "replace")  # see https://docs.python.org/3/howto/unicode.html#the-unicode-type
-                                else:
-                                    unicodeHot = False
-
+    for chunkNumber, chunkLanguageHist, chunkNumberOfRecords in results:
+        if verbose:
+            print("Finished chunk %i of %i."%(chunkNumber+1,len(jobs)))
+        numberOfRecords+=chunkNumberOfRecords
+        for language in chunkLanguageHist:
+            languageHist[language]=languageHist.get(language,0)+chunkLanguageHist[language]
+    if pool:
+        pool.close()
+        pool.join()
+
+    # concatenate the shards in the order of the chunks, i.e., the output files are the same as if processed sequentially
     if createTextOutput:
         for language in outputTextFilePaths:
-            outputTextFilePaths[language][1].close()
+            with open(outputTextFilePaths[language][0],"wb") as outputFile:
+                for job in jobs:
+                    shardPath=shardPathOf(language, job[0])
+                    with open(shardPath,"rb") as shardFile:
+                        shutil.copyfileobj(shardFile, outputFile)
+        shutil.rmtree(shardDir)
 
     sumOfLanguageRecords=0
     for language in languageHist:
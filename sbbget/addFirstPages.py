@@ -12,15 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import urllib.request
 import os
 from datetime import datetime
-import requests
 from PIL import Image
+import requests
+import stabiFetch
 
 # the maximum dimensions ot the thumbnail as a tuple (<width,height>) (aspect ratio remains intact)
 titlePageThumbnailSize=(512,512)
 errorLogFileName="./addFirstPages_error.log"
+# HTTP session reused for all downloads
+httpSession=stabiFetch.createSession()
 
 startTime = str(datetime.now())
 
@@ -47,11 +49,14 @@ for ppn in ppns:
             downloadedFile="./temp/PPN" + ppn + ".jpg"
             # skip already downloaded images
             if not os.path.exists(downloadedFile):
-                with open(downloadedFile, 'wb') as f:
-                    resp = requests.get(
-                        downloadLink.replace('%PPN%', ppn))
-                    print(downloadLink.replace('%PPN%', ppn))
-                    f.write(resp.content)
+                print(downloadLink.replace('%PPN%', ppn))
+                try:
+                    stabiFetch.downloadFile(httpSession, downloadLink.replace('%PPN%', ppn), downloadedFile)
+                except requests.HTTPError as ex:
+                    if ex.response is None or ex.response.status_code!=404:
+                        raise
+                    errorFile.write(str(datetime.now()) + "\t" + ppn + "\t" + "NOT EXISTENT" + "\n")
+                    continue
                 # quick'n'dirty fix, a 34 byte file is an error
                 statinfo = os.stat(downloadedFile)
                 if statinfo.st_size<=34:
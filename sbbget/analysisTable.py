@@ -0,0 +1,148 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# storage of analysis tables (pandas dataframes) such as the METS/MODS analysis table created by oai-analyzer.py
+# a table is saved under a base path (without file extension) in one or several formats, the file extension denotes the
+# format. Parquet, Feather (both require pyarrow), and SQLite are fast to write and read, CSV and Excel (requires openpyxl)
+# are meant as exports for other tools.
+
+import os
+import sqlite3
+import pandas as pd
+
+# supported formats
+PARQUET = "parquet"
+FEATHER = "feather"
+SQLITE = "sqlite"
+CSV = "csv"
+EXCEL = "excel"
+# file extension of each format, the formats are tried in this order if a table is searched
+FILE_EXTENSIONS = {PARQUET: ".parquet", FEATHER: ".feather", SQLITE: ".db", CSV: ".csv", EXCEL: ".xlsx"}
+# delimiter of CSV files (the same as used by oai-analyzer.py for all other CSV files)
+CSV_DELIMITER = ";"
+# Excel does not allow more characters in a cell, longer values are truncated in Excel exports
+EXCEL_MAX_CELL_LENGTH = 32767
+
+
+def formatOf(path):
+    """
+    :param path: the path to a table file
+    :return: the format of the file derived from its extension
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for format, formatExtension in FILE_EXTENSIONS.items():
+        if extension == formatExtension:
+            return format
+    raise ValueError("Unknown analysis table format: %s" % path)
+
+
+def tablePathOf(basePath, format):
+    """
+    :param basePath: the path of the table without file extension, e.g., "analysis/analyticaldf"
+    :param format: one of the supported formats
+    :return: the path of the table file in the given format
+    """
+    if format not in FILE_EXTENSIONS:
+        raise ValueError("Unknown analysis table format: %s" % format)
+    return basePath + FILE_EXTENSIONS[format]
+
+
+def tableNameOf(path):
+    # SQLite databases contain a single table named after the file
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def truncateLongValues(df):
+    """
+    :param df: a dataframe
+    :return: a copy of the dataframe in which all strings longer than EXCEL_MAX_CELL_LENGTH are truncated
+    """
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype == object and df[c].map(lambda v: isinstance(v, str) and len(v) > EXCEL_MAX_CELL_LENGTH).any():
+            df[c] = df[c].map(lambda v: v[:EXCEL_MAX_CELL_LENGTH] if isinstance(v, str) else v)
+    return df
+
+
+def writeAnalysisTable(df, basePath, formats=(PARQUET,)):
+    """
+    Saves a dataframe in the given formats. Every file is written under a temporary name first, hence, an interrupted
+    run never leaves an incomplete table behind.
+    :param df: the dataframe, its index is not saved
+    :param basePath: the path of the table without file extension
+    :param formats: a list of formats
+    :return: the list of the written paths
+    """
+    paths = []
+    df = df.reset_index(drop=True)
+    for format in formats:
+        path = tablePathOf(basePath, format)
+        # the extension is kept as some writers depend on it
+        tempPath = basePath + ".tmp" + FILE_EXTENSIONS[format]
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        if format == PARQUET:
+            df.to_parquet(tempPath, index=False)
+        elif format == FEATHER:
+            df.to_feather(tempPath)
+        elif format == SQLITE:
+            conn = sqlite3.connect(tempPath)
+            try:
+                df.to_sql(tableNameOf(path), conn, index=False)
+            finally:
+                conn.close()
+        elif format == CSV:
+            df.to_csv(tempPath, sep=CSV_DELIMITER, index=False)
+        else:
+            truncateLongValues(df).to_excel(tempPath, index=False, engine="openpyxl")
+        os.replace(tempPath, path)
+        paths.append(path)
+    return paths
+
+
+def readAnalysisTable(path, columns=None):
+    """
+    :param path: the path to a table file, its format is derived from the file extension
+    :param columns: a list of the columns to read, None reads all columns
+    :return: the table as a dataframe, missing values are NaN or None
+    """
+    format = formatOf(path)
+    if format == PARQUET:
+        return pd.read_parquet(path, columns=columns)
+    elif format == FEATHER:
+        return pd.read_feather(path, columns=columns)
+    elif format == SQLITE:
+        selection = ",".join('"%s"' % c for c in columns) if columns else "*"
+        conn = sqlite3.connect(path)
+        try:
+            return pd.read_sql_query('SELECT %s FROM "%s";' % (selection, tableNameOf(path)), conn)
+        finally:
+            conn.close()
+    elif format == CSV:
+        return pd.read_csv(path, sep=CSV_DELIMITER, usecols=columns, dtype=str)
+    else:
+        return pd.read_excel(path, usecols=columns)
+
+
+def findAnalysisTable(basePath, formats=(PARQUET,)):
+    """
+    :param basePath: the path of the table without file extension
+    :param formats: the preferred formats, all other formats are tried afterwards in the order of FILE_EXTENSIONS
+    :return: the path of the first existing table file or None if the table has not been saved in any format
+    """
+    for format in list(formats) + [f for f in FILE_EXTENSIONS if f not in formats]:
+        path = tablePathOf(basePath, format)
+        if os.path.exists(path):
+            return path
+    return None
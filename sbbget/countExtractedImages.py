@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import os
-import tarfile as TAR
+import illustrationArchive
 
 
 def findTARfiles(path):
@@ -37,17 +37,17 @@ if __name__ == '__main__':
     minExtract=1
     maxExtract=0
     for tarFile in tarFiles:
-        tarBall = TAR.open(tarFile, "r")
-        members=tarBall.getmembers()
-        numberOfExtractedIllustrations+=len(members)
-        if len(members)<minExtract:
-            minExtract=len(members)
-        if len(members)>maxExtract:
-            maxExtract=len(members)
+        # only reads the index of the .tar file if available
+        count=illustrationArchive.countIllustrations(tarFile)
+        numberOfExtractedIllustrations+=count
+        if count<minExtract:
+            minExtract=count
+        if count>maxExtract:
+            maxExtract=count
         i+=1
         if i%1000==0:
             print("Found %i extracted illustrations in %i files of %i. Continuing..."%(numberOfExtractedIllustrations,i,noTarFiles))
             print("Min: %i; Max: %i"%(minExtract,maxExtract))
         #debug
-        #print("%i members in %s"%(len(members),tarFile))
+        #print("%i members in %s"%(count,tarFile))
     print("Total number of files: %i"%numberOfExtractedIllustrations)
\ No newline at end of file
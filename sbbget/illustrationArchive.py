@@ -0,0 +1,194 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# indexed archives of extracted illustrations
+# the illustrations of a PPN are stored in an uncompressed .tar file as before, in addition, a tab-separated sidecar index
+# (<PPN>.tar.idx) lists every member with the offset and size of its data within the .tar file as well as its page, ALTO ID,
+# width, and height. counting the illustrations of an archive is a read of the index and any illustration can be read with
+# a single seek instead of scanning the whole .tar file.
+
+import io
+import os
+import tarfile as TAR
+import time
+
+# suffix of the sidecar index appended to the path of the .tar file
+INDEX_SUFFIX = ".idx"
+# the columns of the index in the order of the file
+INDEX_COLUMNS = ["name", "offset", "size", "page", "altoID", "width", "height"]
+# columns holding integer values
+INTEGER_COLUMNS = ["offset", "size", "width", "height"]
+
+
+def addBytesToTarBall(tarBall, arcName, data, mtime=None):
+    """
+    Appends an encoded illustration held in memory to a .tar file.
+    :param tarBall: the .tar file opened for writing
+    :param arcName: the name of the member, e.g., the path the illustration would have been saved to
+    :param data: the encoded illustration as bytes or a file-like object
+    :param mtime: the modification time of the member, defaults to now
+    :return: the TarInfo of the appended member
+    """
+    if isinstance(data, bytes):
+        data = io.BytesIO(data)
+    # the same member name tarBall.add(arcName) would have created
+    tarInfo = TAR.TarInfo(name=arcName.replace(os.sep, "/").lstrip("/"))
+    data.seek(0, os.SEEK_END)
+    tarInfo.size = data.tell()
+    data.seek(0)
+    tarInfo.mtime = mtime if mtime is not None else time.time()
+    tarInfo.mode = 0o644
+    tarBall.addfile(tarInfo, data)
+    return tarInfo
+
+
+def indexPathOf(tarPath):
+    return tarPath + INDEX_SUFFIX
+
+
+class IllustrationArchiveWriter(object):
+    """
+    Writes illustrations to a .tar file and creates its sidecar index. The index is written when the archive is closed,
+    hence, an index only exists for completely written archives.
+    """
+    def __init__(self, tarPath):
+        self.tarPath = tarPath
+        self.tarBall = TAR.open(tarPath, "w")
+        self.entries = []
+
+    def _addEntry(self, tarInfo, page, altoID, width, height):
+        # the data follows the header(s) of the member and is padded to a multiple of the block size
+        paddedSize = -(-tarInfo.size // TAR.BLOCKSIZE) * TAR.BLOCKSIZE
+        dataOffset = self.tarBall.offset - paddedSize
+        self.entries.append([tarInfo.name, dataOffset, tarInfo.size, page, altoID, width, height])
+
+    def addBytes(self, arcName, data, page, altoID, width, height, mtime=None):
+        """
+        Appends an encoded illustration held in memory.
+        :param arcName: the name of the member, e.g., the path the illustration would have been saved to
+        :param data: the encoded illustration as bytes or a file-like object
+        :param page: the page label of the illustration, e.g., "0001"
+        :param altoID: the ID of the illustration in the ALTO file
+        :param width: the width of the illustration
+        :param height: the height of the illustration
+        :param mtime: the modification time of the member, defaults to now
+        """
+        tarInfo = addBytesToTarBall(self.tarBall, arcName, data, mtime)
+        self._addEntry(tarInfo, page, altoID, width, height)
+
+    def addFile(self, path, page, altoID, width, height):
+        """
+        Appends an illustration saved in the file system under its path.
+        :param path: the path to the illustration
+        :param page: the page label of the illustration, e.g., "0001"
+        :param altoID: the ID of the illustration in the ALTO file
+        :param width: the width of the illustration
+        :param height: the height of the illustration
+        """
+        tarInfo = self.tarBall.gettarinfo(path)
+        with open(path, "rb") as f:
+            self.tarBall.addfile(tarInfo, f)
+        self._addEntry(tarInfo, page, altoID, width, height)
+
+    def close(self):
+        self.tarBall.close()
+        writeIndex(self.tarPath, self.entries)
+
+
+def writeIndex(tarPath, entries):
+    """
+    Writes the sidecar index of a .tar file.
+    :param tarPath: the path to the .tar file
+    :param entries: a list of rows in the order of INDEX_COLUMNS
+    """
+    indexPath = indexPathOf(tarPath)
+    with open(indexPath + ".part", "w", encoding="utf-8") as f:
+        f.write("\t".join(INDEX_COLUMNS) + "\n")
+        for entry in entries:
+            f.write("\t".join(str(value) for value in entry) + "\n")
+    os.replace(indexPath + ".part", indexPath)
+
+
+def readIndex(tarPath):
+    """
+    Reads the sidecar index of a .tar file.
+    :param tarPath: the path to the .tar file
+    :return: a list of dicts (keys as in INDEX_COLUMNS) or None if the archive has no index
+    """
+    indexPath = indexPathOf(tarPath)
+    if not os.path.exists(indexPath):
+        return None
+    entries = []
+    with open(indexPath, "r", encoding="utf-8") as f:
+        columns = f.readline().rstrip("\n").split("\t")
+        for line in f:
+            entry = dict(zip(columns, line.rstrip("\n").split("\t")))
+            for column in INTEGER_COLUMNS:
+                entry[column] = int(entry[column])
+            entries.append(entry)
+    return entries
+
+
+def buildIndex(tarPath, save=False):
+    """
+    Creates the index of a .tar file without sidecar index by scanning all of its members once. Page, ALTO ID, and
+    dimensions are unknown for such archives and left empty.
+    :param tarPath: the path to the .tar file
+    :param save: if True, the index is saved as sidecar index of the .tar file
+    :return: a list of dicts as returned by readIndex()
+    """
+    rows = []
+    with TAR.open(tarPath, "r") as tarBall:
+        for member in tarBall.getmembers():
+            if member.isreg():
+                rows.append([member.name, member.offset_data, member.size, "", "", -1, -1])
+    if save:
+        writeIndex(tarPath, rows)
+    return [dict(zip(INDEX_COLUMNS, row)) for row in rows]
+
+
+def readOrBuildIndex(tarPath):
+    entries = readIndex(tarPath)
+    if entries is None:
+        entries = buildIndex(tarPath)
+    return entries
+
+
+def countIllustrations(tarPath):
+    """
+    Counts the illustrations of an archive, i.e., counts the lines of its index if available or scans the .tar file otherwise.
+    :param tarPath: the path to the .tar file
+    :return: the number of illustrations
+    """
+    indexPath = indexPathOf(tarPath)
+    if os.path.exists(indexPath):
+        with open(indexPath, "rb") as f:
+            # the first line is the header
+            return sum(1 for _ in f) - 1
+    # the same members as listed by an index, i.e., regular files only
+    return len(buildIndex(tarPath))
+
+
+def readIllustration(tarFile, entry):
+    """
+    Reads the encoded data of a single illustration.
+    :param tarFile: the .tar file opened in binary mode (or its path)
+    :param entry: the index entry of the illustration as returned by readIndex()
+    :return: the encoded illustration as bytes
+    """
+    if isinstance(tarFile, str):
+        with open(tarFile, "rb") as f:
+            return readIllustration(f, entry)
+    tarFile.seek(entry["offset"])
+    return tarFile.read(entry["size"])
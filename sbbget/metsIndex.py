@@ -0,0 +1,95 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import xml.etree.ElementTree as ET
+
+# XML namespaces used in METS/MODS files
+metsNamespace = "{http://www.loc.gov/METS/}"
+modsNamespace = "{http://www.loc.gov/mods/v3}"
+xlinkNamespace = "{http://www.w3.org/1999/xlink}"
+
+
+class METSIndex(object):
+    """
+    Lookup tables of a METS/MODS file which are built in a single pass over the file, i.e.:
+    - fileID2physID: maps the ID of a file to the ID of the physical page (the innermost structMap div pointing to the file)
+    - physID2logicalID: maps the ID of a physical page to its logical ID as given by the smLinks of the structLink section
+    - titlePageLogID and titlePagePhysID: the logical and physical ID of the title page ("" if no title page is available)
+    - fileGroups: maps the USE attribute of each fileGrp to a list of (file ID, list of URLs) tuples in document order
+    - mods: the first mods:mods element of the file (or None)
+    - seenPhysIDs: an initially empty set of physical IDs, e.g., to keep track of already downloaded pages
+    """
+    def __init__(self, metsModsPath):
+        """
+        :param metsModsPath: path to the METS/MODS file
+        """
+        self.fileID2physID = dict()
+        self.physID2logicalID = dict()
+        self.titlePageLogID = ""
+        self.titlePagePhysID = ""
+        self.fileGroups = dict()
+        self.mods = None
+        self.seenPhysIDs = set()
+        self._parse(metsModsPath)
+
+    def _parse(self, metsModsPath):
+        # the first physical page linked to each logical ID
+        firstPhysIDOfLogicalID = dict()
+        # IDs of the currently open div elements
+        divStack = []
+        currentFiles = None
+        currentURLs = None
+
+        for event, elem in ET.iterparse(metsModsPath, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == metsNamespace + "div":
+                    divStack.append(elem.attrib.get('ID'))
+                    if elem.attrib.get('TYPE') == "title_page" and not self.titlePageLogID:
+                        self.titlePageLogID = elem.attrib['ID']
+                elif tag == metsNamespace + "fptr":
+                    if divStack:
+                        self.fileID2physID[elem.attrib['FILEID']] = divStack[-1]
+                elif tag == metsNamespace + "smLink":
+                    physID = elem.attrib[xlinkNamespace + 'to']
+                    logicalID = elem.attrib[xlinkNamespace + 'from']
+                    self.physID2logicalID[physID] = logicalID
+                    if logicalID not in firstPhysIDOfLogicalID:
+                        firstPhysIDOfLogicalID[logicalID] = physID
+                elif tag == metsNamespace + "fileGrp":
+                    currentFiles = self.fileGroups.setdefault(elem.attrib['USE'], [])
+                elif tag == metsNamespace + "file":
+                    currentURLs = []
+                    currentFiles.append((elem.attrib['ID'], currentURLs))
+                elif tag == metsNamespace + "FLocat":
+                    if elem.attrib.get('LOCTYPE') == 'URL':
+                        currentURLs.append(elem.attrib[xlinkNamespace + 'href'])
+            else:
+                if tag == metsNamespace + "div":
+                    divStack.pop()
+                    elem.clear()
+                elif tag in (metsNamespace + "file", metsNamespace + "smLink"):
+                    elem.clear()
+                elif tag == modsNamespace + "mods" and self.mods is None:
+                    # keep the complete subtree, it is needed for the MODS analysis
+                    self.mods = elem
+
+        self.titlePagePhysID = firstPhysIDOfLogicalID.get(self.titlePageLogID, "")
+
+    def files(self, use):
+        """
+        :param use: the USE attribute of a fileGrp, e.g., "FULLTEXT"
+        :return: a list of (file ID, list of URLs) tuples of the fileGrp
+        """
+        return self.fileGroups.get(use, [])
@@ -0,0 +1,378 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# resumable OAI-PMH harvesting shared by ppnHarvester.py and oai-analyzer.py
+# every page of a ListRecords response is appended to the record store as soon as it arrives. a page is a separate gzip
+# member containing one JSON record per line, i.e., the store is a valid gzip file and every page can be read on its own.
+# afterwards, the resumptionToken of the next page and the offsets of all pages (the page index) are saved to a state file
+# next to the store, hence, an interrupted harvest continues with the last saved token and at most one page is held in
+# memory, both during harvesting and reading.
+
+import os
+import gzip
+import json
+import pickle
+import sys
+import time
+from datetime import datetime
+import requests
+from sickle import Sickle, oaiexceptions
+from sickle.models import Record
+
+# XML namespace of OAI-PMH responses
+OAI_NAMESPACE = "{http://www.openarchives.org/OAI/2.0/}"
+# suffix of the state file appended to the path of the store
+STATE_SUFFIX = ".state.json"
+# compression level of the pages
+COMPRESSION_LEVEL = 6
+# number of records per page if a store is written at once (see compactStore() and importPickle())
+PAGE_SIZE = 1000
+
+
+def statePathOf(storePath):
+    return storePath + STATE_SUFFIX
+
+
+def readState(storePath):
+    """
+    :param storePath: the path to the record store
+    :return: the state of the last harvest as dict or None if no state has been saved
+    """
+    statePath = statePathOf(storePath)
+    if not os.path.exists(statePath):
+        return None
+    with open(statePath, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    # states saved before incremental harvesting was available
+    state.setdefault("requestParams", state["params"])
+    state.setdefault("lastDatestamp", None)
+    state.setdefault("deltaStart", None)
+    state.setdefault("pages", [])
+    if "compaction" in state:
+        # finish an interrupted compaction, the compacted store has been written completely (see compactStore())
+        if os.path.exists(storePath + ".part"):
+            os.replace(storePath + ".part", storePath)
+        state.update(state.pop("compaction"))
+        writeState(storePath, state)
+    return state
+
+
+def writeState(storePath, state):
+    """
+    Saves the state of a harvest, the state file is replaced atomically.
+    """
+    statePath = statePathOf(storePath)
+    with open(statePath + ".part", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(statePath + ".part", statePath)
+
+
+def encodePage(records):
+    """
+    :param records: a list of dicts as created by recordToDict()
+    :return: the compressed page
+    """
+    return gzip.compress("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def readPage(f, page):
+    """
+    :param f: the store opened in binary mode
+    :param page: an entry of the page index, i.e., an [offset, size, number of records] list
+    :return: the list of records of the page
+    """
+    f.seek(page[0])
+    return [json.loads(line) for line in gzip.decompress(f.read(page[1])).splitlines()]
+
+
+def writePages(f, records, pageSize=PAGE_SIZE):
+    """
+    Writes records in pages of pageSize records to a new store.
+    :param f: the store opened in binary mode
+    :param records: an iterable of dicts as created by recordToDict()
+    :return: the page index
+    """
+    pages = []
+
+    def writePage(pageRecords):
+        data = encodePage(pageRecords)
+        pages.append([f.tell(), len(data), len(pageRecords)])
+        f.write(data)
+
+    buffer = []
+    for record in records:
+        buffer.append(record)
+        if len(buffer) >= pageSize:
+            writePage(buffer)
+            buffer = []
+    if buffer:
+        writePage(buffer)
+    f.flush()
+    os.fsync(f.fileno())
+    return pages
+
+
+def listRecordPages(sickle, params, resumptionToken=None):
+    """
+    Requests ListRecords page by page.
+    :param sickle: a Sickle client
+    :param params: the parameters of the first request, e.g., {'metadataPrefix':'oai_dc','set':'all'}
+    :param resumptionToken: if given, the harvest continues with this token instead of sending params
+    :return: an iterator of (list of sickle Records, resumptionToken of the next page or None) tuples
+    """
+    while True:
+        if resumptionToken:
+            response = sickle.harvest(verb='ListRecords', resumptionToken=resumptionToken)
+        else:
+            response = sickle.harvest(verb='ListRecords', **params)
+        xml = response.xml
+        error = xml.find('.//' + OAI_NAMESPACE + 'error')
+        if error is not None:
+            code = error.attrib.get('code', 'UNKNOWN')
+            if code == 'noRecordsMatch':
+                return
+            # the same mapping of error codes to exceptions as used by sickle
+            description = error.text or ''
+            raise getattr(oaiexceptions, code[0].upper() + code[1:], oaiexceptions.OAIError)(description)
+        records = [Record(element) for element in xml.iterfind('.//' + OAI_NAMESPACE + 'record')]
+        tokenElement = xml.find('.//' + OAI_NAMESPACE + 'resumptionToken')
+        resumptionToken = tokenElement.text if tokenElement is not None and tokenElement.text else None
+        yield (records, resumptionToken)
+        if not resumptionToken:
+            return
+
+
+def recordToDict(record):
+    """
+    :param record: a sickle Record
+    :return: a dict with the keys identifier, datestamp, deleted, and metadata (the Dublin Core fields as lists of values)
+    """
+    return {"identifier": record.header.identifier,
+            "datestamp": record.header.datestamp,
+            "deleted": record.header.deleted,
+            "metadata": getattr(record, "metadata", {}) if not record.header.deleted else {}}
+
+
+class OAIHarvester(object):
+    """
+    Harvests all records of an OAI-PMH endpoint into an append-only record store (see readRecords()).
+    """
+    def __init__(self, endpoint, storePath, maxRetries=5, backoffFactor=0.5, log=print):
+        """
+        :param endpoint: the URL of the OAI-PMH endpoint
+        :param storePath: the path to the record store
+        :param maxRetries: a failed request is retried up to maxRetries times with an exponential backoff of
+        backoffFactor * 2^(retry-1) seconds
+        :param backoffFactor: see maxRetries
+        :param log: a function used for progress messages
+        """
+        self.sickle = Sickle(endpoint, max_retries=maxRetries)
+        self.storePath = storePath
+        self.maxRetries = maxRetries
+        self.backoffFactor = backoffFactor
+        self.log = log
+
+    def _pages(self, params, resumptionToken):
+        # reconnects with the last token after network errors
+        retries = 0
+        while True:
+            try:
+                for page in listRecordPages(self.sickle, params, resumptionToken):
+                    retries = 0
+                    resumptionToken = page[1]
+                    yield page
+                return
+            except requests.exceptions.RequestException as ex:
+                retries += 1
+                if retries > self.maxRetries:
+                    raise
+                delay = self.backoffFactor * 2 ** (retries - 1)
+                self.log("Request failed (%s), retrying in %.1f s." % (type(ex).__name__, delay))
+                time.sleep(delay)
+
+    def harvest(self, params, maxRecords=None, incremental=False):
+        """
+        Harvests ListRecords into the store. An unfinished harvest with the same parameters is continued. A finished one
+        is started again or, if incremental is True, only the records added, changed, or deleted since the newest
+        datestamp of the store are requested (from=...) and appended to the store.
+        ATTENTION! Raises the exceptions of the last attempt if a request fails maxRetries times, in this case, the next
+        call continues where the harvest stopped. If the server rejects the saved resumptionToken (e.g., because it has
+        expired), the harvest is restarted with its first request, already stored records are skipped and do not count
+        towards maxRecords.
+        :param params: the parameters of the ListRecords request, e.g., {'metadataPrefix':'oai_dc','set':'all'}
+        :param maxRecords: if given, the harvest stops after the page on which this call has harvested maxRecords records,
+        the next call continues the harvest, i.e., repeated calls complete the harvest step by step
+        :param incremental: if True, a finished harvest is updated instead of being started again
+        :return: the number of records harvested by this call
+        """
+        state = readState(self.storePath)
+        if state and not state["complete"] and state["params"] == params and os.path.exists(self.storePath):
+            self.log("Continuing harvest after %i records." % state["numberOfRecords"])
+            # a page which has been written after the last saved state is removed
+            with open(self.storePath, "rb+") as f:
+                f.truncate(state["storeSize"])
+        elif incremental and state and state["complete"] and state["params"] == params and state.get("lastDatestamp") \
+                and os.path.exists(self.storePath):
+            # former updates are merged first, hence, only records harvested by this update may occur twice
+            compactStore(self.storePath)
+            state = readState(self.storePath)
+            self.log("Harvesting records changed since %s." % state["lastDatestamp"])
+            requestParams = dict(params)
+            requestParams["from"] = state["lastDatestamp"]
+            state.update({"requestParams": requestParams, "resumptionToken": None, "complete": False,
+                          "deltaStart": state["storeSize"], "startedAt": str(datetime.now())})
+            writeState(self.storePath, state)
+        else:
+            state = {"params": params, "requestParams": params, "resumptionToken": None, "storeSize": 0,
+                     "numberOfRecords": 0, "complete": False, "lastDatestamp": None, "deltaStart": None, "pages": [],
+                     "startedAt": str(datetime.now())}
+            open(self.storePath, "wb").close()
+            writeState(self.storePath, state)
+
+        harvestedRecords = 0
+        stoppedEarly = False
+        # the (identifier, datestamp) pairs of the stored records if the harvest has been restarted
+        storedRecords = None
+        with open(self.storePath, "ab") as store:
+            while True:
+                try:
+                    for records, resumptionToken in self._pages(state["requestParams"], state["resumptionToken"]):
+                        pageRecords = [recordToDict(r) for r in records]
+                        if storedRecords is not None:
+                            # records harvested before the restart are not stored twice
+                            pageRecords = [r for r in pageRecords if (r["identifier"], r["datestamp"]) not in storedRecords]
+                        for record in pageRecords:
+                            # ISO 8601 datestamps can be compared as strings
+                            if not state["lastDatestamp"] or record["datestamp"] > state["lastDatestamp"]:
+                                state["lastDatestamp"] = record["datestamp"]
+                        if pageRecords:
+                            data = encodePage(pageRecords)
+                            store.write(data)
+                            store.flush()
+                            os.fsync(store.fileno())
+                            state["pages"].append([state["storeSize"], len(data), len(pageRecords)])
+                            state["storeSize"] += len(data)
+                        state["resumptionToken"] = resumptionToken
+                        state["numberOfRecords"] += len(pageRecords)
+                        state["complete"] = resumptionToken is None
+                        writeState(self.storePath, state)
+                        harvestedRecords += len(pageRecords)
+                        if state["numberOfRecords"] // 10000 != (state["numberOfRecords"] - len(pageRecords)) // 10000:
+                            self.log("Harvested %i records." % state["numberOfRecords"])
+                        if maxRecords is not None and harvestedRecords >= maxRecords and not state["complete"]:
+                            stoppedEarly = True
+                            break
+                    break
+                except oaiexceptions.BadResumptionToken:
+                    # the saved resumptionToken has expired, the harvest is restarted once with the request it started with
+                    if storedRecords is not None or not state["resumptionToken"]:
+                        raise
+                    self.log("The resumption token has been rejected, restarting the harvest after %i records." % state["numberOfRecords"])
+                    storedRecords = set((r["identifier"], r["datestamp"]) for r in readRecords(self.storePath, includeDeleted=True))
+                    # changed records are harvested again, only their latest versions are read (see readRecords())
+                    if state["deltaStart"] is None:
+                        state["deltaStart"] = state["storeSize"]
+                    state["resumptionToken"] = None
+                    writeState(self.storePath, state)
+        if not stoppedEarly and not state["complete"]:
+            # the server did not return any records, e.g., nothing has changed since the last harvest
+            state["complete"] = True
+            writeState(self.storePath, state)
+        return harvestedRecords
+
+
+def readRecords(storePath, includeDeleted=False, fields=None):
+    """
+    Streams the records of a record store page by page. If the store has been updated incrementally, only the latest
+    version of each record is returned, i.e., changed records are returned in the position of their latest version.
+    :param storePath: the path to the record store
+    :param includeDeleted: if True, deleted records are returned as well
+    :param fields: an optional list of metadata fields (e.g., ['identifier','date']), all other fields are removed from
+    the metadata of the returned records
+    :return: an iterator of dicts as created by recordToDict()
+    """
+    state = readState(storePath)
+    # only completely written pages are listed in the page index
+    pages = state["pages"]
+    deltaStart = state["deltaStart"]
+    with open(storePath, "rb") as f:
+        # the position of the latest version of every record harvested by the last update
+        latestPositions = dict()
+        if deltaStart is not None:
+            for page in pages:
+                if page[0] >= deltaStart:
+                    for i, record in enumerate(readPage(f, page)):
+                        latestPositions[record["identifier"]] = (page[0], i)
+        for page in pages:
+            for i, record in enumerate(readPage(f, page)):
+                latestPosition = latestPositions.get(record["identifier"])
+                if latestPosition is not None and latestPosition != (page[0], i):
+                    continue
+                if record["deleted"] and not includeDeleted:
+                    continue
+                if fields is not None:
+                    metadata = record["metadata"]
+                    record["metadata"] = {k: metadata[k] for k in fields if k in metadata}
+                yield record
+
+
+def compactStore(storePath):
+    """
+    Rewrites a record store keeping only the latest version of every record and no deleted records.
+    """
+    state = readState(storePath)
+    if state is None or state.get("deltaStart") is None:
+        return
+    with open(storePath + ".part", "wb") as f:
+        pages = writePages(f, readRecords(storePath))
+        storeSize = f.tell()
+    # the pending compaction is saved first, hence, readState() can finish it if the process is interrupted afterwards
+    state["compaction"] = {"storeSize": storeSize, "numberOfRecords": sum(page[2] for page in pages), "deltaStart": None,
+                           "pages": pages}
+    writeState(storePath, state)
+    os.replace(storePath + ".part", storePath)
+    state.update(state.pop("compaction"))
+    writeState(storePath, state)
+
+
+def importPickle(picklePath, storePath):
+    """
+    Converts a pickled list of metadata dicts (as saved by former versions of ppnHarvester.py and oai-analyzer.py) into
+    a record store. The datestamps of the records are unknown, hence, the store cannot be updated incrementally.
+    :param picklePath: the path to the pickle
+    :param storePath: the path to the record store
+    :return: the number of imported records
+    """
+    with open(picklePath, "rb") as f:
+        savedRecords = pickle.load(f)
+    records = ({"identifier": (metadata.get("identifier") or [None])[0], "datestamp": None, "deleted": False,
+                "metadata": metadata} for metadata in savedRecords)
+    with open(storePath + ".part", "wb") as f:
+        pages = writePages(f, records)
+        storeSize = f.tell()
+    os.replace(storePath + ".part", storePath)
+    writeState(storePath, {"params": None, "requestParams": None, "resumptionToken": None, "storeSize": storeSize,
+                           "numberOfRecords": len(savedRecords), "complete": True, "lastDatestamp": None,
+                           "deltaStart": None, "pages": pages, "startedAt": str(datetime.now())})
+    return len(savedRecords)
+
+
+if __name__ == "__main__":
+    # usage: python oaiHarvest.py --import <pickle> <record store>
+    if len(sys.argv) > 3 and sys.argv[1] == "--import":
+        print("Imported %i records." % importPickle(sys.argv[2], sys.argv[3]))
+    else:
+        print("usage: python oaiHarvest.py --import <pickle> <record store>")
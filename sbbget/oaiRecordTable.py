@@ -0,0 +1,88 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# conversion of OAI metadata records (dicts mapping a field to its list of values, see oaiHarvest.readRecords()) into a
+# pandas dataframe used by oai-analyzer.py and ppnHarvester.py
+# the records are converted into typed Arrow list columns at once, the first values, the digit detection, and the PPN
+# lookup are Arrow compute kernels, i.e., Python code only runs for the values consisting of digits in columns which
+# also contain text (they become Python integers in an object column as before)
+# the records are Python dicts, hence, their conversion into Arrow arrays still touches every value and takes about half of
+# the run time (about 0.7 s for 146k records), the conversion is about twice as fast as building the columns in Python
+# but not more, considerably larger speedups would require reading the record store into Arrow without Python dicts
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def valuesAt(lists, position):
+    """
+    :param lists: an Arrow array of lists
+    :param position: the position within the lists
+    :return: an Arrow array of the values at the position, null for missing or shorter lists
+    """
+    isLongEnough = pc.greater(pc.list_value_length(lists), position)
+    return pc.list_element(pc.if_else(isLongEnough, lists, pa.scalar(None, lists.type)), position)
+
+
+def firstValuesToSeries(lists):
+    """
+    :param lists: an Arrow array of string lists
+    :return: a pandas series of the first values of the lists in which values consisting of digits only are integers,
+    i.e., a numerical series if all values are numbers and an object series otherwise, missing values are NaN
+    """
+    values = valuesAt(lists, 0)
+    isDigit = pc.fill_null(pc.utf8_is_digit(values), False)
+    numberOfDigitValues = pc.sum(isDigit).as_py() or 0
+    if numberOfDigitValues == 0:
+        return values.to_pandas()
+    if numberOfDigitValues == len(values) - values.null_count:
+        try:
+            return pc.cast(values, pa.int64()).to_pandas()
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # e.g., too large numbers or digits of other scripts
+            pass
+    series = values.to_numpy(zero_copy_only=False).astype(object)
+    isMissing = pc.invert(pc.fill_null(pc.greater(pc.list_value_length(lists), 0), False))
+    series[isMissing.to_numpy(zero_copy_only=False)] = float("nan")
+    series[isDigit.to_numpy(zero_copy_only=False)] = [int(v) for v in pc.filter(values, isDigit).to_pylist()]
+    return pd.Series(series, dtype=object)
+
+
+def recordsToDataFrame(metadataRecords):
+    """
+    :param metadataRecords: a list of metadata dicts (field -> list of values)
+    :return: a (dataframe, Arrow array of the identifier lists or None) tuple, the dataframe has one row per record and
+    one column per field (in the order of their first occurrence) holding the first value of the field
+    """
+    # passing the type avoids Arrow's type inference pass over all records and keeps the order of the fields
+    names = list(dict.fromkeys(k for record in metadataRecords for k in record))
+    fields = pa.array(metadataRecords, type=pa.struct([(name, pa.list_(pa.string())) for name in names]))
+    columns = dict((name, firstValuesToSeries(fields.field(name))) for name in names)
+    identifiers = fields.field("identifier") if "identifier" in names else None
+    return (pd.DataFrame(columns, index=pd.RangeIndex(len(metadataRecords))), identifiers)
+
+
+def firstPPNs(identifiers):
+    """
+    :param identifiers: an Arrow array of identifier lists
+    :return: a pandas series of the first identifier of every list starting with "PPN" ("" if there is none)
+    """
+    flatIdentifiers = pc.list_flatten(identifiers)
+    isPPN = pc.fill_null(pc.starts_with(flatIdentifiers, "PPN"), False)
+    ppns = pd.Series(pc.filter(flatIdentifiers, isPPN).to_pandas().values,
+                     index=pc.filter(pc.list_parent_indices(identifiers), isPPN).to_pandas().values)
+    # only the first PPN of every list is taken
+    ppns = ppns[~ppns.index.duplicated()]
+    return ppns.reindex(pd.RangeIndex(len(identifiers)), fill_value="")
@@ -14,7 +14,7 @@
 
 import shutil
 import argparse
-import urllib.request
+import io
 from urllib.parse import urlparse
 import xml.etree.ElementTree as ET
 import os
@@ -22,12 +22,171 @@ from PIL import Image
 from time import gmtime, strftime, sleep
 from datetime import datetime
 import sys
-import requests
-import tarfile as TAR
 import yaml
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+import sqlite3
+import stabiFetch
+import illustrationArchive
+import metsIndex
+
+# directory layout below the current working directory
+sbbPrefix = "sbbget_downloads"
+downloadTempDir = sbbPrefix + "/download_temp"
+extractedImagesDir = sbbPrefix + "/extracted_images"
+
+# processing states of a PPN as recorded in the work journal
+PPN_PENDING = "pending"
+PPN_DOWNLOADING = "downloading"
+PPN_EXTRACTING = "extracting"
+PPN_DONE = "done"
+PPN_FAILED = "failed"
+# the journal connection of the current process, see initWorker()
+journalConnection = None
+# the HTTP session and rate limiter of the current process, see initWorker()
+httpSession = None
+rateLimiter = None
+# the semaphores limiting the requests per host, they are shared by all worker processes (see createHostSemaphores())
+hostSemaphores = None
+# number of host semaphores, every host is mapped to one of them by a hash of its name, i.e., hosts sharing a semaphore
+# share the limit of maxConcurrentDownloadsPerHost (the Stabi's files are served by very few hosts)
+numberOfHostSemaphores = 16
+
+
+def fetchFile(url,targetPath):
+    """
+    Downloads a single file to the given path using the HTTP session of the current process.
+    ATTENTION! Does not handle network errors etc.
+    :param url: the URL of the file
+    :param targetPath: the local path the file will be saved to
+    """
+    stabiFetch.downloadFile(httpSession,url,targetPath,rateLimiter)
+
+def createHostSemaphores():
+    """
+    Creates the semaphores limiting the number of requests in flight to the same server across all worker processes
+    (see maxConcurrentDownloadsPerHost in 'config.yaml'). Has to be called before the worker processes are started.
+    :return: a list of numberOfHostSemaphores semaphores
+    """
+    return [multiprocessing.BoundedSemaphore(maxConcurrentDownloadsPerHost) for i in range(numberOfHostSemaphores)]
+
+def hostSemaphoreOf(url):
+    """
+    :param url: a URL
+    :return: the semaphore of the URL's host, the same in every process
+    """
+    # crc32 instead of hash() as the hashes of strings differ between processes
+    return hostSemaphores[zlib.crc32(urlparse(url).netloc.encode("utf-8"))%len(hostSemaphores)]
+
+def downloadConcurrently(downloadJobs):
+    """
+    Downloads a list of files with a bounded number of concurrent requests (see maxConcurrentDownloads and
+    maxConcurrentDownloadsPerHost in 'config.yaml').
+    :param downloadJobs: a list of (url, targetPath) tuples
+    :return: a dict mapping each target path to None if the download succeeded or to the raised exception otherwise
+    """
+    def worker(url,targetPath):
+        # the semaphore of the host limits the number of requests in flight to the same server across all processes
+        with hostSemaphoreOf(url):
+            fetchFile(url,targetPath)
+
+    # the same target must never be written by two threads at once
+    uniqueJobs=dict()
+    for url,targetPath in downloadJobs:
+        uniqueJobs[targetPath]=url
+
+    results=dict()
+    with ThreadPoolExecutor(max_workers=maxConcurrentDownloads) as pool:
+        futures={pool.submit(worker,url,targetPath):(url,targetPath) for targetPath,url in uniqueJobs.items()}
+        for future in as_completed(futures):
+            url,targetPath=futures[future]
+            try:
+                future.result()
+                results[targetPath]=None
+            except Exception as ex:
+                results[targetPath]=ex
+    return results
+
+def findIllustrations(altoPath):
+    """
+    Finds all illustrations in an ALTO file which are large enough to be extracted (see consideredAltoElements).
+    :param altoPath: path to the ALTO file
+    :return: a list of (ALTO ID, HPOS, VPOS, WIDTH, HEIGHT) tuples
+    """
+    tree = ET.parse(altoPath)
+    root = tree.getroot()
 
-
-def downloadData(currentPPN,downloadPathPrefix,metsModsDownloadPath):
+    illustrations=[]
+    for e in root.findall('.//{http://www.loc.gov/standards/alto/ns-v2#}PrintSpace'):
+        for el in e:
+            if el.tag in consideredAltoElements:
+                illuID=el.attrib['ID']
+                h=int(el.attrib['HEIGHT'])
+                w=int(el.attrib['WIDTH'])
+                if h > 150 and w > 150:
+                    illustrations.append((illuID,int(el.attrib['HPOS']),int(el.attrib['VPOS']),w,h))
+                else:
+                    if verbose:
+                        print("Image is too small: processing skipped.")
+    return illustrations
+
+def encodeImage(img,fileType):
+    """
+    Encodes an image in memory.
+    :param img: the image
+    :param fileType: the file extension determining the image format, e.g., ".jpg"
+    :return: a buffer holding the encoded image
+    """
+    buffer=io.BytesIO()
+    img.save(buffer,format=Image.registered_extensions()[fileType.lower()])
+    return buffer
+
+def processPage(tiffPath,derivativePath,illustrations,illustrationPrefix,thumbnailPath,tarBall):
+    """
+    Decodes a downloaded page image once and creates all of its derivatives from the decoded image, i.e., the page in the
+    illustration export file format, the crops of its illustrations and the title page thumbnail. The decoded image is
+    released afterwards.
+    :param tiffPath: path to the downloaded page image
+    :param derivativePath: path of the page in the illustration export file format
+    :param illustrations: a list of illustrations as returned by findIllustrations()
+    :param illustrationPrefix: path prefix of the extracted illustrations (the ALTO ID and file type will be appended)
+    :param thumbnailPath: path of the title page thumbnail or None if the page is not the title page
+    :param tarBall: the IllustrationArchiveWriter for the extracted illustrations or None
+    """
+    with Image.open(tiffPath) as img:
+        img.load()
+        img.save(derivativePath)
+
+        for illuID,hpos,vpos,w,h in illustrations:
+            extractedIllustrationPath=illustrationPrefix + "_" +illuID + illustrationExportFileType
+            if verbose:
+                print("Saving image to: "+extractedIllustrationPath)
+                print("\t\tImage size:",img.size)
+                print("\t\tCrop range:", h, w, vpos, hpos)
+            page=os.path.basename(illustrationPrefix)
+            entry = {"WIDTH" : w, "HEIGHT": h, "LABEL" : page}
+            dimensions.append(entry)
+            # (left, upper, right, lower)-tuple.
+            crop=img.crop((hpos, vpos, hpos+w, vpos+h))
+            if tarBall and streamIllustrationsIntoTarBall:
+                tarBall.addBytes(extractedIllustrationPath,encodeImage(crop,illustrationExportFileType),page,illuID,w,h)
+            else:
+                crop.save(extractedIllustrationPath)
+                if tarBall:
+                    tarBall.addFile(extractedIllustrationPath,page,illuID,w,h)
+                    os.remove(extractedIllustrationPath)
+
+        # the thumbnail is created in-place, hence, it has to be the last derivative
+        if thumbnailPath:
+            img.thumbnail(titlePageThumbnailSize)
+            img.save(thumbnailPath)
+
+def downloadData(currentPPN,downloadPathPrefix,metsModsDownloadPath,savePathPrefix):
+    """
+    Downloads the METS/MODS file and all files of a PPN and extracts its illustrations.
+    :return: a tuple (path to the title page, dict mapping the target path of every failed download to its exception)
+    """
     # static URL pattern for Stabi's digitized collection downloads
     # old version
     #metaDataDownloadURLPrefix = "http://digital.staatsbibliothek-berlin.de/metsresolver/?PPN="
@@ -53,182 +212,129 @@ def downloadData(currentPPN,downloadPathPrefix,metsModsDownloadPath):
     metsModsPath= metsModsDownloadPath+"/"+currentPPN+".xml"
     #metsModsPath= metsModsDownloadPath+"/"+currentPPN+".mets.xml"
     print(metsModsPath)
-    if runningFromWithinStabi:
-        proxy = urllib.request.ProxyHandler({})
-        opener = urllib.request.build_opener(proxy)
-        urllib.request.install_opener(opener)
-
-    if not allowUnsafeSSLConnections_NEVER_USE_IN_PRODUCTION:
-        urllib.request.urlretrieve(currentDownloadURL,metsModsPath)
     # daz: TODO JPG-Wandlung der Vollseiten-TIFFs automatisieren und dokumentieren
-    else:
-        with open(metsModsPath, 'wb') as f:
-            resp = requests.get(currentDownloadURL, verify=False)
-            f.write(resp.content)
+    fetchFile(currentDownloadURL,metsModsPath)
 
     # parse the METS/MODS file
-    tree = ET.parse(metsModsPath)
-    root = tree.getroot()
-
-    fileID2physID=dict()
-    # first, we have to build a dict mapping various IDs to physical pages
-    for div in root.iter('{http://www.loc.gov/METS/}div'):
-        for fptr in div.iter('{http://www.loc.gov/METS/}fptr'):
-            #print(fptr.tag,fptr.attrib)
-            fileID2physID[fptr.attrib['FILEID']]=div.attrib['ID']
-            #print(fptr.attrib['FILEID'],fileID2physID[fptr.attrib['FILEID']])
-
-    # second, we will link the physical page to the logical as indicated in the original work
-    # this information is stored in the following tag
+    # all lookup tables (file ID->physical page, physical page->logical ID, title page) are built in a single pass
+    mets=metsIndex.METSIndex(metsModsPath)
+    fileID2physID=mets.fileID2physID
+    # the physical page is linked to the logical as indicated in the original work, this information is stored in the following tag
     #<mets:smLink xmlns:xlink="http://www.w3.org/1999/xlink" xlink:to="PHYS_0433" xlink:from="LOG_0015"/>
-    physID2logicalID = dict()
-    smLinks = root.findall(
-        ".//{http://www.loc.gov/METS/}smLink")
-    for l in smLinks:
-        physID2logicalID[l.attrib['{http://www.w3.org/1999/xlink}to']]=l.attrib['{http://www.w3.org/1999/xlink}from']
-        print(l.attrib)
-
-    print(physID2logicalID)
-    #sys.exit(0)
-    # find the image with the title page (if available)
-    titlePage = root.findall(".//{http://www.loc.gov/METS/}div[@TYPE='title_page']")
-    titlePageLogID=""
-    if titlePage:
-        titlePageLogID=titlePage[0].attrib['ID']
-    else:
+    physID2logicalID=mets.physID2logicalID
+    # the image with the title page (if available)
+    if not mets.titlePageLogID:
         if verbose and storeExtraTitlePageThumbnails:
             print("\tNo title page found. Using first image instead.")
-    # if we have found a title page before, select the link to its physical page
-    physTitlePageNodes=root.findall(".//{http://www.loc.gov/METS/}smLink[@{http://www.w3.org/1999/xlink}from='"+titlePageLogID+"']")
-    titlePagePhysID=""
-    if physTitlePageNodes:
-        titlePagePhysID=physTitlePageNodes[0].attrib['{http://www.w3.org/1999/xlink}to']
-
-    # a list of downloaded TIFF files
-    alreadyDownloadedPhysID=[]
+    titlePagePhysID=mets.titlePagePhysID
+
+    # the set of downloaded TIFF files (physical IDs)
+    alreadyDownloadedPhysID=mets.seenPhysIDs
     # a dict of paths to ALTO fulltexts (id->download dir)
     altoPaths=dict()
 
     # a list of downloaded image paths in order to remove them if needed (controled by deleteMasterTIFFs)
     masterTIFFpaths=[]
 
+    # all files are collected first and downloaded concurrently afterwards (see downloadConcurrently())
+    # a list of (url, target path) tuples
+    downloadJobs=[]
+    # TIFFs which have to be post-processed after their download (TIFF dir, logical ID, physical ID, title page flag, first file flag)
+    tiffJobs=[]
+    # ALTO fulltexts which have to be registered in altoPaths after their download (target path->(id, download dir, file name))
+    fulltextJobs=dict()
+
     # we are only interested in fileGrp nodes below fileSec...
-    for fileSec in root.iter('{http://www.loc.gov/METS/}fileSec'):
-        for child in fileSec.iter('{http://www.loc.gov/METS/}fileGrp'):
-            currentUse=child.attrib['USE']
-
-            firstFileNode=True
-            # which contains file nodes...
-            for fileNode in child.iter('{http://www.loc.gov/METS/}file'):
-            # embedding FLocat node pointing to the URLs of interest
-                id = fileNode.attrib['ID']
-                downloadDir="./"+downloadPathPrefix + "/" + id
-                saveDir= "./" + savePathPrefix + "/" + id
-                # only create need sub directories
-                if currentUse in retrievalScope :
-                    if not os.path.exists(downloadDir):
+    for currentUse,fileNodes in mets.fileGroups.items():
+        firstFileNode=True
+        # which contains file nodes...
+        for id,hrefs in fileNodes:
+        # embedding FLocat node pointing to the URLs of interest
+            downloadDir="./"+downloadPathPrefix + "/" + id
+            saveDir= "./" + savePathPrefix + "/" + id
+            # only create need sub directories
+            if currentUse in retrievalScope :
+                if not os.path.exists(downloadDir):
+                    if verbose:
+                        print(downloadDir)
+                    os.mkdir(downloadDir)
+
+            if 'TIFF' in retrievalScope:
+                # try to download TIFF first
+                downloadDir = "./" + downloadPathPrefix + "/" + id
+                saveDir = "./" + savePathPrefix + "/"
+                tiffDir=downloadDir.replace(currentUse,'TIFF')
+
+                if not os.path.exists(tiffDir):
+                    os.mkdir(tiffDir)
+
+                currentPhysicalFile=fileID2physID[id]
+                currentLogicalID=physID2logicalID[currentPhysicalFile]
+                if not currentPhysicalFile in alreadyDownloadedPhysID:
+                    isTitlePage=False
+                    # check if the current image is the title page
+                    if currentPhysicalFile==titlePagePhysID:
+                        isTitlePage=True
+                    if verbose:
+                        if isTitlePage:
+                            print("Downloading to " + tiffDir+" (TITLE PAGE)")
+                        else:
+                            print("Downloading to " + tiffDir)
+
+                    if (not skipDownloads) or (forceTitlePageDownload and isTitlePage):
+                        cleanedPhysID=currentPhysicalFile.replace("PHYS_","").zfill(8)
+                        tiffURL=tiffDownloadLink.replace('@PPN@',currentPPN).replace('@PHYSID@',cleanedPhysID)
                         if verbose:
-                            print(downloadDir)
-                        os.mkdir(downloadDir)
-
-                if 'TIFF' in retrievalScope:
-                    # try to download TIFF first
-                    downloadDir = "./" + downloadPathPrefix + "/" + id
-                    saveDir = "./" + savePathPrefix + "/"
-                    tiffDir=downloadDir.replace(currentUse,'TIFF')
-
-                    if not os.path.exists(tiffDir):
-                        os.mkdir(tiffDir)
-
-                    try:
-                        currentPhysicalFile=fileID2physID[id]
-                        currentLogicalID=physID2logicalID[currentPhysicalFile]
-                        if not currentPhysicalFile in alreadyDownloadedPhysID:
-                            isTitlePage=False
-                            # check if the current image is the title page
-                            if currentPhysicalFile==titlePagePhysID:
-                                isTitlePage=True
-                            if verbose:
-                                if isTitlePage:
-                                    print("Downloading to " + tiffDir+" (TITLE PAGE)")
-                                else:
-                                    print("Downloading to " + tiffDir)
-
-                            if (not skipDownloads) or (forceTitlePageDownload and isTitlePage):
-                                cleanedPhysID=currentPhysicalFile.replace("PHYS_","").zfill(8)
-                                if not allowUnsafeSSLConnections_NEVER_USE_IN_PRODUCTION:
-                                    if verbose:
-                                        print("Trying to get image for phys ID "+currentPhysicalFile+" file from: "+tiffDownloadLink.replace('@PPN@',currentPPN).replace('@PHYSID@',cleanedPhysID))
-                                    urllib.request.urlretrieve(tiffDownloadLink.replace('@PPN@',currentPPN).replace('@PHYSID@',cleanedPhysID),tiffDir+"/"+currentPPN+".tif")
-                                else:
-                                    with open(tiffDir+"/"+currentPPN+".tif", 'wb') as f:
-                                        if verbose:
-                                            print("Trying to get image for phys ID "+currentPhysicalFile+" file from: "+tiffDownloadLink.replace('@PPN@',currentPPN).replace('@PHYSID@',cleanedPhysID))
-                                        resp = requests.get(tiffDownloadLink.replace('@PPN@',currentPPN).replace('@PHYSID@',cleanedPhysID), verify=False)
-                                        f.write(resp.content)
-
-                                # save the logical and physical ID for later usage separated by space
-                                with open(tiffDir + "/" + currentPPN + ".txt", 'w') as f:
-                                    f.write(currentLogicalID+" "+currentPhysicalFile+"\n")
-
-
-                                masterTIFFpaths.append(tiffDir+"/"+currentPPN+".tif")
-                                # open the freshly download TIFF and convert it to the illustration export file format
-                                img = Image.open(tiffDir + "/" + currentPPN + ".tif")
-                                img.save(tiffDir + "/" + currentPPN + illustrationExportFileType)
-
-                                # store the title page separately if desired
-                                if storeExtraTitlePageThumbnails:
-                                    if isTitlePage:
-                                        img.thumbnail(titlePageThumbnailSize)
-                                        pathToTitlePage=downloadPathPrefix+"/" +"_TITLE_PAGE"+ illustrationExportFileType
-                                        img.save(pathToTitlePage)
-                                    else:
-                                        # otherwise, take the first seen image as title page
-                                        if firstFileNode:
-                                            img.thumbnail(titlePageThumbnailSize)
-                                            pathToTitlePage = downloadPathPrefix + "/" + "_TITLE_PAGE" + illustrationExportFileType
-                                            img.save(pathToTitlePage)
-                            alreadyDownloadedPhysID.append(currentPhysicalFile)
-                            firstFileNode=False
-                    except urllib.error.URLError:
-                        print("Error downloading " + currentPPN+".tif")
-
-                if currentUse in retrievalScope : # e.g., TIFF or FULLTEXT
-                    for fLocat in fileNode.iter('{http://www.loc.gov/METS/}FLocat'):
-                        if (fLocat.attrib['LOCTYPE'] == 'URL'):
-                            if verbose:
-                                print("Processing "+id)
-                            href=fLocat.attrib['{http://www.w3.org/1999/xlink}href']
-                            rawPath=urlparse(href).path
-                            tokens=rawPath.split("/")
-                            outputPath=tokens[-1]
-
-                            if verbose:
-                                print("\tSaving to: " + downloadDir + "/" + outputPath)
-                            try:
-                                if not skipDownloads:
-                                    if allowUnsafeSSLConnections_NEVER_USE_IN_PRODUCTION:
-                                        with open(downloadDir + "/" + outputPath, 'wb') as f:
-                                            resp = requests.get(href, verify=False)
-                                            f.write(resp.content)
-                                    else:
-                                        urllib.request.urlretrieve(href, downloadDir+"/"+outputPath)
-                                if currentUse=='FULLTEXT':
-                                    altoPaths[id]=[downloadDir,outputPath]
-                            except urllib.error.URLError:
-                                print("\tError processing "+href)
+                            print("Trying to get image for phys ID "+currentPhysicalFile+" file from: "+tiffURL)
+                        downloadJobs.append((tiffURL,tiffDir+"/"+currentPPN+".tif"))
+                        tiffJobs.append((tiffDir,currentLogicalID,currentPhysicalFile,isTitlePage,firstFileNode))
+                    alreadyDownloadedPhysID.add(currentPhysicalFile)
+                    firstFileNode=False
+
+            if currentUse in retrievalScope : # e.g., TIFF or FULLTEXT
+                # only FLocat nodes of type URL are listed in the index
+                for href in hrefs:
+                    if verbose:
+                        print("Processing "+id)
+                    rawPath=urlparse(href).path
+                    tokens=rawPath.split("/")
+                    outputPath=tokens[-1]
+
+                    if verbose:
+                        print("\tSaving to: " + downloadDir + "/" + outputPath)
+                    if not skipDownloads:
+                        downloadJobs.append((href,downloadDir+"/"+outputPath))
+                    if currentUse=='FULLTEXT':
+                        fulltextJobs[downloadDir+"/"+outputPath]=(id,downloadDir,outputPath)
+
+    # download all collected files at once
+    downloadErrors=dict()
+    if downloadJobs:
+        if verbose:
+            print("Downloading %i files (max. %i concurrent requests)..."%(len(downloadJobs),maxConcurrentDownloads))
+        for targetPath,error in downloadConcurrently(downloadJobs).items():
+            if error:
+                print("\tError downloading "+targetPath+": "+str(error))
+                downloadErrors[targetPath]=error
+
+    # only successfully downloaded fulltexts are considered for the extraction of illustrations
+    for targetPath in fulltextJobs:
+        if targetPath not in downloadErrors:
+            id,downloadDir,outputPath=fulltextJobs[targetPath]
+            altoPaths[id]=[downloadDir,outputPath]
 
     # extract illustrations found in ALTO files (only possible if the images have been downloaded before...)
-    #illuID = 0
+    # the ALTO file of a page is stored next to its TIFF, e.g., in FILE_0001_FULLTEXT and FILE_0001_TIFF
+    altoKeyPerTiffDir=dict()
+    tarBall = None
     if extractIllustrations and (not skipDownloads):
+        setPPNState(currentPPN,PPN_EXTRACTING)
         if "PPN" not in saveDir:
             saveDir = "./" + savePathPrefix + "/"+currentPPN+"/"
-        # create a .tar file for the extracted illustrations
+        # create a .tar file (and its index) for the extracted illustrations
         tarBallPath = saveDir + currentPPN + ".tar"
-        tarBall = None
         if createTarBallOfExtractedIllustrations:
-            tarBall = TAR.open(tarBallPath, "w")
+            tarBall = illustrationArchive.IllustrationArchiveWriter(tarBallPath)
 
         for key in altoPaths:
             tiffDir=altoPaths[key][0].replace('FULLTEXT','TIFF')+"/"+altoPaths[key][1].replace(".","_")+"/"
@@ -237,46 +343,39 @@ def downloadData(currentPPN,downloadPathPrefix,metsModsDownloadPath):
                 os.mkdir(tiffDir)
                 if verbose:
                     print("Creating "+tiffDir)
+            altoKeyPerTiffDir[altoPaths[key][0].replace('FULLTEXT','TIFF')]=key
+
+    # post-process the downloaded TIFFs in the order of the METS/MODS file, every page image is decoded only once
+    for tiffDir,currentLogicalID,currentPhysicalFile,isTitlePage,firstFileNode in tiffJobs:
+        if tiffDir+"/"+currentPPN+".tif" in downloadErrors:
+            print("Error downloading " + currentPPN+".tif")
+            continue
+        # save the logical and physical ID for later usage separated by space
+        with open(tiffDir + "/" + currentPPN + ".txt", 'w') as f:
+            f.write(currentLogicalID+" "+currentPhysicalFile+"\n")
+
+        masterTIFFpaths.append(tiffDir+"/"+currentPPN+".tif")
+
+        # store the title page separately if desired, otherwise, take the first seen image as title page
+        thumbnailPath=None
+        if storeExtraTitlePageThumbnails and (isTitlePage or firstFileNode):
+            pathToTitlePage=downloadPathPrefix+"/" +"_TITLE_PAGE"+ illustrationExportFileType
+            thumbnailPath=pathToTitlePage
+
+        illustrations=[]
+        illustrationPrefix=""
+        key=altoKeyPerTiffDir.get(tiffDir)
+        if key:
             if verbose:
                 print("Processing ALTO XML in: "+altoPaths[key][0]+"/"+altoPaths[key][1])
-            tree = ET.parse(altoPaths[key][0]+"/"+altoPaths[key][1])
-            root = tree.getroot()
-
-            for e in root.findall('.//{http://www.loc.gov/standards/alto/ns-v2#}PrintSpace'):
-                for el in e:
-                    if el.tag in consideredAltoElements:
-                        illuID=el.attrib['ID']
-                        #if verbose:
-                        #print("\tExtracting "+illuID)
-                        h=int(el.attrib['HEIGHT'])
-                        w=int(el.attrib['WIDTH'])
-                        if h > 150 and w > 150:
-                            if verbose:
-                                print("Saving image to: "+saveDir + key.split("_")[1] + "_" +illuID + illustrationExportFileType)
-                            entry = {"WIDTH" : w, "HEIGHT": h, "LABEL" : key.split("_")[1]}
-                            dimensions.append(entry)
-                            hpos=int(el.attrib['HPOS'])
-                            vpos=int(el.attrib['VPOS'])
-                            #print(altoPaths[key])
-                            #print(altoPaths[key][0].replace('FULLTEXT','TIFF')+"/"+currentPPN+'.tif')
-                            img=Image.open(altoPaths[key][0].replace('FULLTEXT','TIFF')+"/"+currentPPN+'.tif')
-                            if verbose:
-                                print("\t\tImage size:",img.size)
-                                print("\t\tCrop range:", h, w, vpos, hpos)
-                            # (left, upper, right, lower)-tuple.
-                            img2 = img.crop((hpos, vpos, hpos+w, vpos+h))
-
-                            extractedIllustrationPath=saveDir + key.split("_")[1] + "_" +illuID + illustrationExportFileType
-                            img2.save(extractedIllustrationPath)
-                            if createTarBallOfExtractedIllustrations:
-                                tarBall.add(extractedIllustrationPath)
-                                os.remove(extractedIllustrationPath)
+            illustrations=findIllustrations(altoPaths[key][0]+"/"+altoPaths[key][1])
+            illustrationPrefix=saveDir + key.split("_")[1]
 
-                        else:
-                            if verbose:
-                                print("Image is too small: processing skipped.")
-        if createTarBallOfExtractedIllustrations:
-            tarBall.close()
+        processPage(tiffDir+"/"+currentPPN+".tif",tiffDir + "/" + currentPPN + illustrationExportFileType,
+                    illustrations,illustrationPrefix,thumbnailPath,tarBall)
+
+    if tarBall:
+        tarBall.close()
 
     if deleteMasterTIFFs:
         for masterTiff in masterTIFFpaths:
@@ -288,12 +387,21 @@ def downloadData(currentPPN,downloadPathPrefix,metsModsDownloadPath):
             if verbose:
                 print("Deleted temporary folders.")
 
-    return pathToTitlePage
-
-if __name__ == "__main__":
-    # load configuration from 'config.yaml'
-    # all parameters are documented in 'config.yaml'
-    with open('config.yaml', 'r') as file:
+    return (pathToTitlePage,downloadErrors)
+
+def loadConfiguration(configPath):
+    """
+    Loads the configuration from the given YAML file into the module's global variables.
+    All parameters are documented in 'config.yaml'.
+    :param configPath: path to the configuration file
+    """
+    global addPPNPrefix, retrievalScope, extractIllustrations, illustrationExportFileType, createTarBallOfExtractedIllustrations
+    global storeExtraTitlePageThumbnails, titlePageThumbnailSize, deleteTempFolders, deleteMasterTIFFs, skipDownloads
+    global forceTitlePageDownload, verbose, consideredAltoElements, allowUnsafeSSLConnections_NEVER_USE_IN_PRODUCTION
+    global runningFromWithinStabi, logFileName, errorLogFileName, ppnListFile, maxConcurrentDownloads, maxConcurrentDownloadsPerHost
+    global numberOfWorkers, journalFileName, maxRetries, retryBackoffFactor, maxRequestsPerSecond, streamIllustrationsIntoTarBall
+
+    with open(configPath, 'r') as file:
         cfg = yaml.safe_load(file)
 
     addPPNPrefix=cfg['sbbget']['addPPNPrefix']
@@ -301,6 +409,7 @@ if __name__ == "__main__":
     extractIllustrations=cfg['sbbget']['extractIllustrations']
     illustrationExportFileType= cfg['sbbget']['illustrationExportFileType']
     createTarBallOfExtractedIllustrations=cfg['sbbget']['createTarBallOfExtractedIllustrations']
+    streamIllustrationsIntoTarBall=cfg['sbbget']['streamIllustrationsIntoTarBall']
     storeExtraTitlePageThumbnails=cfg['sbbget']['storeExtraTitlePageThumbnails']
     titlePageThumbnailSize=cfg['sbbget']['titlePageThumbnailSize']
     deleteTempFolders=cfg['sbbget']['deleteTempFolders']
@@ -314,11 +423,135 @@ if __name__ == "__main__":
     logFileName = cfg['sbbget']['logFileName']
     errorLogFileName=cfg['sbbget']['errorLogFileName']
     ppnListFile=cfg['sbbget']['ppnListFile']
+    maxConcurrentDownloads=cfg['sbbget']['maxConcurrentDownloads']
+    maxConcurrentDownloadsPerHost=cfg['sbbget']['maxConcurrentDownloadsPerHost']
+    numberOfWorkers=cfg['sbbget']['numberOfWorkers']
+    journalFileName=cfg['sbbget']['journalFileName']
+    maxRetries=cfg['sbbget']['maxRetries']
+    retryBackoffFactor=cfg['sbbget']['retryBackoffFactor']
+    maxRequestsPerSecond=cfg['sbbget']['maxRequestsPerSecond']
+
+def openJournal(journalPath):
+    """
+    Opens (and creates if needed) the work journal storing the processing state of every PPN.
+    The journal is a SQLite database in WAL mode, hence, it can be updated safely from several processes.
+    :param journalPath: path to the journal database
+    :return: a SQLite connection
+    """
+    conn=sqlite3.connect(journalPath, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("CREATE TABLE IF NOT EXISTS journal (ppn TEXT PRIMARY KEY, position INTEGER NOT NULL, state TEXT NOT NULL, updated TEXT, message TEXT);")
+    conn.commit()
+    return conn
+
+def registerPPNs(conn,ppns):
+    """
+    Adds all PPNs to the journal as pending, PPNs already known to the journal keep their state but take their position
+    in the current list.
+    :param conn: the journal connection
+    :param ppns: the list of PPNs to be processed
+    """
+    now=str(datetime.now())
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO journal VALUES(?,?,?,?,NULL);",[(ppn,i,PPN_PENDING,now) for i,ppn in enumerate(ppns)])
+        conn.executemany("UPDATE journal SET position=? WHERE ppn=?;",[(i,ppn) for i,ppn in enumerate(ppns)])
+
+def getUnfinishedPPNs(conn,ppns):
+    """
+    :param conn: the journal connection
+    :param ppns: the current list of PPNs, PPNs of former lists which are still in the journal are ignored
+    :return: all PPNs of the list which have not been processed completely in the order of the list
+    """
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS current_ppns (ppn TEXT PRIMARY KEY, position INTEGER NOT NULL);")
+        conn.execute("DELETE FROM current_ppns;")
+        conn.executemany("INSERT OR IGNORE INTO current_ppns VALUES(?,?);",[(ppn,i) for i,ppn in enumerate(ppns)])
+    return [row[0] for row in conn.execute("SELECT j.ppn FROM journal j INNER JOIN current_ppns c ON j.ppn=c.ppn WHERE j.state!=? ORDER BY c.position;",(PPN_DONE,))]
+
+def setPPNState(ppn,state,message=None):
+    """
+    Records the processing state of a PPN in the journal of the current process (if any).
+    :param ppn: the PPN
+    :param state: one of the PPN_* states
+    :param message: an optional message, e.g., the reason of a failure
+    """
+    if journalConnection is None:
+        return
+    with journalConnection:
+        journalConnection.execute("UPDATE journal SET state=?, updated=?, message=? WHERE ppn=?;",(state,str(datetime.now()),message,ppn))
+
+def initWorker(configPath,journalPath,semaphores):
+    """
+    Prepares a (worker) process for the processing of PPNs, i.e., loads the configuration and opens its own journal
+    connection and HTTP session.
+    :param configPath: path to the configuration file
+    :param journalPath: path to the journal database
+    :param semaphores: the host semaphores shared by all processes as created by createHostSemaphores()
+    """
+    global journalConnection, dimensions, httpSession, rateLimiter, hostSemaphores
+    loadConfiguration(configPath)
+    hostSemaphores=semaphores
+    dimensions=[]
+    journalConnection=openJournal(journalPath)
+    httpSession=stabiFetch.createSession(poolSize=maxConcurrentDownloads,maxRetries=maxRetries,backoffFactor=retryBackoffFactor,
+                                         runningFromWithinStabi=runningFromWithinStabi,
+                                         verifySSL=not allowUnsafeSSLConnections_NEVER_USE_IN_PRODUCTION)
+    rateLimiter=stabiFetch.RateLimiter(maxRequestsPerSecond)
+
+def processPPN(ppn):
+    """
+    Creates the directories for a PPN, downloads its data and extracts its illustrations. Any error is recorded in the journal.
+    :param ppn: the PPN
+    :return: a tuple (PPN, path to the title page, error log line or None, summary)
+    """
+    downloadPathPrefix=downloadTempDir+"/"+ppn
+    savePathPrefix=extractedImagesDir+"/"+ppn
+
+    summaryString = "\nSUMMARY"
+    summaryString += "\n\tDownloads (fulltexts, original digitizations etc.) were, e.g., stored at: "+downloadPathPrefix
+    if not os.path.exists(downloadPathPrefix+"/"):
+        if verbose:
+            print("Creating "+downloadPathPrefix+"/")
+        os.mkdir(downloadPathPrefix+"/")
+
+    if not os.path.exists(savePathPrefix+"/"):
+        if verbose:
+            print("Creating "+savePathPrefix+"/")
+        os.mkdir(savePathPrefix+"/")
+    summaryString += "\n\tExtracted images were, e.g., stored at: " + savePathPrefix
+
+    metsModsDownloadPath=downloadPathPrefix + "/__metsmods/"
+    if not os.path.exists(metsModsDownloadPath):
+        if verbose:
+            print("Creating " + metsModsDownloadPath)
+        os.mkdir(metsModsDownloadPath)
+    summaryString += "\n\tMETS/MODS files were, e.g., stored at: " + metsModsDownloadPath
+
+    setPPNState(ppn,PPN_DOWNLOADING)
+    try:
+        pathToTitlePage,downloadErrors=downloadData(ppn,downloadPathPrefix,metsModsDownloadPath,savePathPrefix)
+    except Exception as ex:
+        template = "An exception of type {0} occurred. Arguments: {1!r}"
+        message = template.format(type(ex).__name__, ex.args)
+        setPPNState(ppn,PPN_FAILED,message)
+        return (ppn,"",str(datetime.now()) + "\t" + ppn + "\t" + message + "\t" + downloadPathPrefix + "\t" + metsModsDownloadPath,summaryString)
+    if downloadErrors:
+        # PPNs with missing files are processed again on the next run
+        message="Failed downloads: "+"; ".join(sorted(downloadErrors))
+        setPPNState(ppn,PPN_FAILED,message)
+        return (ppn,pathToTitlePage,str(datetime.now()) + "\t" + ppn + "\t" + message + "\t" + downloadPathPrefix + "\t" + metsModsDownloadPath,summaryString)
+    setPPNState(ppn,PPN_DONE)
+    return (ppn,pathToTitlePage,None,summaryString)
+
+if __name__ == "__main__":
+    # load configuration from 'config.yaml'
+    # all parameters are documented in 'config.yaml'
+    configPath='config.yaml'
+    loadConfiguration(configPath)
     # end of configuration
 
 
     ppns = []
-    dimensions = []
 
 
     if allowUnsafeSSLConnections_NEVER_USE_IN_PRODUCTION:
@@ -333,7 +566,10 @@ if __name__ == "__main__":
     with open(ppnListFile) as f:
         lines = f.readlines()
         for line in lines:
-           ppns.append(line.replace("\n", "").replace("PPN",""))
+           ppn=line.replace("\n", "").replace("PPN","")
+           if addPPNPrefix:
+               ppn="PPN"+ppn
+           ppns.append(ppn)
            i+=1
            if i>=debugLimit:
                break
@@ -345,90 +581,53 @@ if __name__ == "__main__":
     # ppns.append("PPN770184375")
 
     print("Number of documents to be processed: " + str(len(ppns)))
-    start = 0
-    end = len(ppns)
-    # in case of a prior abort of the script, try to resume from the last known state
-    if os.path.isfile(logFileName):
-        print("\nATTENTION! Log file found under %s. The script will try to continue processing. \nIf you want to restart, please remove the log file. \nThe script will continue in 15 seconds..."%logFileName)
+    # in case of a prior abort of the script, only the PPNs which have not been finished according to the journal are processed again
+    resumed=os.path.isfile(journalFileName)
+    journal=openJournal(journalFileName)
+    registerPPNs(journal,ppns)
+    unfinishedPPNs=getUnfinishedPPNs(journal,ppns)
+    journal.close()
+    if resumed:
+        print("\nATTENTION! Journal found under %s. The script will continue processing the %i unfinished of %i listed documents. \nIf you want to restart, please remove the journal file. \nThe script will continue in 15 seconds..."%(journalFileName,len(unfinishedPPNs),len(ppns)))
         sleep(15)
-        with open(logFileName, 'r') as log_file:
-            log_entries = log_file.readlines()
-            start = len(log_entries)
-    else:
-        with open(logFileName, 'w') as log_file:
-            pass
 
     # demo stuff - please remove if you want to work on real data
     #ppns=["3308099233"]#,"609921959"]
-    #end = len(ppns)
     # end demo
 
+    for directory in [sbbPrefix,downloadTempDir,extractedImagesDir]:
+        if not os.path.exists(directory+"/"):
+            if verbose:
+                print("Creating "+directory+"/")
+            os.mkdir(directory+"/")
+
     summaryString=""
 
     errorFile = open(errorLogFileName, "w")
 
     titlePagePaths=[]
-    for i in range(start,end):
-        sbbPrefix = "sbbget_downloads"
-        downloadPathPrefix="download_temp"
-        savePathPrefix="extracted_images"
-        ppn = ppns[i]
+    semaphores=createHostSemaphores()
+    if numberOfWorkers>1:
+        pool=multiprocessing.Pool(numberOfWorkers,initializer=initWorker,initargs=(configPath,journalFileName,semaphores))
+        results=pool.imap_unordered(processPPN,unfinishedPPNs)
+    else:
+        pool=None
+        initWorker(configPath,journalFileName,semaphores)
+        results=map(processPPN,unfinishedPPNs)
+
+    for ppn,pathToTitlePage,errorLine,summaryString in results:
         current_time = strftime("%Y-%m-%d_%H-%M-%S", gmtime())
         with open(logFileName, 'a') as log_file:
-            log_file.write(current_time + " " + ppn + " (Number: %d)" % (i) + "\n")
-
-        if addPPNPrefix:
-            if not ppn.startswith("PPN"):
-                ppn="PPN"+ppn
-
-        if not os.path.exists(sbbPrefix+"/"):
-            if verbose:
-                print("Creating "+sbbPrefix+"/")
-            os.mkdir(sbbPrefix+"/")
-
-        downloadPathPrefix= sbbPrefix + "/" + downloadPathPrefix
-        savePathPrefix = sbbPrefix + "/" + savePathPrefix
-
-        summaryString = "\nSUMMARY"
-        if not os.path.exists(downloadPathPrefix+"/"):
-            if verbose:
-                print("Creating "+downloadPathPrefix+"/")
-            os.mkdir(downloadPathPrefix+"/")
-        downloadPathPrefix=downloadPathPrefix+"/"+ppn
-
-        summaryString += "\n\tDownloads (fulltexts, original digitizations etc.) were, e.g., stored at: "+downloadPathPrefix
-        if not os.path.exists(downloadPathPrefix+"/"):
-            if verbose:
-                print("Creating "+downloadPathPrefix+"/")
-            os.mkdir(downloadPathPrefix+"/")
-
-        if not os.path.exists(savePathPrefix+"/"):
-            if verbose:
-                print("Creating "+savePathPrefix+"/")
-            os.mkdir(savePathPrefix+"/")
-        savePathPrefix=savePathPrefix+"/"+ppn
-        if not os.path.exists(savePathPrefix+"/"):
-            if verbose:
-                print("Creating "+savePathPrefix+"/")
-            os.mkdir(savePathPrefix+"/")
-        summaryString += "\n\tExtracted images were, e.g., stored at: " + savePathPrefix
-
-        metsModsDownloadPath=downloadPathPrefix + "/__metsmods/"
-        if not os.path.exists(metsModsDownloadPath):
-            if verbose:
-                print("Creating " + metsModsDownloadPath)
-            os.mkdir(metsModsDownloadPath)
-        summaryString += "\n\tMETS/MODS files were, e.g., stored at: " + metsModsDownloadPath
-
-        #debug
-        #try:
-        pathToTitlePage=downloadData(ppn,downloadPathPrefix,metsModsDownloadPath)
+            log_file.write(current_time + " " + ppn + (" FAILED" if errorLine else " DONE") + "\n")
+        if errorLine:
+            print("Error processing "+ppn)
+            errorFile.write(errorLine+"\n")
         if pathToTitlePage:
             titlePagePaths.append(pathToTitlePage)
-        #except Exception as ex:
-        #    template = "An exception of type {0} occurred. Arguments: {1!r}"
-        #    message = template.format(type(ex).__name__, ex.args)
-        #    errorFile.write(str(datetime.now()) + "\t" + ppn + "\t" + message + "\t" + downloadPathPrefix + "\t" + metsModsDownloadPath + "\n")
+
+    if pool:
+        pool.close()
+        pool.join()
 
     errorFile.close()
 
@@ -0,0 +1,109 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# shared HTTP layer for all scripts fetching content from the Berlin State Library, e.g., content.staatsbibliothek-berlin.de
+# a session keeps its connections alive and reuses them for subsequent requests to the same host, hence, the TLS handshake
+# has to be done only once per connection instead of once per file
+
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# HTTP status codes indicating a temporary problem of the server, requests answered with these codes will be retried
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# downloads are written in chunks of this size (in bytes), hence, memory usage does not depend on the size of the file
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class RateLimiter(object):
+    """
+    Limits the number of requests per second shared by all threads of a process.
+    """
+    def __init__(self, requestsPerSecond):
+        """
+        :param requestsPerSecond: the maximum number of requests per second, 0 or None disables the limit
+        """
+        self.interval = 1.0 / requestsPerSecond if requestsPerSecond else 0.0
+        self.lock = threading.Lock()
+        self.nextSlot = 0.0
+
+    def wait(self):
+        """
+        Blocks until the next request may be sent.
+        """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.nextSlot)
+            self.nextSlot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def createSession(poolSize=10, maxRetries=5, backoffFactor=0.5, runningFromWithinStabi=False, verifySSL=True):
+    """
+    Creates a HTTP session with a keep-alive connection pool and exponential backoff retries.
+    A session may be shared by several threads but must not be shared between processes.
+    :param poolSize: the maximum number of connections kept open per host, should match the number of concurrent downloads
+    :param maxRetries: the maximum number of retries per request
+    :param backoffFactor: the delay between retries is backoffFactor * 2^(retry-1) seconds
+    :param runningFromWithinStabi: Berlin State Library internal setting, ignores all proxy settings of the environment
+    :param verifySSL: setting this variable to False will disable SSL certificate verification - USE AT YOUR OWN RISK!
+    :return: the session
+    """
+    session = requests.Session()
+    retry = Retry(total=maxRetries, backoff_factor=backoffFactor, status_forcelist=RETRY_STATUS_CODES)
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = verifySSL
+    if runningFromWithinStabi:
+        # the equivalent of installing an urllib opener with an empty ProxyHandler
+        session.trust_env = False
+    return session
+
+
+def downloadFile(session, url, targetPath, rateLimiter=None, timeout=120):
+    """
+    Downloads a file using the given session. The file is streamed to a temporary file next to the target path which is
+    renamed to the target path once the download is complete, i.e., an interrupted download never leaves a partial file
+    at the target path.
+    ATTENTION! Should be surrounded by a try-catch statement as it does not handle network errors etc.
+    :param session: a session created by createSession()
+    :param url: the URL of the file
+    :param targetPath: the local path the file will be saved to
+    :param rateLimiter: an optional RateLimiter
+    :param timeout: the timeout in seconds for connecting to the server and for waiting for data
+    :return: the path to the downloaded file
+    """
+    if rateLimiter:
+        rateLimiter.wait()
+    with session.get(url, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        tempPath = targetPath + ".part"
+        try:
+            with open(tempPath, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(tempPath, targetPath)
+        except BaseException:
+            # the temporary file does not exist if it could not be created, the original error is raised in any case
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+    return targetPath
@@ -0,0 +1,23 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# the tested modules are located next to the scripts using them (as the scripts import them)
+# usage: python -m pytest tests
+
+import os
+import sys
+
+repositoryPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for directory in ["sbbget", "oai-analyzer", "pica_plus", "fulltext-tools"]:
+    sys.path.insert(0, os.path.join(repositoryPath, directory))
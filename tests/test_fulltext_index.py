@@ -0,0 +1,124 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sqlite3
+
+import pytest
+
+import fulltext_index
+
+ALTO_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<alto xmlns="http://www.loc.gov/standards/alto/ns-v2#">
+<Layout><Page ID="P1"><PrintSpace>
+%s
+</PrintSpace></Page></Layout>
+</alto>
+"""
+
+
+def createTextBlock(blockID, lines):
+    textLines = "".join("<TextLine>%s</TextLine>" % "".join('<String CONTENT="%s"/>' % word for word in line.split())
+                        for line in lines)
+    return '<TextBlock ID="%s" HPOS="10" VPOS="20" WIDTH="300" HEIGHT="40">%s</TextBlock>' % (blockID, textLines)
+
+
+def writeALTOFile(basePath, ppn, page, blocks, mtime=None):
+    directory = os.path.join(basePath, ppn, "FILE_%04i_FULLTEXT" % page)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "%08i.xml" % page)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(ALTO_TEMPLATE % "\n".join(createTextBlock(blockID, lines) for blockID, lines in blocks))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(fulltext_index, "verbose", False)
+    basePath = str(tmp_path / "downloads")
+    writeALTOFile(basePath, "PPN1", 1, [("TB1", ["Berliner Zeitung", "vom Montag"]), ("TB2", ["Wetter in Potsdam"])], 1000)
+    writeALTOFile(basePath, "PPN1", 2, [("TB1", ["Zeitschrift für Berlin"])], 1000)
+    writeALTOFile(basePath, "PPN2", 1, [("TB1", ["Hamburger Nachrichten"])], 1000)
+    conn = sqlite3.connect(str(tmp_path / "index.db"))
+    fulltext_index.setupDatabase(conn)
+    yield conn, basePath
+    conn.close()
+
+
+def hitsOf(conn, query):
+    return sorted((ppn, page, altoID) for ppn, page, altoID, *_ in fulltext_index.search(conn, query))
+
+
+def test_parseALTOBlocks(tmp_path):
+    path = writeALTOFile(str(tmp_path), "PPN1", 1, [("TB1", ["Berliner Zeitung", "vom Montag"]), ("TB2", [])])
+    # every TextLine starts a new line, empty blocks are skipped
+    assert fulltext_index.parseALTOBlocks(path) == [("TB1", 10.0, 20.0, 300.0, 40.0, "Berliner Zeitung \nvom Montag")]
+    noALTOPath = str(tmp_path / "mets.xml")
+    with open(noALTOPath, "w") as f:
+        f.write('<mets xmlns="http://www.loc.gov/METS/"><fileSec/></mets>')
+    assert fulltext_index.parseALTOBlocks(noALTOPath) is None
+
+
+def test_searchKeywordPhrasePrefix(index):
+    conn, basePath = index
+    assert fulltext_index.updateIndex(conn, basePath) == (3, 4)
+    assert hitsOf(conn, "Potsdam") == [("PPN1", 1, "TB2")]
+    assert hitsOf(conn, '"Berliner Zeitung"') == [("PPN1", 1, "TB1")]
+    assert hitsOf(conn, '"Zeitung Berliner"') == []
+    assert hitsOf(conn, "Zeit*") == [("PPN1", 1, "TB1"), ("PPN1", 2, "TB1")]
+    assert hitsOf(conn, "Berlin*") == [("PPN1", 1, "TB1"), ("PPN1", 2, "TB1")]
+    # snippets highlight the matches
+    assert fulltext_index.search(conn, "Potsdam")[0][-1] == "Wetter in [Potsdam]"
+
+
+def test_invalidQueriesRaiseOperationalError(index):
+    conn, basePath = index
+    fulltext_index.updateIndex(conn, basePath)
+    for query in ["Berlin-Mitte", '"Berliner Zeitung']:
+        with pytest.raises(sqlite3.OperationalError):
+            fulltext_index.search(conn, query)
+    # quoted, special characters are part of a phrase
+    assert hitsOf(conn, '"Berlin-Mitte"') == []
+
+
+def test_updateSkipsUnchangedFiles(index):
+    conn, basePath = index
+    assert fulltext_index.updateIndex(conn, basePath) == (3, 4)
+    assert fulltext_index.updateIndex(conn, basePath) == (0, 0)
+    assert conn.execute("SELECT COUNT(*) FROM blocks;").fetchone()[0] == 4
+
+
+def test_updateReplacesBlocksOfChangedFiles(index):
+    conn, basePath = index
+    fulltext_index.updateIndex(conn, basePath)
+    # the changed file has a new size and modification time, its former blocks must not remain in the index
+    writeALTOFile(basePath, "PPN2", 1, [("TB1", ["Hamburger Abendblatt"]), ("TB2", ["Altona"])], 2000)
+    assert fulltext_index.updateIndex(conn, basePath) == (1, 2)
+    assert hitsOf(conn, "Nachrichten") == []
+    assert hitsOf(conn, "Abendblatt") == [("PPN2", 1, "TB1")]
+    assert hitsOf(conn, "Altona") == [("PPN2", 1, "TB2")]
+    assert conn.execute("SELECT COUNT(*) FROM blocks WHERE ppn='PPN2';").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM indexed_files;").fetchone()[0] == 3
+
+
+def test_updateRemovesDeletedFiles(index):
+    conn, basePath = index
+    fulltext_index.updateIndex(conn, basePath)
+    os.remove(os.path.join(basePath, "PPN1", "FILE_0002_FULLTEXT", "00000002.xml"))
+    assert fulltext_index.updateIndex(conn, basePath) == (0, 0)
+    assert hitsOf(conn, "Zeitschrift") == []
+    assert hitsOf(conn, "Zeit*") == [("PPN1", 1, "TB1")]
+    assert conn.execute("SELECT COUNT(*) FROM indexed_files;").fetchone()[0] == 2
@@ -0,0 +1,70 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tarfile as TAR
+
+import illustrationArchive
+
+
+def writeArchive(tmp_path):
+    tarPath = str(tmp_path / "PPN1.tar")
+    savedIllustration = tmp_path / "saved.jpg"
+    savedIllustration.write_bytes(b"saved illustration" * 100)
+    archive = illustrationArchive.IllustrationArchiveWriter(tarPath)
+    archive.addBytes("PPN1/0001_block1.jpg", b"first illustration", "0001", "block1", 10, 20, mtime=0)
+    archive.addBytes("PPN1/0002_block2.jpg", b"x" * 1000, "0002", "block2", 30, 40, mtime=0)
+    archive.addFile(str(savedIllustration), "0003", "block3", 50, 60)
+    # the index is only written for completely written archives
+    assert not os.path.exists(illustrationArchive.indexPathOf(tarPath))
+    archive.close()
+    return tarPath
+
+
+def test_indexMatchesArchive(tmp_path):
+    tarPath = writeArchive(tmp_path)
+    entries = illustrationArchive.readIndex(tarPath)
+    assert [e["page"] for e in entries] == ["0001", "0002", "0003"]
+    assert [e["altoID"] for e in entries] == ["block1", "block2", "block3"]
+    assert [(e["width"], e["height"]) for e in entries] == [(10, 20), (30, 40), (50, 60)]
+    assert illustrationArchive.countIllustrations(tarPath) == 3
+    with TAR.open(tarPath, "r") as tarBall:
+        for entry in entries:
+            assert illustrationArchive.readIllustration(tarPath, entry) == tarBall.extractfile(entry["name"]).read()
+    assert illustrationArchive.readIllustration(tarPath, entries[0]) == b"first illustration"
+
+
+def test_buildIndexOfArchiveWithoutIndex(tmp_path):
+    tarPath = writeArchive(tmp_path)
+    entries = illustrationArchive.readIndex(tarPath)
+    os.remove(illustrationArchive.indexPathOf(tarPath))
+    assert illustrationArchive.readIndex(tarPath) is None
+    assert illustrationArchive.countIllustrations(tarPath) == 3
+    builtEntries = illustrationArchive.readOrBuildIndex(tarPath)
+    assert [(e["name"], e["offset"], e["size"]) for e in builtEntries] == [(e["name"], e["offset"], e["size"]) for e in entries]
+    illustrationArchive.buildIndex(tarPath, save=True)
+    assert [e["offset"] for e in illustrationArchive.readIndex(tarPath)] == [e["offset"] for e in entries]
+
+
+def test_countWithoutIndexSkipsDirectories(tmp_path):
+    # archives written with tarBall.add() may contain directory members which are not illustrations
+    tarPath = str(tmp_path / "PPN2.tar")
+    directory = tmp_path / "PPN2"
+    directory.mkdir()
+    (directory / "0001_block1.jpg").write_bytes(b"illustration")
+    with TAR.open(tarPath, "w") as tarBall:
+        tarBall.add(str(directory), arcname="PPN2")
+    assert illustrationArchive.countIllustrations(tarPath) == 1
+    illustrationArchive.buildIndex(tarPath, save=True)
+    assert illustrationArchive.countIllustrations(tarPath) == 1
@@ -0,0 +1,95 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import metsIndex
+
+# a small METS/MODS file with two pages, the second one is the title page
+METS_MODS = """<?xml version="1.0" encoding="UTF-8"?>
+<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:mods="http://www.loc.gov/mods/v3" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mets:dmdSec ID="DMDLOG_0000"><mets:mdWrap MDTYPE="MODS"><mets:xmlData>
+    <mods:mods><mods:titleInfo><mods:title>Orbis pictus</mods:title></mods:titleInfo></mods:mods>
+  </mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:dmdSec ID="DMDLOG_0001"><mets:mdWrap MDTYPE="MODS"><mets:xmlData>
+    <mods:mods><mods:titleInfo><mods:title>Second MODS</mods:title></mods:titleInfo></mods:mods>
+  </mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:fileSec>
+    <mets:fileGrp USE="PRESENTATION">
+      <mets:file ID="FILE_0001_PRESENTATION"><mets:FLocat LOCTYPE="URL" xlink:href="https://example.org/0001.tif"/></mets:file>
+      <mets:file ID="FILE_0002_PRESENTATION"><mets:FLocat LOCTYPE="URL" xlink:href="https://example.org/0002.tif"/></mets:file>
+    </mets:fileGrp>
+    <mets:fileGrp USE="FULLTEXT">
+      <mets:file ID="FILE_0001_FULLTEXT"><mets:FLocat LOCTYPE="URL" xlink:href="https://example.org/0001.xml"/></mets:file>
+      <mets:file ID="FILE_0002_FULLTEXT"><mets:FLocat LOCTYPE="OTHER" xlink:href="file:///0002.xml"/></mets:file>
+    </mets:fileGrp>
+  </mets:fileSec>
+  <mets:structMap TYPE="LOGICAL">
+    <mets:div ID="LOG_0000" TYPE="monograph">
+      <mets:div ID="LOG_0001" TYPE="title_page"/>
+      <mets:div ID="LOG_0002" TYPE="chapter"/>
+    </mets:div>
+  </mets:structMap>
+  <mets:structMap TYPE="PHYSICAL">
+    <mets:div ID="PHYS_0000" TYPE="physSequence">
+      <mets:div ID="PHYS_0001" TYPE="page">
+        <mets:fptr FILEID="FILE_0001_PRESENTATION"/><mets:fptr FILEID="FILE_0001_FULLTEXT"/>
+      </mets:div>
+      <mets:div ID="PHYS_0002" TYPE="page">
+        <mets:fptr FILEID="FILE_0002_PRESENTATION"/><mets:fptr FILEID="FILE_0002_FULLTEXT"/>
+      </mets:div>
+    </mets:div>
+  </mets:structMap>
+  <mets:structLink>
+    <mets:smLink xlink:from="LOG_0000" xlink:to="PHYS_0001"/>
+    <mets:smLink xlink:from="LOG_0002" xlink:to="PHYS_0001"/>
+    <mets:smLink xlink:from="LOG_0001" xlink:to="PHYS_0002"/>
+    <mets:smLink xlink:from="LOG_0002" xlink:to="PHYS_0002"/>
+  </mets:structLink>
+</mets:mets>
+"""
+
+
+def createIndex(tmp_path):
+    path = tmp_path / "PPN1.xml"
+    path.write_text(METS_MODS, encoding="utf-8")
+    return metsIndex.METSIndex(str(path))
+
+
+def test_structMapAndLinks(tmp_path):
+    mets = createIndex(tmp_path)
+    assert mets.fileID2physID == {"FILE_0001_PRESENTATION": "PHYS_0001", "FILE_0001_FULLTEXT": "PHYS_0001",
+                                  "FILE_0002_PRESENTATION": "PHYS_0002", "FILE_0002_FULLTEXT": "PHYS_0002"}
+    # the last smLink pointing to a physical page wins
+    assert mets.physID2logicalID == {"PHYS_0001": "LOG_0002", "PHYS_0002": "LOG_0002"}
+    assert mets.titlePageLogID == "LOG_0001"
+    assert mets.titlePagePhysID == "PHYS_0002"
+    assert mets.seenPhysIDs == set()
+
+
+def test_fileGroupsAndMODS(tmp_path):
+    mets = createIndex(tmp_path)
+    assert mets.files("PRESENTATION") == [("FILE_0001_PRESENTATION", ["https://example.org/0001.tif"]),
+                                          ("FILE_0002_PRESENTATION", ["https://example.org/0002.tif"])]
+    # only FLocat nodes of type URL are listed
+    assert mets.files("FULLTEXT") == [("FILE_0001_FULLTEXT", ["https://example.org/0001.xml"]), ("FILE_0002_FULLTEXT", [])]
+    assert mets.files("THUMBS") == []
+    # the first mods:mods element is kept completely
+    assert mets.mods.find(metsIndex.modsNamespace + "titleInfo/" + metsIndex.modsNamespace + "title").text == "Orbis pictus"
+
+
+def test_noTitlePage(tmp_path):
+    path = tmp_path / "PPN2.xml"
+    path.write_text(METS_MODS.replace('TYPE="title_page"', 'TYPE="chapter"'), encoding="utf-8")
+    mets = metsIndex.METSIndex(str(path))
+    assert mets.titlePageLogID == ""
+    assert mets.titlePagePhysID == ""
@@ -0,0 +1,214 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+import requests
+from lxml import etree
+
+import oaiHarvest
+
+PARAMS = {"metadataPrefix": "oai_dc", "set": "all"}
+
+
+class FakeResponse(object):
+    def __init__(self, xml):
+        self.xml = etree.fromstring(xml.encode("utf-8"))
+
+
+class FakeSickle(object):
+    """
+    Answers ListRecords requests with OAI-PMH responses of pageSize records. The resumptionToken is the position of the
+    next record, failures lists the positions at which the next request raises a network error, expiredTokens lists the
+    resumptionTokens rejected by the next request using them.
+    """
+    def __init__(self, pageSize=2):
+        self.pageSize = pageSize
+        # identifier -> (datestamp, deleted, title)
+        self.records = dict()
+        self.failures = []
+        self.expiredTokens = []
+
+    def addRecord(self, ppn, datestamp, title=None, deleted=False):
+        self.records.pop("oai:example.org:" + ppn, None)
+        self.records["oai:example.org:" + ppn] = (datestamp, deleted, title or "Title of " + ppn)
+
+    def harvest(self, verb, **params):
+        assert verb == "ListRecords"
+        if params.get("resumptionToken") in self.expiredTokens:
+            self.expiredTokens.remove(params["resumptionToken"])
+            return FakeResponse('<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><error code="badResumptionToken"/></OAI-PMH>')
+        if "resumptionToken" in params:
+            position, _, fromDatestamp = params["resumptionToken"].partition(":")
+            position, fromDatestamp = int(position), fromDatestamp or None
+        else:
+            position, fromDatestamp = 0, params.get("from")
+        if position in self.failures:
+            self.failures.remove(position)
+            raise requests.exceptions.ConnectionError("connection reset")
+        matchingRecords = [(k, v) for k, v in self.records.items() if fromDatestamp is None or v[0] >= fromDatestamp]
+        xml = '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><ListRecords>'
+        if not matchingRecords:
+            return FakeResponse('<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><error code="noRecordsMatch"/></OAI-PMH>')
+        for identifier, (datestamp, deleted, title) in matchingRecords[position:position + self.pageSize]:
+            if deleted:
+                xml += '<record><header status="deleted"><identifier>%s</identifier><datestamp>%s</datestamp></header></record>' % (identifier, datestamp)
+            else:
+                xml += ('<record><header><identifier>%s</identifier><datestamp>%s</datestamp></header><metadata>'
+                        '<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                        '<dc:title>%s</dc:title><dc:identifier>%s</dc:identifier></oai_dc:dc></metadata></record>') \
+                       % (identifier, datestamp, title, identifier.rpartition(":")[2])
+        if position + self.pageSize < len(matchingRecords):
+            xml += "<resumptionToken>%i:%s</resumptionToken>" % (position + self.pageSize, fromDatestamp or "")
+        return FakeResponse(xml + "</ListRecords></OAI-PMH>")
+
+
+def createHarvester(tmp_path, sickle):
+    harvester = oaiHarvest.OAIHarvester("https://example.org/oai", str(tmp_path / "records.jsonl.gz"), maxRetries=1,
+                                        backoffFactor=0, log=lambda message: None)
+    harvester.sickle = sickle
+    return harvester
+
+
+def createSickle(numberOfRecords):
+    sickle = FakeSickle()
+    for i in range(numberOfRecords):
+        sickle.addRecord("PPN%i" % i, "2021-01-01T00:00:%02iZ" % i)
+    return sickle
+
+
+def identifiersOf(storePath, **kwargs):
+    return [r["identifier"].rpartition(":")[2] for r in oaiHarvest.readRecords(storePath, **kwargs)]
+
+
+def test_resumeAfterInterruptedPage(tmp_path):
+    sickle = createSickle(7)
+    harvester = createHarvester(tmp_path, sickle)
+    # the request of the third page fails more often than it is retried
+    sickle.failures = [4, 4]
+    with pytest.raises(requests.exceptions.ConnectionError):
+        harvester.harvest(PARAMS)
+    state = oaiHarvest.readState(harvester.storePath)
+    assert not state["complete"]
+    assert state["numberOfRecords"] == 4
+    # the process died while a page was being written
+    with open(harvester.storePath, "ab") as f:
+        f.write(b"\x1f\x8b incomplete page")
+    assert identifiersOf(harvester.storePath) == ["PPN0", "PPN1", "PPN2", "PPN3"]
+    # a single failure is retried
+    sickle.failures = [6]
+    assert harvester.harvest(PARAMS) == 3
+    state = oaiHarvest.readState(harvester.storePath)
+    assert state["complete"]
+    assert state["numberOfRecords"] == 7
+    assert os.path.getsize(harvester.storePath) == state["storeSize"]
+    assert identifiersOf(harvester.storePath) == ["PPN%i" % i for i in range(7)]
+
+
+def test_maxRecordsPerCall(tmp_path):
+    harvester = createHarvester(tmp_path, createSickle(7))
+    # the harvest stops after the page on which maxRecords has been reached
+    assert harvester.harvest(PARAMS, maxRecords=3) == 4
+    assert harvester.harvest(PARAMS, maxRecords=3) == 3
+    assert oaiHarvest.readState(harvester.storePath)["complete"]
+    # a complete harvest is started again
+    assert harvester.harvest(PARAMS, maxRecords=3) == 4
+    assert identifiersOf(harvester.storePath) == ["PPN0", "PPN1", "PPN2", "PPN3"]
+
+
+def test_restartAfterExpiredResumptionToken(tmp_path):
+    sickle = createSickle(7)
+    harvester = createHarvester(tmp_path, sickle)
+    assert harvester.harvest(PARAMS, maxRecords=2) == 2
+    # the token expires between two runs and a record is changed in the meantime
+    sickle.expiredTokens = [oaiHarvest.readState(harvester.storePath)["resumptionToken"]]
+    sickle.addRecord("PPN0", "2021-02-01T00:00:00Z", title="Changed title")
+    # the records stored before do not count towards maxRecords
+    assert harvester.harvest(PARAMS, maxRecords=2) == 3
+    sickle.expiredTokens.append(oaiHarvest.readState(harvester.storePath)["resumptionToken"])
+    assert harvester.harvest(PARAMS, maxRecords=2) == 2
+    # the changed record is listed last
+    assert harvester.harvest(PARAMS, maxRecords=2) == 1
+    state = oaiHarvest.readState(harvester.storePath)
+    assert state["complete"]
+    assert state["numberOfRecords"] == 8
+    assert identifiersOf(harvester.storePath) == ["PPN1", "PPN2", "PPN3", "PPN4", "PPN5", "PPN6", "PPN0"]
+    titles = dict((r["metadata"]["identifier"][0], r["metadata"]["title"][0]) for r in oaiHarvest.readRecords(harvester.storePath))
+    assert titles["PPN0"] == "Changed title"
+    # the harvest is restarted only once per call
+    harvester.harvest(PARAMS, maxRecords=2)
+    sickle.expiredTokens = ["2:", "2:"]
+    with pytest.raises(oaiHarvest.oaiexceptions.BadResumptionToken):
+        harvester.harvest(PARAMS)
+
+
+def test_incrementalHarvestWithDeletions(tmp_path):
+    sickle = createSickle(5)
+    harvester = createHarvester(tmp_path, sickle)
+    assert harvester.harvest(PARAMS, incremental=True) == 5
+    assert oaiHarvest.readState(harvester.storePath)["lastDatestamp"] == "2021-01-01T00:00:04Z"
+    sickle.addRecord("PPN1", "2021-02-01T00:00:00Z", title="Changed title")
+    sickle.addRecord("PPN3", "2021-02-01T00:00:00Z", deleted=True)
+    sickle.addRecord("PPN5", "2021-02-01T00:00:00Z")
+    # the record with the last datestamp of the former harvest is requested again (from is inclusive)
+    assert harvester.harvest(PARAMS, incremental=True) == 4
+    state = oaiHarvest.readState(harvester.storePath)
+    assert state["complete"]
+    assert state["deltaStart"] is not None
+    assert state["requestParams"]["from"] == "2021-01-01T00:00:04Z"
+    # changed records are returned in the position of their latest version
+    assert identifiersOf(harvester.storePath) == ["PPN0", "PPN2", "PPN4", "PPN1", "PPN5"]
+    assert identifiersOf(harvester.storePath, includeDeleted=True) == ["PPN0", "PPN2", "PPN4", "PPN1", "PPN3", "PPN5"]
+    titles = dict((r["metadata"]["identifier"][0], r["metadata"]["title"][0]) for r in oaiHarvest.readRecords(harvester.storePath))
+    assert titles["PPN1"] == "Changed title"
+    # the next update merges the former one
+    sickle.addRecord("PPN0", "2021-03-01T00:00:00Z", deleted=True)
+    assert harvester.harvest(PARAMS, incremental=True) == 4
+    assert identifiersOf(harvester.storePath) == ["PPN2", "PPN4", "PPN1", "PPN5"]
+    # nothing has changed since the last update
+    del sickle.records["oai:example.org:PPN0"]
+    assert harvester.harvest(PARAMS, incremental=True) == 0
+    assert oaiHarvest.readState(harvester.storePath)["complete"]
+    assert identifiersOf(harvester.storePath) == ["PPN2", "PPN4", "PPN1", "PPN5"]
+
+
+def test_interruptedCompaction(tmp_path):
+    sickle = createSickle(3)
+    harvester = createHarvester(tmp_path, sickle)
+    harvester.harvest(PARAMS)
+    sickle.addRecord("PPN0", "2021-02-01T00:00:00Z", deleted=True)
+    harvester.harvest(PARAMS, incremental=True)
+    expectedIdentifiers = identifiersOf(harvester.storePath)
+    # the process died after the compacted store and the pending compaction have been saved
+    state = oaiHarvest.readState(harvester.storePath)
+    with open(harvester.storePath + ".part", "wb") as f:
+        pages = oaiHarvest.writePages(f, oaiHarvest.readRecords(harvester.storePath))
+        storeSize = f.tell()
+    state["compaction"] = {"storeSize": storeSize, "numberOfRecords": 2, "deltaStart": None, "pages": pages}
+    oaiHarvest.writeState(harvester.storePath, state)
+    state = oaiHarvest.readState(harvester.storePath)
+    assert "compaction" not in state
+    assert state["deltaStart"] is None
+    assert state["numberOfRecords"] == 2
+    assert not os.path.exists(harvester.storePath + ".part")
+    assert os.path.getsize(harvester.storePath) == storeSize
+    assert identifiersOf(harvester.storePath) == expectedIdentifiers == ["PPN1", "PPN2"]
+
+
+def test_fieldProjection(tmp_path):
+    harvester = createHarvester(tmp_path, createSickle(3))
+    harvester.harvest(PARAMS)
+    records = list(oaiHarvest.readRecords(harvester.storePath, fields=["identifier", "date"]))
+    assert [r["metadata"] for r in records] == [{"identifier": ["PPN%i" % i]} for i in range(3)]
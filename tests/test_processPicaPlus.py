@@ -0,0 +1,89 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import processPicaPlus
+
+# titles with multi-byte characters of different lengths: Polish, Cyrillic, Greek, Chinese, and a 4-byte character
+TITLES = ["Pan Tadeusz czyli ostatni zajazd na Litwie, Żółć", "Война и мир", "Ὀδύσσεια", "西遊記", "Notenschrift \U0001d11e"]
+
+
+def createRecord(i, title):
+    return ("\x1e003@ \x1f0%09i\n\x1e010@ \x1fager\n\x1e021A \x1fa%s\n\x1e028A \x1fdPaul\x1faCelan\x1f0gnd/118519859\n"
+            "\x1e028B/01 \x1fdGisèle\x1faLestrange\n\x1e033A \x1fpBerlin\x1fnVerlag\n" % (i, title)).encode("utf-8")
+
+
+def writePicaPlusFile(tmp_path, numberOfRecords=20):
+    path = str(tmp_path / "test.pp")
+    records = [createRecord(i, TITLES[i % len(TITLES)]) for i in range(numberOfRecords)]
+    with open(path, "wb") as f:
+        f.write(b"\x1d".join(records))
+    return path
+
+
+def test_parseRecord():
+    fields = processPicaPlus.parseRecord(createRecord(1, "Gedichte").replace(b"\x1e", b"", 1))
+    assert fields[0] == ("003@", ["0000000001"])
+    assert ("028A", ["dPaul", "aCelan", "0gnd/118519859"]) in fields
+    # the tags are returned with occurrence and filtered without occurrence
+    assert ("028B/01", ["dGisèle", "aLestrange"]) in fields
+    assert [tag for tag, _ in processPicaPlus.parseRecord(createRecord(1, "Gedichte"), ["003@", "028B"])] == ["003@", "028B/01"]
+    assert processPicaPlus.parseRecord(b"\r\n\x1e") is None
+
+
+def test_recordsSplitAcrossBuffers(tmp_path):
+    path = writePicaPlusFile(tmp_path)
+    expectedRecords = list(processPicaPlus.readRecords(path))
+    assert len(expectedRecords) == 20
+    assert [fields[2] for fields in expectedRecords[:len(TITLES)]] == [("021A", ["a" + title]) for title in TITLES]
+    # buffers ending within records, fields, and multi-byte characters
+    for bufferSize in [1, 2, 3, 7, 64]:
+        assert list(processPicaPlus.readRecords(path, bufferSize=bufferSize)) == expectedRecords
+
+
+def test_chunksStartAtRecordSeparators(tmp_path):
+    path = writePicaPlusFile(tmp_path)
+    expectedRecords = list(processPicaPlus.readRecords(path))
+    with open(path, "rb") as f:
+        content = f.read()
+    for chunkSize in [1, 50, 333, len(content) - 1, len(content) * 2]:
+        chunks = processPicaPlus.findChunks(path, chunkSize)
+        assert chunks[0][0] == 0
+        assert chunks[-1][1] == len(content)
+        for (start, end), (nextStart, _) in zip(chunks, chunks[1:]):
+            assert end == nextStart
+            assert content[nextStart:nextStart + 1] == processPicaPlus.RECORD_SEPARATOR
+        records = [fields for start, end in chunks for fields in processPicaPlus.readRecords(path, bufferSize=16, start=start, end=end)]
+        assert records == expectedRecords
+
+
+def test_textOutputSkipsOccurrences(tmp_path, monkeypatch):
+    path = writePicaPlusFile(tmp_path, 2)
+    monkeypatch.setattr(processPicaPlus, "shardDir", str(tmp_path) + "/")
+    monkeypatch.setattr(processPicaPlus, "createTextOutput", True)
+    monkeypatch.setattr(processPicaPlus, "createParquetOutput", False)
+    assert processPicaPlus.processChunk((0, path, 0, None)) == (0, {"ger": 2}, 2)
+    with open(processPicaPlus.shardPathOf("ger", 0), "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    # fields with occurrence are skipped as by the former byte-by-byte parser, 010@ is written as empty line as before
+    assert lines == ["", "0000000000\t021A\t%s " % TITLES[0], "0000000000\t028A\tCelan, Paul@gnd/118519859", "0000000000\t033A\tVerlag@Berlin",
+                     "", "0000000001\t021A\t%s " % TITLES[1], "0000000001\t028A\tCelan, Paul@gnd/118519859", "0000000001\t033A\tVerlag@Berlin"]
+
+
+def test_recordToRowIncludesSecondaryAuthors():
+    record = processPicaPlus.parseRecord(createRecord(1, "Gedichte") + "\x1e011@ \x1fa[ca. 1952]\n\x1e019@ \x1faXA-DE\n".encode("utf-8"))
+    language, row = processPicaPlus.recordToRow(record)
+    assert language == "ger"
+    assert row == {"ppn": "0000000001", "title": "Gedichte ", "authors": ["Celan, Paul", "Lestrange, Gisèle"],
+                   "author_gnds": ["gnd/118519859", None], "publisher": "Verlag", "place": "Berlin", "year": 1952,
+                   "country": "XA-DE"}
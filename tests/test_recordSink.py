@@ -0,0 +1,108 @@
+# Copyright 2021 David Zellhoefer
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+import recordSink
+
+FORMATS = [recordSink.SQLITE, recordSink.CSV, recordSink.PARQUET]
+FILE_NAMES = {recordSink.SQLITE: "analyticaldf.db", recordSink.CSV: "analyticaldf.csv", recordSink.PARQUET: "analyticaldf"}
+
+
+def openSink(tmp_path, format, resume=True, batchSize=2):
+    if format == recordSink.PARQUET:
+        pytest.importorskip("pyarrow")
+    return recordSink.RecordSink(str(tmp_path / FILE_NAMES[format]), format=format, columns=["ppn", "title"],
+                                 batchSize=batchSize, resume=resume)
+
+
+@pytest.mark.parametrize("format", FORMATS)
+def test_resumeAfterInterruption(tmp_path, format):
+    sink = openSink(tmp_path, format)
+    for i in range(5):
+        sink.write({"ppn": "PPN%i" % i, "title": "Title %i" % i})
+    # the run is interrupted without closing the sink, only complete batches have been written
+    if format == recordSink.SQLITE:
+        sink.conn.close()
+    sink = openSink(tmp_path, format)
+    assert sink.processedPPNs() == {"PPN0", "PPN1", "PPN2", "PPN3"}
+    sink.write({"ppn": "PPN4", "title": "Title 4"})
+    sink.close()
+    sink = openSink(tmp_path, format)
+    df = sink.read()
+    assert sorted(df["ppn"]) == ["PPN0", "PPN1", "PPN2", "PPN3", "PPN4"]
+    sink.close()
+    # without resuming, the records of former runs are removed
+    sink = openSink(tmp_path, format, resume=False)
+    assert sink.processedPPNs() == set()
+    sink.close()
+
+
+@pytest.mark.parametrize("format", FORMATS)
+def test_newKeysAndLatestRecord(tmp_path, format):
+    sink = openSink(tmp_path, format)
+    sink.write({"ppn": "PPN0", "title": "Old title"})
+    sink.write({"ppn": "PPN1", "title": "Title 1", "ambiguous": "True"})
+    sink.write({"ppn": "PPN0", "title": "New title"})
+    sink.close()
+    sink = openSink(tmp_path, format)
+    # columns added by a former run are kept
+    assert sink.columns == ["ppn", "title", "ambiguous"]
+    assert sink.storedValues("title") == {"PPN0": "New title", "PPN1": "Title 1"}
+    assert sink.storedValues("ambiguous") == {"PPN0": "", "PPN1": "True"}
+    df = sink.read().set_index("ppn")
+    assert len(df) == 2
+    assert df.loc["PPN0", "title"] == "New title"
+    assert df.loc["PPN1", "ambiguous"] == "True"
+    sink.close()
+
+
+def test_incompleteCSVLineIsRemoved(tmp_path):
+    sink = openSink(tmp_path, recordSink.CSV)
+    sink.write({"ppn": "PPN0", "title": "Title 0"})
+    sink.write({"ppn": "PPN1", "title": "Title 1"})
+    sink.close()
+    with open(sink.path, "a", encoding="utf-8") as f:
+        f.write("PPN2;Incompl")
+    sink = openSink(tmp_path, recordSink.CSV)
+    assert sink.processedPPNs() == {"PPN0", "PPN1"}
+    sink.write({"ppn": "PPN2", "title": "Title 2"})
+    sink.close()
+    assert list(sink.read()["title"]) == ["Title 0", "Title 1", "Title 2"]
+
+
+def test_csvHeaderOfFormerVersionIsMigrated(tmp_path):
+    path = tmp_path / FILE_NAMES[recordSink.CSV]
+    path.write_text("ppn;publisher\nPPN0;Publisher 0\n", encoding="utf-8")
+    sink = openSink(tmp_path, recordSink.CSV)
+    assert sink.columns == ["ppn", "title", "publisher"]
+    sink.write({"ppn": "PPN1", "title": "Title 1", "publisher": "Publisher 1"})
+    sink.close()
+    assert path.read_text(encoding="utf-8").splitlines() == ["ppn;title;publisher", "PPN0;;Publisher 0", "PPN1;Title 1;Publisher 1"]
+
+
+def test_incompleteParquetPartIsIgnored(tmp_path):
+    sink = openSink(tmp_path, recordSink.PARQUET)
+    sink.write({"ppn": "PPN0", "title": "Title 0"})
+    sink.write({"ppn": "PPN1", "title": "Title 1"})
+    with open(os.path.join(sink.path, "part-00001.parquet.tmp"), "wb") as f:
+        f.write(b"PAR1 incomplete")
+    sink = openSink(tmp_path, recordSink.PARQUET)
+    assert sink.numberOfParts == 1
+    assert sink.processedPPNs() == {"PPN0", "PPN1"}
+    sink.write({"ppn": "PPN2", "title": "Title 2"})
+    sink.close()
+    assert sorted(sink.read()["ppn"]) == ["PPN0", "PPN1", "PPN2"]